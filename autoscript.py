@@ -1,16 +1,26 @@
 # -*- coding: utf-8 -*-
+import re
 import time
+import atexit
+import heapq
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from typing import Optional, Tuple, Dict, Any, List
 
 import pytz
 import gspread
+import requests
 from google.oauth2.service_account import Credentials
 # gspread.utils 모듈을 사용하여 A1 표기법 변환에 활용
 from gspread import utils
 from mastodon import Mastodon, MastodonAPIError, MastodonNetworkError
 
+# 시트 호출 한도/재시도/회로 차단은 봇과 같은 구현을 쓴다
+from dice_marchend.quota import shared_quota, status_of, SheetsUnavailable
+from dice_marchend.ratelimit import PostBudget
+from dice_marchend.writebuffer import WriteBuffer
+
 # =========================
 # 하드코딩 설정
 # =========================
@@ -57,16 +67,40 @@ CTRL_LABELS_ORDER = [
     CTRL_ACTIVE, CTRL_CHECK, CTRL_START_AT, CTRL_INTERVAL, CTRL_VIS,
     CTRL_SCRIPT, CTRL_MAXCNT, CTRL_LOCK, CTRL_STATUS, CTRL_LASTRUN
 ]
+CTRL_MODE = "모드"  # 선택 라벨. '예약'이면 Mastodon 예약 게시로 미리 넘긴다 (없거나 다른 값이면 즉시 게시)
+MODE_SCHEDULE = "예약"
+
+# 예약 모드
+SCHEDULE_LEAD_SEC = 330       # Mastodon은 5분 이후만 예약 가능. 여유 30초
+SCHEDULE_BATCH_MAX = 25       # 한 번에 넘기는 최대 건수 (Mastodon: 같은 날 예약 25건, 전체 300건 제한)
+RECONCILE_SEC = 300           # 예약분 상태 맞추기 / 남은 분량 이어서 예약하는 주기(초)
+SCHEDULED_RE = re.compile(r"^예약 (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) #(\S+)$")  # 출력시각 칸 표식
+
+# 폴링 주기. 제어 탭은 문서 수정시각(Drive)이 바뀌었을 때만 전체를 다시 읽고,
+# 그 사이에는 캐시로 다음 시작시각까지 잔다
+CTRL_CHECK_SEC = 5        # 수정시각 확인 주기 (시트 읽기 아님). 작업이 돌거나 방금 바뀌었을 때
+CTRL_IDLE_MAX_SEC = 60    # 아무 일도 없으면 확인 주기를 두 배씩 늘려 여기까지 (체크 반응도 이만큼 늦어질 수 있음)
+CTRL_RESYNC_SEC = 300     # 수정이 안 보여도 이 주기마다 한 번은 전체를 다시 읽음
+ACTIVE_RERUN_SEC = 60     # 활성화가 켜진 채 끝난 열이 새 행을 보러 다시 도는 최소 간격 (체크는 바로)
+
+# 여러 작업 열이 같이 쓰는 발송 예산
+POST_MIN_GAP_SEC = 1.0     # 작업 열 전체 기준 최소 발송 간격(초)
+POST_RATE_RESERVE = 20     # Mastodon 남은 요청이 이 이하면 리셋까지 고르게 감속
 
-# 폴링 주기
-POLL_SEC_WHEN_IDLE = 5
-POLL_SEC_WHEN_BUSY = 6
+# 상태/최근실행/출력여부/출력시각 쓰기는 모든 작업 열 것을 모아 시트별 batch_update 한 번으로
+STATUS_FLUSH_SEC = 2.0
+STATUS_FLUSH_MAX_CELLS = 100
 
 
 # =========================
 # 시트 클라이언트
 # =========================
 
+def _col_letter(c: int) -> str:
+    """1-based 열 번호 -> 'A', 'B', ... 'AA'"""
+    return utils.rowcol_to_a1(1, c).rstrip("0123456789")
+
+
 class Sheets:
     def __init__(self):
         scopes = [
@@ -75,12 +109,13 @@ class Sheets:
         ]
         creds = Credentials.from_service_account_file(GOOGLE_SA_JSON, scopes=scopes)
         self.gc = gspread.authorize(creds)
+        self.quota = shared_quota()
         self.ss = self.gc.open_by_key(SHEET_KEY) if SHEET_KEY else self.gc.open(SHEET_NAME)
         self.ws_list = self.ss.worksheet(WS_LIST)
         self.ws_ctrl = self.ss.worksheet(WS_CTRL)
 
         # 출력목록: 1행 헤더 맵 (API 1회)
-        header = [h.strip() for h in self.ws_list.row_values(1)]
+        header = [h.strip() for h in self._call(self.ws_list.row_values, 1)]
         self.hmap_list: Dict[str, int] = {h: i + 1 for i, h in enumerate(header)}  # 1-based
         required = [HDR_ORDER, HDR_TEXT, HDR_POSTED, HDR_POSTED_AT]
         miss = [h for h in required if h not in self.hmap_list]
@@ -88,7 +123,7 @@ class Sheets:
             raise RuntimeError(f"'{WS_LIST}' 헤더 누락: {miss} (필수: {required})")
 
         # 출력제어: A열 라벨 → 행번호 매핑 (API 1회)
-        labels_col = [v.strip() for v in self.ws_ctrl.col_values(1)]
+        labels_col = [v.strip() for v in self._call(self.ws_ctrl.col_values, 1)]
         self.ctrl_rmap: Dict[str, int] = {}
         for label in CTRL_LABELS_ORDER:
             try:
@@ -96,20 +131,68 @@ class Sheets:
             except ValueError:
                 raise RuntimeError(f"'{WS_CTRL}' A열에 라벨 '{label}' 이(가) 없습니다.")
             self.ctrl_rmap[label] = r
+        if CTRL_MODE in labels_col:
+            self.ctrl_rmap[CTRL_MODE] = labels_col.index(CTRL_MODE) + 1
 
         # 💡 캐시 초기화 및 초기 로딩
         self._cache_ctrl: List[List[str]] = []
         self._cache_list: List[List[str]] = []
+        self._list_ver = 0  # 출력목록 전체 읽기 횟수 (힙 재구성 판단용)
+        self._posted_flags: List[bool] = []  # 2행부터, 문장이 있는 마지막 행까지의 출력여부
+        self._queues: Dict[Optional[str], Tuple[int, list]] = {}  # 스크립트ID -> (만든 버전, 미출력 힙)
+        self._list_lock = threading.RLock()  # 작업 열 스레드들이 출력목록 캐시/힙을 같이 씀
+        self._claimed: Dict[int, Tuple[int, int, str]] = {}  # 게시 중인 행 -> 힙 항목 (다른 열이 못 고르게)
+        self._ctrl_mtime: Optional[str] = None  # 마지막 전체 읽기 직전의 문서 수정시각
+        self._ctrl_read_at = 0.0                # 마지막 전체 읽기 (monotonic)
+        self._watch_mtime = True                # Drive 조회가 막혀 있으면 False (매번 전체 읽기)
+        # 잠금 칸을 뺀 쓰기는 write-behind. 읽을 때는 아직 안 나간 값을 덧씌워 본다
+        self._writes = WriteBuffer(self._call, interval=STATUS_FLUSH_SEC, max_cells=STATUS_FLUSH_MAX_CELLS,
+                                   value_input_option="RAW", on_drop=self._on_write_dropped)
+        atexit.register(self._writes.close)
         self.refresh_ctrl_cache()  # 제어 탭 초기 로드 (API 1회)
 
     # -----------------------------------------------------
     # 💡 최적화: 캐시/배치 읽기/쓰기 메소드
     # -----------------------------------------------------
 
+    def _call(self, func, *args, **kwargs):
+        """gspread 호출은 모두 여기로 (분당 한도 대기, 429/5xx 재시도, 회로 차단)"""
+        return self.quota.call(func, *args, **kwargs)
+
     def refresh_ctrl_cache(self):
         """출력제어(WS_CTRL) 시트 전체를 읽어서 캐시에 저장합니다. (API 1회)"""
         # 429 오류 방지를 위해, 루프 내 개별 셀 읽기 대신 한 번에 가져옴
-        self._cache_ctrl = self.ws_ctrl.get_all_values()
+        since = time.time()
+        rows = self._call(self.ws_ctrl.get_all_values)
+        self._writes.apply_to(WS_CTRL, rows, since)
+        self._cache_ctrl = rows
+        self._ctrl_read_at = time.monotonic()
+
+    def refresh_ctrl_if_changed(self) -> bool:
+        """
+        문서 수정시각(Drive modifiedTime)이 마지막 전체 읽기 때와 다를 때만 제어 탭을 다시 읽는다.
+        평소엔 Drive 조회 1회, 시트 읽기 0회. 우리 쓰기도 수정시각을 바꾸므로 flush 뒤엔 한 번 다시 읽게 된다.
+        수정시각은 읽기 전에 받아 두므로, 읽는 도중 바뀐 것도 다음 확인에서 잡힌다.
+        Drive 조회는 Sheets 한도와 상관없으므로 self._call(시트 호출 한도)을 거치지 않는다.
+        """
+        stale = time.monotonic() - self._ctrl_read_at >= CTRL_RESYNC_SEC
+        mtime = self._ctrl_mtime
+        if self._watch_mtime:
+            try:
+                mtime = self.ss.get_lastUpdateTime()
+            except gspread.exceptions.APIError as e:
+                if status_of(e) in (403, 404):
+                    self._watch_mtime = False  # Drive API가 꺼져 있거나 권한 없음
+                    logging.warning(f"문서 수정시각을 볼 수 없어 매번 제어 탭 전체를 읽습니다: {e}")
+                else:
+                    logging.warning(f"문서 수정시각 조회 실패, 이번엔 캐시로 진행: {e}")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                logging.warning(f"문서 수정시각 조회 실패, 이번엔 캐시로 진행: {e}")
+        if self._watch_mtime and not stale and mtime == self._ctrl_mtime:
+            return False
+        self.refresh_ctrl_cache()
+        self._ctrl_mtime = mtime
+        return True
 
     def _get_cell_value_from_cache(self, cache: List[List[str]], r: int, c: int) -> str:
         """API 호출 대신 메모리에 저장된 캐시에서 셀 값을 가져옵니다. (API 0회)"""
@@ -123,17 +206,49 @@ class Sheets:
     # ---------- 출력목록 (읽기/쓰기 최적화) ----------
     def _refresh_list_cache(self):
         """출력목록(WS_LIST) 시트 전체를 읽어서 캐시에 저장합니다. (API 1회)"""
-        self._cache_list = self.ws_list.get_all_values()
+        since = time.time()
+        rows = self._call(self.ws_list.get_all_values)
+        self._writes.apply_to(WS_LIST, rows, since)  # 아직 안 나간 출력 표시가 되돌아 보이지 않게
+        self._cache_list = rows
+        self._list_ver += 1
 
-    def get_next_unposted(self, script_id: Optional[str]) -> Optional[Tuple[int, str]]:
-        # 💡 매번 시도 시, 최신 상태를 반영하기 위해 캐시 갱신 (API 1회)
-        self._refresh_list_cache()
-        values = self._cache_list
-
-        if len(values) <= 1:
-            return None
-        rows = values[1:]
+        idx_text = self.hmap_list[HDR_TEXT] - 1
+        idx_post = self.hmap_list[HDR_POSTED] - 1
+        rows = self._cache_list[1:]
+        # 문장이 있는 마지막 행까지의 출력여부 (변경 감지 기준)
+        n = 0
+        for i, row in enumerate(rows, start=1):
+            if len(row) > idx_text and (row[idx_text] or "").strip():
+                n = i
+        self._posted_flags = [
+            len(row) > idx_post and (row[idx_post] or "").strip().upper() in TRUTHY
+            for row in rows[:n]
+        ]
 
+    def _list_changed(self) -> bool:
+        """
+        출력여부/문장 두 열만 읽어(API 1회, 좁은 범위) 마지막 전체 읽기 이후
+        행이 늘거나 줄었는지, 다른 곳에서 출력여부가 바뀌었는지 본다.
+        """
+        c_post = self.hmap_list[HDR_POSTED]
+        post_col = _col_letter(c_post)
+        text_col = _col_letter(self.hmap_list[HDR_TEXT])
+        since = time.time()
+        posted, texts = self._call(self.ws_list.batch_get, [f"{post_col}2:{post_col}", f"{text_col}2:{text_col}"])
+        n = 0
+        for i, r in enumerate(texts, start=1):
+            if r and (r[0] or "").strip():
+                n = i
+        flags = [bool(r) and (r[0] or "").strip().upper() in TRUTHY for r in posted[:n]]
+        flags += [False] * (n - len(flags))
+        for (r, c), v in self._writes.overlay(WS_LIST, since).items():
+            if c == c_post and 2 <= r < n + 2:
+                flags[r - 2] = str(v).strip().upper() in TRUTHY
+        return flags != self._posted_flags
+
+    def _build_queue(self, script_id: Optional[str]) -> List[Tuple[int, int, str]]:
+        """캐시된 출력목록으로 이 스크립트의 미출력 행 힙 (순번, 행, 문장)을 만든다. (API 0회)"""
+        values = self._cache_list
         idx_order = self.hmap_list[HDR_ORDER] - 1
         idx_text = self.hmap_list[HDR_TEXT] - 1
         idx_post = self.hmap_list[HDR_POSTED] - 1
@@ -142,8 +257,7 @@ class Sheets:
             idx_sid -= 1
 
         cands = []
-        for i, row in enumerate(rows, start=2):
-            # ... (이하 로직은 동일)
+        for i, row in enumerate(values[1:], start=2):
             if len(row) <= max(idx_order, idx_text, idx_post):
                 continue
             posted = (row[idx_post] or "").strip().upper() in TRUTHY
@@ -161,28 +275,144 @@ class Sheets:
             text = (row[idx_text] or "").strip()
             if text:
                 cands.append((order, i, text))
+        heapq.heapify(cands)
+        return cands
+
+    def _is_posted(self, row_index: int) -> bool:
+        """출력했거나, 다른 작업이 게시하려고 잡아 둔 행"""
+        if row_index in self._claimed:
+            return True
+        i = row_index - 2
+        return 0 <= i < len(self._posted_flags) and self._posted_flags[i]
 
-        if not cands:
-            return None
-        cands.sort(key=lambda x: (x[0], x[1]))
-        _, row_index, text = cands[0]
-        return row_index, text
+    def get_next_unposted(self, script_id: Optional[str]) -> Optional[Tuple[int, str]]:
+        """
+        스크립트ID별 미출력 행 힙의 맨 앞. 힙은 처음 한 번 전체를 읽어 만들고,
+        이후에는 좁은 변경 확인(_list_changed)에서 달라진 게 보일 때만 전체를 다시 읽는다.
+        """
+        with self._list_lock:
+            if self._list_ver == 0 or self._list_changed():
+                self._refresh_list_cache()  # (API 1회)
+
+            ver, q = self._queues.get(script_id, (-1, None))
+            if ver != self._list_ver:
+                q = self._build_queue(script_id)
+                self._queues[script_id] = (self._list_ver, q)
+
+            # 다른 작업이 이미 출력한 행은 건너뛴다
+            while q and self._is_posted(q[0][1]):
+                heapq.heappop(q)
+            if not q:
+                return None
+            _, row_index, text = q[0]
+            return row_index, text
+
+    def claim_unposted(self, script_id: Optional[str], n: int = 1) -> List[Tuple[int, str]]:
+        """
+        순서상 앞의 미출력 행 n개를 힙에서 꺼내 이 작업 몫으로 잡아 둔다. 같은 스크립트ID로 도는 다른 열은
+        잡힌 행을 고르지 않는다. 게시 뒤 mark_posted/mark_scheduled로 확정하고, 못 했으면 release_claims.
+        """
+        with self._list_lock:
+            if not self.get_next_unposted(script_id):
+                return []
+            _, q = self._queues[script_id]
+            out = []
+            while q and len(out) < n:
+                ent = heapq.heappop(q)
+                if self._is_posted(ent[1]):
+                    continue
+                self._claimed[ent[1]] = ent
+                out.append((ent[1], ent[2]))
+            return out
+
+    def release_claims(self, rows: List[int]):
+        """게시하지 못한 행을 다시 고를 수 있게 돌려놓는다. 힙은 캐시로 다시 만든다 (API 0회)"""
+        with self._list_lock:
+            released = [r for r in rows if self._claimed.pop(r, None) is not None]
+            if released:
+                self._queues.clear()  # 잡혀 있는 동안 다른 힙에서도 빠졌을 수 있음
+
+    def _put_list(self, row: int, header: str, value):
+        self._writes.put(WS_LIST, self.ws_list, row, self.hmap_list[header], value)
+
+    def _put_ctrl(self, c: int, label: str, value):
+        self._writes.put(WS_CTRL, self.ws_ctrl, self.ctrl_rmap[label], c, value)
+
+    def _on_write_dropped(self, key: str):
+        """버려진 쓰기가 있으면 다음 조회 때 시트를 새로 읽어 로컬 출력여부를 시트에 맞춘다"""
+        if key == WS_LIST:
+            self._posted_flags = []
+        else:
+            self._ctrl_mtime = None
+
+    def flush_writes(self, keys=None):
+        """모아 둔 쓰기를 바로 내보낸다 (keys를 주면 그 탭 것만)"""
+        self._writes.flush(keys)
+
+    def mark_scheduled(self, items: List[Tuple[int, datetime, str]]):
+        """
+        예약으로 넘긴 행들을 표시 (쓰기 버퍼). 출력여부=TRUE로 두어 다른 작업/재시작 후에도
+        다시 고르지 않게 하고, 출력시각 칸에 '예약 <시각> #<예약ID>'를 남긴다.
+        """
+        if not items:
+            return
+        for row, when, sched_id in items:
+            self._put_list(row, HDR_POSTED, True)
+            self._put_list(row, HDR_POSTED_AT, f"예약 {when.strftime('%Y-%m-%d %H:%M:%S')} #{sched_id}")
+        with self._list_lock:
+            for row, _, _ in items:
+                self._claimed.pop(row, None)
+                i = row - 2
+                if 0 <= i < len(self._posted_flags):
+                    self._posted_flags[i] = True
+            for _, q in self._queues.values():
+                while q and self._is_posted(q[0][1]):
+                    heapq.heappop(q)
+
+    def scheduled_rows(self) -> List[Tuple[int, datetime, str]]:
+        """출력목록을 새로 읽어 예약 표식이 남은 행들 (행, 예약시각, 예약ID) (API 1회)"""
+        with self._list_lock:
+            self._refresh_list_cache()
+            idx_at = self.hmap_list[HDR_POSTED_AT] - 1
+            out = []
+            for i, row in enumerate(self._cache_list[1:], start=2):
+                m = SCHEDULED_RE.match((row[idx_at] if len(row) > idx_at else "").strip())
+                if m:
+                    out.append((i, KST.localize(datetime.strptime(m.group(1), "%Y-%m-%d %H:%M:%S")), m.group(2)))
+            return out
+
+    def settle_scheduled(self, posted: List[Tuple[int, datetime]], cancelled: List[int]):
+        """
+        예약분 정리 (쓰기 버퍼). 게시된 행은 출력시각을 실제 시각으로, 게시 전에 예약이 사라진 행은
+        미출력으로 되돌려 다시 고를 수 있게 한다.
+        """
+        for row, when in posted:
+            self._put_list(row, HDR_POSTED_AT, when.strftime("%Y-%m-%d %H:%M:%S %Z"))
+        for row in cancelled:
+            self._put_list(row, HDR_POSTED, False)
+            self._put_list(row, HDR_POSTED_AT, "")
+        if cancelled:
+            with self._list_lock:
+                self._posted_flags = []  # 되돌린 행을 힙에 다시 넣도록 다음 조회 때 전체를 다시 읽는다
 
     def mark_posted(self, row_index: int) -> str:
-        """출력여부/출력시각을 batch_update로 갱신 (API 1회)"""
+        """출력여부/출력시각 갱신 (쓰기 버퍼. 다른 열의 쓰기와 함께 batch_update로 나감)"""
         ts = datetime.now(KST).strftime("%Y-%m-%d %H:%M:%S %Z")
 
-        requests = [
-            # 체크박스 업데이트는 부울 값 True만 전달하면 됩니다.
-            {'range': utils.rowcol_to_a1(row_index, self.hmap_list[HDR_POSTED]),
-             'values': [[True]]},  # <--- 주의! 'TRUE' (문자열) 대신 True (부울) 사용
-
-            # 출력 시각은 문자열로 전달합니다.
-            {'range': utils.rowcol_to_a1(row_index, self.hmap_list[HDR_POSTED_AT]),
-             'values': [[ts]]},
-        ]
-        # 💡 API 2회 호출 대신, 1회 배치 업데이트 호출
-        self.ws_list.batch_update(requests)
+        # 체크박스 업데이트는 부울 값 True만 전달하면 됩니다. ('TRUE' 문자열 아님)
+        self._put_list(row_index, HDR_POSTED, True)
+        # 출력 시각은 문자열로 전달합니다.
+        self._put_list(row_index, HDR_POSTED_AT, ts)
+
+        # 우리가 쓴 출력여부는 변경 감지에 걸리지 않도록 로컬 상태에도 반영하고, 힙에서 꺼낸다
+        with self._list_lock:
+            self._claimed.pop(row_index, None)
+            i = row_index - 2
+            if 0 <= i < len(self._posted_flags):
+                self._posted_flags[i] = True
+            for _, q in self._queues.values():
+                while q and self._is_posted(q[0][1]):
+                    heapq.heappop(q)
         return ts
 
     # ---------- 출력제어(읽기/쓰기 최적화) ----------
@@ -220,7 +450,9 @@ class Sheets:
         """캐시된 데이터로 작업 제어 정보 읽기. (API 0회)"""
 
         def gv(label: str) -> str:
-            r = self.ctrl_rmap[label]
+            r = self.ctrl_rmap.get(label)
+            if r is None:
+                return ""  # 선택 라벨(모드)이 없는 시트
             # 💡 API 호출 대신 캐시에서 가져옴
             return self._get_cell_value_from_cache(self._cache_ctrl, r, c)
 
@@ -243,21 +475,22 @@ class Sheets:
             "script_id": script if script else None,
             "max_count": int(maxcnt_s) if maxcnt_s.isdigit() else None,
             "lock": lock,
+            "mode": gv(CTRL_MODE),
         }
 
+    def write_ctrl_cells(self, c: int, values: Dict[str, Any]):
+        """제어 열의 여러 라벨 칸을 쓴다 (쓰기 버퍼)"""
+        for label, v in values.items():
+            self._put_ctrl(c, label, v)
+
     def write_ctrl_status(self, c: int, status: str):
-        """상태와 최근실행을 batch_update로 갱신 (API 1회)"""
+        """상태와 최근실행 갱신 (쓰기 버퍼. 같은 칸에 연달아 쓰면 마지막 값만 나간다)"""
         ts = datetime.now(KST).strftime("%Y-%m-%d %H:%M:%S %Z")
-
-        requests = [
-            {'range': utils.rowcol_to_a1(self.ctrl_rmap[CTRL_STATUS], c), 'values': [[status]]},
-            {'range': utils.rowcol_to_a1(self.ctrl_rmap[CTRL_LASTRUN], c), 'values': [[ts]]},
-        ]
-        # 💡 API 2회 호출 대신, 1회 배치 업데이트 호출
-        self.ws_ctrl.batch_update(requests)
+        self._put_ctrl(c, CTRL_STATUS, status)
+        self._put_ctrl(c, CTRL_LASTRUN, ts)
 
     def acquire_lock(self, c: int) -> bool:
-        """잠금 획득 시 캐시를 갱신하고 상태를 확인 (API 1회)"""
+        """잠금 획득 시 캐시를 갱신하고 상태를 확인 (API 1회). 잠금 칸은 버퍼를 거치지 않고 바로 쓴다"""
         # 잠금 획득 전 최신 상태 반영 (API 1회)
         self.refresh_ctrl_cache()
         cur = self._get_cell_value(self.ctrl_rmap[CTRL_LOCK], c)
@@ -266,16 +499,16 @@ class Sheets:
             return False
 
         # 획득 시만 쓰기 (API 1회)
-        self.ws_ctrl.update_cell(self.ctrl_rmap[CTRL_LOCK], c, "RUNNING")
+        self._call(self.ws_ctrl.update_cell, self.ctrl_rmap[CTRL_LOCK], c, "RUNNING")
         return True
 
     def release_lock(self, c: int):
         """잠금 해제 (API 1회)"""
-        self.ws_ctrl.update_cell(self.ctrl_rmap[CTRL_LOCK], c, "")
+        self._call(self.ws_ctrl.update_cell, self.ctrl_rmap[CTRL_LOCK], c, "")
 
     def clear_check(self, c: int):
-        """체크 해제 (API 1회)"""
-        self.ws_ctrl.update_cell(self.ctrl_rmap[CTRL_CHECK], c, "FALSE")
+        """체크 해제 (쓰기 버퍼)"""
+        self._put_ctrl(c, CTRL_CHECK, False)
 
 
 # =========================
@@ -294,26 +527,51 @@ def create_masto() -> Mastodon:
     return api
 
 
+class Poster:
+    """여러 작업 열이 같이 쓰는 발송 창구. 한 번에 한 건씩, 헤더 기반 예산과 최소 간격을 지킨다."""
+
+    def __init__(self, api: Mastodon):
+        self.api = api
+        self.budget = PostBudget(api, reserve=POST_RATE_RESERVE, min_gap=POST_MIN_GAP_SEC)
+        self._lock = threading.Lock()
+
+    def post(self, text: str, **kwargs):
+        with self._lock:
+            while True:
+                wait = self.budget.delay()
+                if wait <= 0:
+                    break
+                time.sleep(wait)
+            try:
+                return self.api.status_post(text, **kwargs)
+            finally:
+                self.budget.record()
+
+
 # =========================
 # 실행 로직
 # =========================
 
+def _start_at(ctrl: Dict[str, Any]) -> Optional[datetime]:
+    s = ctrl["start_at"]
+    if not s:
+        return None
+    try:
+        return KST.localize(datetime.strptime(s, "%Y-%m-%d %H:%M:%S"))
+    except ValueError:
+        return None
+
+
 def should_start_now(ctrl: Dict[str, Any]) -> bool:
     if ctrl["check"]:
         return True
     if ctrl["active"]:
-        s = ctrl["start_at"]
-        if not s:
-            return False
-        try:
-            dt = KST.localize(datetime.strptime(s, "%Y-%m-%d %H:%M:%S"))
-            return datetime.now(KST) >= dt
-        except Exception:
-            return False
+        dt = _start_at(ctrl)
+        return dt is not None and datetime.now(KST) >= dt
     return False
 
 
-def run_job_for_col(api: Mastodon, sheets: Sheets, c: int, ctrl: Dict[str, Any]):
+def run_job_for_col(poster: Poster, sheets: Sheets, c: int, ctrl: Dict[str, Any]):
     # 체크 트리거는 1회성이므로 해제
     if ctrl["check"]:
         sheets.clear_check(c)
@@ -339,22 +597,29 @@ def run_job_for_col(api: Mastodon, sheets: Sheets, c: int, ctrl: Dict[str, Any])
             if not is_first_tweet:
                 time.sleep(delay)
             is_first_tweet = False
-            # 툿 찾기 (API 1회)
-            nxt = sheets.get_next_unposted(sid)
+            # 툿 찾기 (API 1회). 같은 스크립트를 도는 다른 열이 같은 행을 고르지 않게 잡아 둔다
+            nxt = sheets.claim_unposted(sid)
 
             if not nxt:
                 sheets.write_ctrl_status(c, "미출력 없음 → 종료")
                 break
-            row_index, text = nxt
+            row_index, text = nxt[0]
 
             logging.info(f"[col {c}] 대본행 {row_index} 게시: {text!r}")
             # Mastodon 게시 (API 1회)
-            status = api.status_post(text, visibility=vis)
+            try:
+                status = poster.post(text, visibility=vis)
+            except Exception:
+                sheets.release_claims([row_index])
+                raise
             logging.info(f"[col {c}] 게시 완료: status_id={status['id']}")
 
-            # 출력 목록에 반영 (API 1회)
+            # 출력 목록에 반영. 이미 나간 툿이므로 출력여부는 버퍼에 두지 않고 바로 내보낸다
+            # (그 사이 죽으면 재시작 후 같은 행을 또 게시한다)
+            # 제어 탭의 상태/마지막 실행 표시는 그대로 버퍼에 두고 다음 주기 flush로 모아 보낸다
             ts = sheets.mark_posted(row_index)
-            # 제어 탭 상태 갱신 (API 1회)
+            sheets.flush_writes([WS_LIST])
+            # 제어 탭 상태 갱신 (쓰기 버퍼)
             sheets.write_ctrl_status(c, f"게시 완료 @ {ts} (대본행 {row_index})")
 
             count += 1
@@ -367,6 +632,137 @@ def run_job_for_col(api: Mastodon, sheets: Sheets, c: int, ctrl: Dict[str, Any])
         sheets.write_ctrl_status(c, "대기 중")
 
 
+def _schedule_start(ctrl: Dict[str, Any]) -> datetime:
+    """예약 타임라인의 첫 시각: 시작시각과 (지금 + 최소 선행시간) 중 늦은 쪽"""
+    earliest = datetime.now(KST) + timedelta(seconds=SCHEDULE_LEAD_SEC)
+    dt = None if ctrl["check"] else _start_at(ctrl)
+    return max(earliest, dt) if dt else earliest
+
+
+def run_schedule_job(poster: Poster, sheets: Sheets, c: int, ctrl: Dict[str, Any]):
+    """
+    예약 모드: 시작시각 + 간격초 x i 타임라인으로 미출력 행을 Mastodon 예약 게시로 한꺼번에 넘긴다.
+    넘긴 만큼 제어 열의 시작시각/최대개수를 앞으로 당겨 써 두므로(타임라인 진행 상태가 시트에 남음),
+    Mastodon 예약 한도에 걸려 일부만 넘어가도 다음 정리 주기에 이어서 넘기고, 재시작해도 이어진다.
+    """
+    if not sheets.acquire_lock(c):
+        sheets.write_ctrl_status(c, "잠금 실패(동시 실행)")
+        return
+    try:
+        interval = max(0, int(ctrl["interval"]))
+        remaining = ctrl["max_count"]
+        n = SCHEDULE_BATCH_MAX if remaining is None else min(SCHEDULE_BATCH_MAX, remaining)
+        rows = sheets.claim_unposted(ctrl["script_id"], n)
+        t0 = _schedule_start(ctrl)
+
+        done: List[Tuple[int, datetime, str]] = []
+        err = None
+        for i, (row, text) in enumerate(rows):
+            when = t0 + timedelta(seconds=interval * i)
+            try:
+                sched = poster.post(text, visibility=ctrl["visibility"], scheduled_at=when)
+            except Exception as e:
+                err = e  # 예약 한도 등. 이미 넘긴 데까지는 꼭 표시하고, 나머지는 다음 주기에 이어서
+                break
+            done.append((row, when, str(sched["id"])))
+        sheets.mark_scheduled(done)
+        sheets.release_claims([row for row, _ in rows[len(done):]])
+
+        left = None if remaining is None else remaining - len(done)
+        more = bool(rows) and (left is None or left > 0) and (len(done) == len(rows) == n or err is not None)
+        nxt = t0 + timedelta(seconds=interval * len(done))
+        cells: Dict[str, Any] = {CTRL_CHECK: False, CTRL_ACTIVE: more}
+        if done:
+            cells[CTRL_START_AT] = nxt.strftime("%Y-%m-%d %H:%M:%S")
+        if left is not None:
+            cells[CTRL_MAXCNT] = str(left)
+        sheets.write_ctrl_cells(c, cells)
+        # 이미 Mastodon에 넘어간 예약이라 표시와 타임라인 진행은 바로 내보낸다.
+        # 버퍼에만 있다가 죽으면 재시작 때 같은 행을 다시 예약해 중복된다
+        sheets.flush_writes()
+
+        if err is not None:
+            status = f"예약 {len(done)}건, 나머지는 {RECONCILE_SEC}초 뒤 재시도 ({err})"
+        elif more:
+            status = f"예약 {len(done)}건 (다음 {nxt.strftime('%H:%M:%S')}부터 이어서)"
+        else:
+            status = f"예약 {len(done)}건 → 완료" if done else "미출력 없음 → 종료"
+        sheets.write_ctrl_status(c, status)
+        logging.info(f"[col {c}] {status}")
+    finally:
+        sheets.release_lock(c)
+
+
+def reconcile_scheduled(api: Mastodon, sheets: Sheets) -> Tuple[int, int, int]:
+    """
+    출력목록의 예약 표식과 Mastodon의 예약 목록을 맞춘다. 예약 목록에서 빠졌고 시각이 지났으면 게시된 것,
+    시각 전에 빠졌으면(누가 취소) 미출력으로 되돌린다. 반환: (게시 확인, 되돌림, 아직 대기) 건수
+    """
+    marked = sheets.scheduled_rows()
+    if not marked:
+        return 0, 0, 0
+    pending = {str(s["id"]) for s in api.fetch_remaining(api.scheduled_statuses(limit=40))}
+    now = datetime.now(KST)
+    posted, cancelled = [], []
+    for row, when, sched_id in marked:
+        if sched_id in pending:
+            continue
+        if when <= now:
+            posted.append((row, when))
+        else:
+            cancelled.append(row)
+    sheets.settle_scheduled(posted, cancelled)
+    return len(posted), len(cancelled), len(marked) - len(posted) - len(cancelled)
+
+
+class JobScheduler:
+    """작업 열마다 스레드 하나로 돌린다. 한 열이 간격초만큼 쉬는 동안에도 다른 열과 메인 루프는 계속 돈다."""
+
+    def __init__(self, poster: Poster, sheets: Sheets):
+        self.poster = poster
+        self.sheets = sheets
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, threading.Thread] = {}
+        self._started: Dict[int, float] = {}  # 열 -> 마지막 시작 (monotonic)
+
+    def running(self, c: int) -> bool:
+        with self._lock:
+            return c in self._jobs
+
+    def ready_in(self, c: int, cooldown: float) -> float:
+        """cooldown 기준으로 열 c를 다시 시작할 수 있을 때까지 남은 초"""
+        with self._lock:
+            return self._started.get(c, -1e9) + cooldown - time.monotonic()
+
+    def start(self, c: int, ctrl: Dict[str, Any], cooldown: float = 0.0) -> bool:
+        """열 c의 작업을 시작. cooldown초 안에 이미 시작한 적이 있으면 건너뛴다."""
+        now = time.monotonic()
+        with self._lock:
+            if c in self._jobs or now - self._started.get(c, -1e9) < cooldown:
+                return False
+            t = threading.Thread(target=self._run, args=(c, ctrl), daemon=True, name=f"job-col{c}")
+            self._jobs[c] = t
+            self._started[c] = now
+        t.start()
+        return True
+
+    def _run(self, c: int, ctrl: Dict[str, Any]):
+        try:
+            if ctrl.get("mode") == MODE_SCHEDULE:
+                run_schedule_job(self.poster, self.sheets, c, ctrl)
+            else:
+                run_job_for_col(self.poster, self.sheets, c, ctrl)
+        except Exception as e:
+            logging.exception(f"[col {c}] 작업 오류: {e}")
+            try:
+                self.sheets.write_ctrl_status(c, f"오류: {e}")
+            except Exception:
+                pass
+        finally:
+            with self._lock:
+                self._jobs.pop(c, None)
+
+
 # =========================
 # 메인 루프
 # =========================
@@ -380,32 +776,71 @@ def main():
 
     sheets = Sheets()
     api = create_masto()
+    scheduler = JobScheduler(Poster(api), sheets)
 
     logging.info("세로 레이아웃 컨트롤 모드: A열 라벨, B열부터 작업 열을 스캔합니다.")
+    last_reconcile = 0.0
+    sched_waiting = True  # 시작 시에는 지난 실행에서 남은 예약분이 있을 수 있으니 한 번은 정리
+    check_sec = CTRL_CHECK_SEC
     while True:
         try:
-            # 💡 메인 루프 시작 시 제어 시트 최신 데이터를 한 번만 읽어옴 (API 1회)
-            sheets.refresh_ctrl_cache()
+            # 💡 제어 탭은 수정됐을 때만 전체를 다시 읽음 (평소엔 Drive 수정시각 조회 1회, 시트 읽기 0회)
+            changed = sheets.refresh_ctrl_if_changed()
 
-            any_running = False
+            busy = False  # 작업이 돌고 있거나 막 시작함
+            now = datetime.now(KST)
+            wake = []  # 다음에 깨어날 때까지 남은 초 후보 (시작시각, 쿨다운, 예약 정리)
             # 💡 이후 iter_job_cols, read_ctrl_col은 캐시에서 데이터 읽기 (API 0회)
             cols = sheets.iter_job_cols()
             for c in cols:
+                if scheduler.running(c):
+                    busy = True
+                    continue
                 ctrl = sheets.read_ctrl_col(c)
                 if ctrl["lock"] and ctrl["lock"].strip():
-                    any_running = True
                     continue
-                if should_start_now(ctrl):
-                    any_running = True
-                    run_job_for_col(api, sheets, c, ctrl)
-
-            time.sleep(POLL_SEC_WHEN_BUSY if any_running else POLL_SEC_WHEN_IDLE)
+                if ctrl["mode"] == MODE_SCHEDULE:
+                    # 예약 모드는 시작시각 전에 미리 넘긴다. 한도에 걸려 남은 분량은 정리 주기마다 이어서
+                    if ctrl["check"] or ctrl["active"]:
+                        if scheduler.start(c, ctrl, cooldown=RECONCILE_SEC):
+                            sched_waiting = True  # 새로 넘긴 예약분을 다음 정리 주기에 확인
+                        else:
+                            wake.append(scheduler.ready_in(c, RECONCILE_SEC))
+                elif should_start_now(ctrl):
+                    # 작업은 별도 스레드. 메인 루프는 계속 돈다
+                    cooldown = 0.0 if ctrl["check"] else ACTIVE_RERUN_SEC
+                    if scheduler.start(c, ctrl, cooldown=cooldown):
+                        busy = True
+                    else:
+                        wake.append(scheduler.ready_in(c, cooldown))
+                elif ctrl["active"]:
+                    at = _start_at(ctrl)
+                    if at is not None:
+                        wake.append((at - now).total_seconds())  # 시작시각에 맞춰 깨어남
+
+            # 아직 게시/취소가 확인되지 않은 예약분이 있을 때만 (출력목록 전체 읽기 1회 + Mastodon 조회).
+            # 예약 모드 열이 있다는 것만으로는 돌지 않는다(비활성 열 하나가 매 주기 전체 읽기를 부르지 않게)
+            if sched_waiting:
+                if time.monotonic() - last_reconcile >= RECONCILE_SEC:
+                    last_reconcile = time.monotonic()
+                    posted, cancelled, waiting = reconcile_scheduled(api, sheets)
+                    sched_waiting = waiting > 0
+                    if posted or cancelled:
+                        logging.info(f"예약 정리: 게시 확인 {posted}건, 되돌림 {cancelled}건")
+                wake.append(last_reconcile + RECONCILE_SEC - time.monotonic())
+
+            # 작업이 돌거나 방금 바뀌었으면 자주, 조용하면 수정 확인 간격을 점점 늘린다
+            check_sec = CTRL_CHECK_SEC if (busy or changed) else min(CTRL_IDLE_MAX_SEC, check_sec * 2)
+            time.sleep(max(0.2, min([check_sec] + wake)))
 
         except (MastodonNetworkError, MastodonAPIError) as e:
             logging.warning(f"Mastodon 오류: {e}. 20초 후 재시도.")
             time.sleep(20)
+        except SheetsUnavailable as e:
+            logging.warning(f"{e} 10초 후 재시도.")
+            time.sleep(10)
         except gspread.exceptions.APIError as e:
-            # 💡 429 오류 발생 시 지수 백오프를 사용하는 것이 좋지만, 10초 대기는 유지
+            # 429 백오프/재시도는 quota가 이미 했음. 그래도 실패하면 잠시 쉬었다가 다시
             logging.warning(f"Google Sheets API 오류: {e}. 10초 후 재시도.")
             time.sleep(10)
         except Exception as e:
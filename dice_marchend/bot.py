@@ -1,15 +1,26 @@
 import logging, threading, heapq, time, re
 import queue
+from collections import deque
 from mastodon import Mastodon, StreamListener
 from .config import Config
 from .sheets import Sheets
-from .utils import html_to_text
+from .utils import html_to_text, LRUCache
+from .metrics import metrics
+from .ratelimit import PostBudget
+from .executor import KeyedExecutor, Autoscaler
+from .journal import Journal, OUT_SENT, OUT_FAILED
+from . import intake
 from .commands import dice as cmd_dice, yn as cmd_yn, attendance as cmd_att, explore as cmd_exp, confirm as cmd_cf
 
-PROCESS_WORKERS = 6  # 동시에 처리할 핸들러 스레드 수
-SEND_GAP_GLOBAL = 8.0     # 전역 최소 간격(초) — 모든 응답 사이
-SEND_GAP_PER_ACCT = 8.0   # 계정별 최소 간격(초) — 같은 유저에게 연속 응답 시
+PROCESS_WORKERS = 6  # 시작 시 시트 레인 수 (이후 WORKERS_MIN~MAX 사이에서 자동 조절)
+MAX_PENDING_PER_ACCT = 20  # 한 계정이 쌓아둘 수 있는 미처리 멘션 수 (도배 차단)
+FAST_WORKERS = 2     # 주사위/YN 빠른 레인 스레드 수
+DEFAULT_MAX_CHARS = 500      # 인스턴스 글자수 제한을 못 읽었을 때
 RELOAD_INTERVAL_SEC = 1200.0  # 설정 재로딩 주기(초). 이것도 코드 상수로 고정
+ROOT_CACHE_SIZE = 4096        # 스레드 루트 캐시 크기(상태 수)
+ROOT_CACHE_TTL_SEC = 6 * 3600  # 스레드 루트 캐시 유효시간(초)
+SEEN_CACHE_SIZE = 8192        # 최근 받은 멘션 status id (재연결/백필 중복 전달을 저널까지 가지 않고 거름)
+FEED_INTERVAL_SEC = 0.5       # 저널에 밀려난 멘션을 다시 꺼내 보는 주기(초)
 
 CMD_RE = re.compile(r"\[(.*?)\]")
 DICE_ANY_RE = re.compile(r"\[\s*\d+[dD]\d+(?:\s*[+-]\s*\d+)?\s*\]")
@@ -25,16 +36,31 @@ class DiceListener(StreamListener):
         self.me = me["acct"]
         logging.info(f"Bot login @{self.me}")
 
+        # 멘션/응답 저널. 시작 시에는 '밀려난 상태'로 두어 미완료 항목부터 다시 꺼내게 한다
+        self._journal = Journal(cfg.JOURNAL_PATH)
+        self._in_lock = threading.Lock()
+        self._in_max = cfg.INBOX_MEM_MAX
+        self._in_spilled = True
+        self._in_mark = 0     # 메모리 큐로 넘긴 마지막 inbox id
+        self._parked = {}     # acct -> 그 계정 레인이 꽉 차 저널에 남겨 둔 inbox id들 (도착 순)
+        self._out_max = cfg.OUTBOX_MEM_MAX
+        self._out_spilled = True
+        self._out_mark = 0    # 발송 큐에 올린 마지막 outbox id
+        self._seen = LRUCache(SEEN_CACHE_SIZE)  # 더 오래된 중복은 저널의 status_id UNIQUE가 거른다
+        self._resume_since = None  # 스트림이 붙으면 이 알림 id부터 한 번 더 메운다
+
         # 전송 큐(페이싱)
-        self._pq = []   # (ready_time, seq, in_reply_to_id, text)
+        self._pq = []   # (ready_time, seq, in_reply_to_id, text, enqueued_at, acct, mention_url, outbox_id)
         self._last = {} # acct -> last ready_time
         self._seq = 0
         self._cv = threading.Condition()
 
         # 텀(초): 전역/계정별 둘 다 적용 가능 (환경변수로 조정)
-        self._gap_global = SEND_GAP_GLOBAL
-        self._gap_acct = SEND_GAP_PER_ACCT
-        self._last["_global"] = time.monotonic()
+        # 전역 속도는 Mastodon 헤더 기반 예산이 정하고, 계정별 간격은 별도 정책으로 유지
+        # (전역 간격은 발송 시점에 예산이 적용: 한 유저의 계정별 대기가 다른 유저를 밀지 않도록)
+        self._gap_acct = cfg.SEND_GAP_PER_ACCT
+        self._budget = PostBudget(api, reserve=cfg.SEND_RATE_RESERVE, min_gap=cfg.SEND_GAP_GLOBAL)
+        self._max_chars_cache = None  # 인스턴스 툿 글자수 제한 (처음 보낼 때 조회)
 
         # 발송 스레드
         t = threading.Thread(target=self._sender, daemon=True)
@@ -45,9 +71,31 @@ class DiceListener(StreamListener):
         rt = threading.Thread(target=self._reloader, daemon=True)
         rt.start()
 
-        self._inbox = queue.Queue(maxsize=10000)
-        for _ in range(PROCESS_WORKERS):
-            threading.Thread(target=self._worker, daemon=True).start()
+        # status_id -> (root_id, root_acct, root_text). 같은 스레드 답글은 많아야 1번만 조회
+        self._roots = LRUCache(ROOT_CACHE_SIZE, ROOT_CACHE_TTL_SEC)
+
+        # 닉네임 동기화는 별도 스레드에서 (같은 계정 요청은 대기 중 1건으로 합침)
+        self._nick_q = queue.Queue()
+        self._nick_lock = threading.Lock()
+        self._nick_pending = set()
+        threading.Thread(target=self._nick_worker, daemon=True).start()
+
+        # 시트가 필요 없는 주사위/YN 전용 빠른 레인
+        self._fast = queue.Queue(maxsize=self._in_max)
+        for _ in range(FAST_WORKERS):
+            threading.Thread(target=self._fast_worker, daemon=True).start()
+
+        # 시트 레인: 계정별로 도착 순서를 지키는 직렬 레인들
+        self._lanes = KeyedExecutor(self._process_stateful, lanes=PROCESS_WORKERS, name="lanes",
+                                    max_pending_per_key=MAX_PENDING_PER_ACCT, max_total=10000)
+        self._scaler = None
+        if cfg.AUTOSCALE_SEC > 0:
+            self._scaler = Autoscaler(self._lanes, cfg.WORKERS_MIN, cfg.WORKERS_MAX,
+                                      interval=cfg.AUTOSCALE_SEC).start()
+        threading.Thread(target=self._feeder, daemon=True).start()
+
+        if cfg.METRICS_LOG_SEC > 0:
+            threading.Thread(target=self._reporter, daemon=True).start()
 
     def _reloader(self):
         while True:
@@ -57,41 +105,133 @@ class DiceListener(StreamListener):
                 logging.info("Sheets config cache invalidated (periodic).")
             except Exception as e:
                 logging.exception("config reload failed: %s", e)
+            try:
+                self._journal.prune(self.cfg.JOURNAL_KEEP_SEC)
+            except Exception as e:
+                logging.exception("journal prune failed: %s", e)
 
-    def _enqueue(self, acct: str, reply_to_id: str, text: str):
-        key = acct or "_anon"
-
-        with self._cv:  # 계산~push까지 원자화
-            now = time.monotonic()
-            ready = max(
-                now,
-                self._last.get("_global", 0.0) + self._gap_global,
-                self._last.get(key, 0.0) + self._gap_acct,
-            )
-
-            self._last["_global"] = ready
-            self._last[key] = ready
-            self._seq += 1
-
-            heapq.heappush(self._pq, (ready, self._seq, reply_to_id, text))
+    def _reporter(self):
+        while True:
+            time.sleep(self.cfg.METRICS_LOG_SEC)
+            with self._cv:
+                metrics.set("bot.reply_queue_depth", len(self._pq))
+            lanes = self._lanes.stats()
+            scale = self._scaler.last_decision if self._scaler else "fixed"
+            logging.info("metrics: %s budget=%s lanes=%s size=%d scale=%s journal=%s writes=%s",
+                         metrics.snapshot(), self._budget.state(), lanes, self._lanes.size(), scale,
+                         self._journal.counts(), self.sheets.write_stats())
+
+    def _enqueue(self, acct: str, reply_to_id: str, text: str, url: str = "", inbox_id=None):
+        with self._cv:  # 저널 기록~push까지 원자화 (outbox id 순서 = 발송 큐에 오르는 순서)
+            oid = self._journal.add_reply(acct, reply_to_id, text, url, inbox_id=inbox_id)
+            if self._out_spilled or len(self._pq) >= self._out_max:
+                # 발송 큐가 꽉 찼으면 저널에만 두고, 큐가 비는 대로 순서대로 올린다
+                self._out_spilled = True
+                metrics.inc("journal.spilled_replies")
+                return
+            self._push_locked(acct or "_anon", reply_to_id, text, url, oid)
+            self._out_mark = oid
+
+    def _push_locked(self, key: str, reply_to_id, text: str, url: str, oid: int):
+        now = time.monotonic()
+        ready = max(now, self._last.get(key, 0.0) + self._gap_acct)
+        self._last[key] = ready
+        self._seq += 1
+        heapq.heappush(self._pq, (ready, self._seq, reply_to_id, text, now, key, url or "", oid))
+        self._cv.notify()
+
+    def _refill_outbox_locked(self):
+        """저널에만 남은 미발송 응답을 id 순서로 발송 큐에 올린다. (self._cv 안에서 호출)"""
+        room = self._out_max - len(self._pq)
+        rows = self._journal.pending_replies(self._out_mark, room)
+        for oid, acct, irt, text, url in rows:
+            self._push_locked(acct or "_anon", irt, text, url, oid)
+            self._out_mark = oid
+        if len(rows) < room:
+            self._out_spilled = False
+        if rows:
+            metrics.inc("journal.replayed_replies", len(rows))
+
+    def _max_chars(self) -> int:
+        if self._max_chars_cache is None:
+            try:
+                inst = self.api.instance()
+                self._max_chars_cache = int(inst["configuration"]["statuses"]["max_characters"])
+            except Exception:
+                self._max_chars_cache = DEFAULT_MAX_CHARS
+        return self._max_chars_cache
 
-            self._cv.notify()
+    def _coalesce(self, head: tuple) -> tuple[str, list]:
+        """
+        head와 같은 계정으로 아직 큐에서 기다리는 응답들을 글자수 제한 안에서 한 툿으로 합친다.
+        합쳐진 응답은 원래 멘션 URL로 구분해 적으므로 URL이 있는 응답만 합치고, URL이 없는 응답을
+        만나면 거기서 멈춘다(그 뒤는 순서대로 따로 나감). (self._cv 안에서 호출)
+        반환: (합친 본문, 합친 응답들의 outbox id 목록)
+        """
+        ready, _, _, text, _, key, _, oid = head
+        if key == "_anon" or not self._pq:
+            return text, [oid]
+        tag = f"@{key} "
+        limit = self._max_chars()
+        merged, taken = text, []
+        for ent in sorted(e for e in self._pq if e[5] == key):
+            if not ent[6]:
+                break
+            body = ent[3][len(tag):] if ent[3].startswith(tag) else ent[3]
+            part = f"\n\n↪ {ent[6]}\n{body}"
+            if len(merged) + len(part) > limit:
+                break
+            merged += part
+            taken.append(ent)
+        if taken:
+            # 합쳐진 응답이 잡아 둔 계정별 발송 자리를 돌려준다: 남은 같은 계정 응답은 head 뒤로 다시
+            # 간격을 매기고, 다음 응답도 보내지 않을 툿들 뒤로 밀리지 않게 _last를 되돌린다
+            gone = set(e[1] for e in taken)
+            rest = sorted(e for e in self._pq if e[5] == key and e[1] not in gone)
+            self._pq = [e for e in self._pq if e[5] != key]
+            last = ready
+            for e in rest:
+                last = min(e[0], last + self._gap_acct)
+                self._pq.append((last,) + e[1:])
+            heapq.heapify(self._pq)
+            self._last[key] = last
+        return merged, [oid] + [e[7] for e in taken]
 
     def _sender(self):
         while True:
             with self._cv:
-                while not self._pq:
+                if self._out_spilled and len(self._pq) <= self._out_max // 2:
+                    self._refill_outbox_locked()
+                if not self._pq:
                     self._cv.wait()
-                rt, seq, irt, text = heapq.heappop(self._pq)
+                    continue
+                rt = self._pq[0][0]
                 now = time.monotonic()
-                if rt > now:
-                    self._cv.wait(timeout=rt - now)
-                    heapq.heappush(self._pq, (rt, seq, irt, text))
+                # 예약 시각(계정별 간격)과 서버 예산 중 늦은 쪽까지 대기
+                wait = max(rt - now, self._budget.delay())
+                if wait > 0:
+                    self._cv.wait(timeout=wait)
                     continue
+                head = heapq.heappop(self._pq)
+                text, oids = self._coalesce(head)
+            _, _, irt, _, enq_at, _, _, _ = head
+            metrics.observe("bot.reply_wait_sec", now - enq_at)
+            state = OUT_SENT
             try:
                 self.api.status_post(text, in_reply_to_id=irt, visibility="public")
+                metrics.inc("bot.replies_sent")
+                if len(oids) > 1:
+                    metrics.inc("bot.replies_coalesced", len(oids) - 1)
             except Exception as e:
                 logging.exception("send failed: %s", e)
+                metrics.inc("bot.reply_send_errors")
+                state = OUT_FAILED
+            finally:
+                self._budget.record()
+            try:
+                self._journal.finish_replies(oids, state)
+            except Exception as e:
+                logging.exception("journal update failed: %s", e)
 
     def _maybe_update_nickname(self, status, row_idx, runner):
         conf = self.sheets.get_config()
@@ -107,118 +247,306 @@ class DiceListener(StreamListener):
     def on_notification(self, notif: dict):
         if notif.get("type") != "mention":
             return
+        status = notif.get("status") or {}
+        acct = (status.get("account", {}) or {}).get("acct") or ""
+
+        # 스트림 스레드는 막지 않는다: 저널에 먼저 남기고, 메모리 큐에 자리가 없으면 저널에만 둔다
+        sid = str(status.get("id") or "")
+        delay = intake.delivery_delay(notif)
+        if delay is not None:
+            metrics.observe("intake.delivery_sec", delay)  # 수신 방식(stream/poll) 비교용
+        with self._in_lock:
+            rid = None if sid in self._seen else self._journal.add_mention(notif)
+            self._seen.put(sid, True)
+            if rid is None:
+                metrics.inc("bot.duplicate_mentions")
+                return
+            if not self._in_spilled and self._dispatch(rid, notif):
+                self._in_mark = rid
+            else:
+                self._in_spilled = True
+                metrics.inc("journal.spilled_mentions")
+        self._sync_nickname_later(acct, status)
+
+    def cursor(self):
+        """마지막으로 받은 알림 id (저널에 남아 재시작해도 유지)."""
+        return self._journal.cursor()
+
+    def backfill(self, since=None) -> int:
+        """스트림이 끊겼던 동안(또는 꺼져 있던 동안) 온 멘션을 알림 API로 메워 넣는다."""
+        return intake.backfill(self.api, self._journal, self.on_notification, since)
+
+    def resume_from(self, since):
+        """
+        스트림 연결 직후(첫 heartbeat)에 since부터 한 번 더 메우도록 예약.
+        연결 전 backfill과 실제 연결 사이에 온 멘션을 잡기 위함. 스트림이 더 새 멘션을 먼저
+        받아 커서가 앞서 나가도, 끊긴 시점의 id를 따로 들고 있으므로 틈이 생기지 않는다.
+        """
+        self._resume_since = since
+
+    def handle_heartbeat(self):
+        since, self._resume_since = self._resume_since, None
+        if since is not None:
+            threading.Thread(target=self._backfill_quietly, args=(since,), daemon=True).start()
+
+    def _backfill_quietly(self, since):
         try:
-            self._inbox.put(notif, timeout=1.0)  # 0.5초 대기 후 포기
-        except queue.Full:
-            status = notif.get("status") or {}
-            acct = (status.get("account", {}) or {}).get("acct") or ""
-            logging.warning("inbox full: dropping mention from %s", acct)
+            self.backfill(since)
+        except Exception as e:
+            logging.exception("backfill after connect failed: %s", e)
 
-    def _worker(self):
+    def _dispatch(self, rid: int, notif: dict) -> bool:
+        """
+        메모리 큐로 넘긴다. 넘겼으면 True, 전체 큐에 자리가 없어 저널에 남겨야 하면 False.
+        한 계정이 도배해 그 계정 몫이 꽉 찼으면 id만 그 계정 앞으로 세워 두고(멘션은 저널에 미완료로 남음)
+        True를 돌려준다. 다른 계정의 멘션은 막히지 않고, 세워 둔 것은 피더가 그 계정 레인이 빌 때 올린다.
+        (self._in_lock 안에서 호출)
+        """
+        status = notif.get("status") or {}
+        acct = (status.get("account", {}) or {}).get("acct") or ""
+        text = html_to_text(status.get("content", ""))
+
+        # 시트 상태가 필요 없는 명령은 빠른 레인으로 (시트 지연/429 백오프에 묶이지 않게)
+        if self._is_pure(acct, text):
+            try:
+                self._fast.put_nowait((rid, notif))
+            except queue.Full:
+                return False
+            return True
+        if self._lanes.depth() >= self._in_max:
+            return False
+        parked = self._parked.get(acct)
+        if parked is not None or not self._lanes.has_room(acct):
+            # 같은 계정의 뒤 멘션도 세워 둔 것 뒤로 (계정 안의 순서 유지)
+            if parked is None:
+                parked = self._parked[acct] = deque()
+                logging.info("too many pending from %s: parking further mentions", acct)
+            parked.append(rid)
+            metrics.inc("bot.parked_mentions")
+            return True
+        return self._lanes.submit(acct, (rid, notif))
+
+    def _unpark_locked(self):
+        """세워 둔 계정별 멘션을 그 계정 레인에 자리가 난 만큼 저널에서 다시 꺼내 올린다. (self._in_lock 안에서 호출)"""
+        for acct in list(self._parked):
+            parked = self._parked[acct]
+            ids = []
+            while parked and len(ids) < MAX_PENDING_PER_ACCT:
+                ids.append(parked.popleft())
+            notifs = dict(self._journal.mentions(ids))  # 그사이 끝난(미완료가 아닌) 것은 빠진다
+            done = 0
+            for rid in ids:
+                notif = notifs.get(rid)
+                if notif is not None:
+                    if self._lanes.depth() >= self._in_max or not self._lanes.submit(acct, (rid, notif)):
+                        break
+                    metrics.inc("journal.replayed_mentions")
+                done += 1
+            # 못 올린 것은 순서대로 다시 앞에 세운다
+            parked.extendleft(reversed(ids[done:]))
+            if not parked:
+                del self._parked[acct]
+
+    def _feeder(self):
         while True:
-            notif = self._inbox.get()
+            time.sleep(FEED_INTERVAL_SEC)
             try:
-                status = notif.get("status") or {}
-                acct = status.get("account", {}).get("acct") or ""
-                text = html_to_text(status.get("content", ""))
-                reply_to = status.get("id")
+                self._feed()
+            except Exception as e:
+                logging.exception("journal feed failed: %s", e)
+
+    def _feed(self):
+        """저널에만 남은 멘션(넘침/재시작 전 미완료)을 id 순서로 메모리 큐에 다시 올린다."""
+        with self._in_lock:
+            if self._parked:
+                self._unpark_locked()
+            if not self._in_spilled:
+                return
+            room = self._in_max - max(self._lanes.depth(), self._fast.qsize())
+            if room < self._in_max // 2:
+                return  # 큐가 절반 이상 빌 때까지 기다린다
+            rows = self._journal.pending_mentions(self._in_mark, room)
+            for rid, notif in rows:
+                if not self._dispatch(rid, notif):
+                    return
+                self._in_mark = rid
+                metrics.inc("journal.replayed_mentions")
+            if len(rows) < room:
+                self._in_spilled = False
+
+    def _is_pure(self, acct: str, text: str) -> bool:
+        """주사위, 그리고 표기용 닉네임/설정이 이미 캐시된 YN은 시트 I/O 없이 처리 가능."""
+        if DICE_ANY_RE.search(text):
+            return True
+        if not YN_ANY_RE.search(text):
+            return False
+        return self.sheets.peek_runner(acct) is not None and self.sheets.peek_config() is not None
+
+    # ---------- 닉네임 동기화(응답 경로 밖에서) ----------
+    def _sync_nickname_later(self, acct: str, status: dict):
+        if not acct:
+            return
+        with self._nick_lock:
+            if acct in self._nick_pending:
+                return  # 이미 대기 중이면 합친다
+            self._nick_pending.add(acct)
+        self._nick_q.put((acct, status))
 
+    def _nick_worker(self):
+        while True:
+            acct, status = self._nick_q.get()
+            with self._nick_lock:
+                self._nick_pending.discard(acct)
+            try:
                 # 러너 로드 & 닉네임 정책 (유저행 추가/갱신이 있을 수 있어 유저락)
                 with self.sheets.lock_for(acct):
-                    # ▶ get_runner_row()가 None을 리턴하는 예외 상황을 대비해 가드를 둡니다.
                     res = self.sheets.get_runner_row(acct)
                     if not isinstance(res, tuple) or len(res) != 2:
                         logging.error("get_runner_row() returned %r for acct=%s", res, acct)
-                        # 사용자에게도 '내부 오류' 한 줄 공지(봇이 죽지 않게)
-                        reply_to = (status.get("id") if status else None)
-                        acct_tag = f"@{acct} " if acct else ""
-                        self._enqueue(acct, reply_to, f"{acct_tag}내부 오류(get_runner_row).")
-                        return
-
+                        continue
                     row_idx, runner = res
                     self._maybe_update_nickname(status, row_idx, runner)
-
-                # 1) NdM(+/-K) 선처리
-                if DICE_ANY_RE.search(text):
-                    lines = cmd_dice.handle(text)
-                    if lines:
-                        msg = "\n".join(lines)
-                        if acct: msg = f"@{acct} {msg}"
-                        self._enqueue(acct, reply_to, msg)
-                    continue
-
-                # 2) YN (대괄호/소문자 허용)
-                if YN_ANY_RE.search(text):
-                    msg = cmd_yn.handle(status, self.sheets, self.cfg)
-                    if acct: msg = f"@{acct} {msg}"
-                    self._enqueue(acct, reply_to, msg)
-                    continue
-
-                # 3) 대괄호 커맨드 파싱
-                cmds = CMD_RE.findall(text)
-                if not cmds:
-                    continue
-                cmd = (cmds[0] or "").strip()
-
-                if re.fullmatch(r"\d+[dD]\d+(?:\s*[+-]\s*\d+)?", cmd):
-                    msg = "\n".join(cmd_dice.handle(f"[{cmd}]"))
-
-                elif cmd.casefold() == "yn":
-                    msg = cmd_yn.handle(status, self.sheets, self.cfg)
-
-                elif cmd == "출석":
-                    allowed, root = self._is_allowed_reply(status, "출석")
-                    # 유저별 쓰기(점수/날짜/통화) 구간은 락으로 감싸기
-                    with self.sheets.lock_for(acct):
-                        msg = cmd_att.handle(status, self.sheets, self.cfg, allowed, str(root.get("id") or ""))
-
-                elif cmd.startswith("탐색/"):
-                    area = cmd.split("/", 1)[1].strip()
-                    # 탐색은 핸들러 내부에서 보상 처리 시점에 유저락을 잡도록 구현됨
-                    msg = cmd_exp.handle(acct, area, self.sheets, self.cfg)
-
-                elif cmd == "참여 확인":
-                    allowed, root = self._is_allowed_reply(status, "확인")
-                    with self.sheets.lock_for(acct):
-                        msg = cmd_cf.handle(status, self.sheets, self.cfg, allowed, str(root.get("id") or ""))
-
-                else:
-                    continue
-
-                if acct:
-                    msg = f"@{acct} {msg}"
-                self._enqueue(acct, reply_to, msg)
-
             except Exception as e:
-                logging.exception("worker error: %s", e)
-                try:
-                    status = notif.get("status") or {}
-                    acct = (status.get("account", {}) or {}).get("acct") or ""
-                    reply_to = status.get("id")
-                    err = f"오류: {e}"
-                    if acct: err = f"@{acct} {err}"
-                    self._enqueue(acct, reply_to, err)
-                except Exception:
-                    pass
+                logging.exception("nickname sync failed for %s: %s", acct, e)
+
+    # ---------- 처리 레인 ----------
+    def _fast_worker(self):
+        while True:
+            rid, notif = self._fast.get()
+            try:
+                self._process(rid, notif, self._handle_pure)
             finally:
-                self._inbox.task_done()
+                self._fast.task_done()
+
+    def _process_stateful(self, item: tuple):
+        rid, notif = item
+        self._process(rid, notif, self._handle)
 
-    def _get_thread_root(self, status: dict):
-        root = status
+    def _process(self, rid: int, notif: dict, handler):
+        try:
+            status = notif.get("status") or {}
+            acct = status.get("account", {}).get("acct") or ""
+            text = html_to_text(status.get("content", ""))
+            reply_to = status.get("id")
+
+            msg = handler(status, acct, text)
+            if msg is None:
+                self._journal.finish_mention(rid)
+                return
+            if acct:
+                msg = f"@{acct} {msg}"
+            self._enqueue(acct, reply_to, msg, status.get("url"), inbox_id=rid)
+
+        except Exception as e:
+            logging.exception("worker error: %s", e)
+            try:
+                status = notif.get("status") or {}
+                acct = (status.get("account", {}) or {}).get("acct") or ""
+                reply_to = status.get("id")
+                err = f"오류: {e}"
+                if acct: err = f"@{acct} {err}"
+                self._enqueue(acct, reply_to, err, status.get("url"), inbox_id=rid)
+            except Exception:
+                pass
+
+    def _handle_pure(self, status: dict, acct: str, text: str):
+        """빠른 레인: 주사위 / 캐시된 라벨로 YN. 시트 I/O를 기다리지 않는다."""
+        if DICE_ANY_RE.search(text):
+            return "\n".join(cmd_dice.handle(text)) or None
+        return cmd_yn.handle(status, self.sheets, self.cfg,
+                             runner=self.sheets.peek_runner(acct), conf=self.sheets.peek_config())
+
+    def _handle(self, status: dict, acct: str, text: str):
+        """시트 레인: 상태가 필요한 명령. 응답 본문(멘션 제외)을 반환, 응답할 게 없으면 None."""
+        # 1) NdM(+/-K) 선처리
+        if DICE_ANY_RE.search(text):
+            return "\n".join(cmd_dice.handle(text)) or None
+
+        # 2) YN (대괄호/소문자 허용)
+        if YN_ANY_RE.search(text):
+            self.sheets.prefetch(cmd_yn.SHEETS)
+            return cmd_yn.handle(status, self.sheets, self.cfg)
+
+        # 3) 대괄호 커맨드 파싱
+        cmds = CMD_RE.findall(text)
+        if not cmds:
+            return None
+        cmd = (cmds[0] or "").strip()
+
+        if re.fullmatch(r"\d+[dD]\d+(?:\s*[+-]\s*\d+)?", cmd):
+            return "\n".join(cmd_dice.handle(f"[{cmd}]"))
+
+        if cmd.casefold() == "yn":
+            self.sheets.prefetch(cmd_yn.SHEETS)
+            return cmd_yn.handle(status, self.sheets, self.cfg)
+
+        # 명령마다 필요한 시트를 먼저 한 번에 받아 두면 핸들러 안의 읽기는 캐시에서 끝난다
+        if cmd == "출석":
+            self.sheets.prefetch(cmd_att.SHEETS)
+            allowed, root_id = self._is_allowed_reply(status, "출석")
+            # 유저별 쓰기(점수/날짜/통화) 구간은 핸들러가 리소스 락으로 감싼다
+            return cmd_att.handle(status, self.sheets, self.cfg, allowed, root_id)
+
+        if cmd.startswith("탐색/"):
+            area = cmd.split("/", 1)[1].strip()
+            self.sheets.prefetch(cmd_exp.SHEETS)
+            # 탐색은 핸들러 내부에서 보상 처리 시점에 제한 락을 잡도록 구현됨
+            return cmd_exp.handle(acct, area, self.sheets, self.cfg)
+
+        if cmd == "참여 확인":
+            self.sheets.prefetch(cmd_cf.SHEETS)
+            allowed, root_id = self._is_allowed_reply(status, "확인")
+            return cmd_cf.handle(status, self.sheets, self.cfg, allowed, root_id)
+
+        return None
+
+    @staticmethod
+    def _root_summary(st: dict) -> tuple:
+        return (
+            str(st.get("id") or ""),
+            (st.get("account", {}) or {}).get("acct", "") or "",
+            html_to_text(st.get("content", "") or ""),
+        )
+
+    def _get_thread_root(self, status: dict) -> tuple:
+        """
+        답글 체인을 거슬러 올라가 (root_id, root_acct, root_text)를 반환.
+        거쳐 간 상태들은 모두 같은 루트로 캐시해 두므로, 같은 스레드의 다음 답글은
+        캐시된 조상을 만나는 즉시 멈춘다.
+        """
+        cur = status
+        chain = []  # 이번에 조회한 상태 id들
         hops = 0
         try:
-            while root.get("in_reply_to_id") and hops < 10:
-                root = self.api.status(root["in_reply_to_id"])
+            while True:
+                parent = str(cur.get("in_reply_to_id") or "")
+                if not parent:
+                    break
+                hit = self._roots.get(parent)
+                if hit is not None:
+                    metrics.inc("bot.root_cache_hits")
+                    for sid in chain:
+                        self._roots.put(sid, hit)
+                    return hit
+                if hops >= 10:
+                    break
+                cur = self.api.status(parent)
+                chain.append(parent)
                 hops += 1
+                metrics.inc("bot.root_fetches")
         except Exception:
-            pass
+            # 조회 실패 시 지금까지 올라간 상태를 루트로 보되, 캐시하지는 않는다
+            return self._root_summary(cur)
+
+        root = self._root_summary(cur)
+        for sid in chain:
+            self._roots.put(sid, root)
         return root
 
-    def _is_allowed_reply(self, status: dict, purpose: str) -> tuple[bool, dict]:
+    def _is_allowed_reply(self, status: dict, purpose: str) -> tuple[bool, str]:
         """
-        항상 (allowed, root_status) 튜플을 반환하도록 보장
+        항상 (allowed, root_id) 튜플을 반환하도록 보장
         """
-        root = self._get_thread_root(status)
         conf = self.sheets.get_config()
 
         explicit_id_key = "출석_허용_상태ID" if purpose == "출석" else "확인_허용_상태ID"
@@ -226,7 +554,12 @@ class DiceListener(StreamListener):
 
         if explicit_id and explicit_id != "0":
             if str(status.get("in_reply_to_id") or "") == explicit_id:
-                return True, root
+                # 지정 공지에 바로 단 답글이면 발신자/키워드 검사는 건너뛴다. 다만 참여기록 키는
+                # 깊은 답글과 같은 스레드 루트여야 하므로(공지가 루트가 아닐 수 있음) 루트는 똑같이 구한다.
+                # 공지의 루트는 처음 한 번만 조회하고 이후엔 캐시에서 바로 나온다.
+                return True, self._get_thread_root(status)[0]
+
+        root_id, root_acct, root_text = self._get_thread_root(status)
 
         allowed_accounts = [
             a.strip() for a in (conf.get("공지_발신자_허용", "") or "").split(",") if a.strip()
@@ -235,12 +568,9 @@ class DiceListener(StreamListener):
         kw = (conf.get(kw_key) or "").strip()
 
         if not allowed_accounts and not kw and not explicit_id:
-            return True, root
-
-        root_acct = (root.get("account", {}) or {}).get("acct", "") or ""
-        root_text = html_to_text(root.get("content", "") or "")
+            return True, root_id
 
         acct_ok = (not allowed_accounts) or (root_acct in allowed_accounts)
         kw_ok = (not kw) or (kw in root_text)
 
-        return (acct_ok and kw_ok), root
+        return (acct_ok and kw_ok), root_id
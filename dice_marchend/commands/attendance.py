@@ -1,6 +1,8 @@
 from datetime import datetime
 from ..utils import today_ymd, build_user_label
 
+SHEETS = ("설정", "러너", "가방")  # 처리 전에 한 번에 받아 둘 시트 (Sheets.prefetch)
+
 def handle(status, sheets, cfg, is_allowed: bool, root_id: str) -> str:
     if not is_allowed:
         return "출석은 지정된 공지에 대한 답글로만 인정됩니다."
@@ -9,7 +11,8 @@ def handle(status, sheets, cfg, is_allowed: bool, root_id: str) -> str:
     today = today_ymd(cfg.TIMEZONE)
     conf = sheets.get_config()
 
-    with sheets.atomic():
+    # 이 유저의 러너 행만 잠근다 (다른 유저 출석은 병렬로 진행)
+    with sheets.locked(("runner", acct)):
         row_idx, runner = sheets.get_runner_row(acct)
 
         # 하루 1회 체크도 락 안에서!
@@ -17,12 +20,12 @@ def handle(status, sheets, cfg, is_allowed: bool, root_id: str) -> str:
             return "이미 오늘 출석했습니다."
 
         hp = int(conf.get("출석_기숙사점수", 1))
-        sheets.update_runner_points(row_idx, runner.house_points + hp)
+        sheets.add_runner_points(row_idx, hp)
         sheets.update_runner_last_attend(row_idx, today)
 
         coins = int(conf.get("출석_통화", 0))
         if coins:
-            sheets.add_currency(acct, coins)
+            sheets.add_currency(acct, coins, source="출석")
 
     # 메시지 구성은 락 밖에서
     label = build_user_label(acct, runner.nickname, (conf.get("아이디_표기") or "hidden").lower())
@@ -1,13 +1,16 @@
 from datetime import datetime
 from ..utils import today_ymd, build_user_label
 
+SHEETS = ("설정", "러너", "가방")  # 처리 전에 한 번에 받아 둘 시트 (Sheets.prefetch)
+
 def handle(status, sheets, cfg, is_allowed: bool, root_id: str) -> str:
     if not is_allowed:
         return "참여 확인은 지정된 공지에 대한 답글로만 인정됩니다."
     acct = status.get("account", {}).get("acct")
     conf = sheets.get_config()
 
-    with sheets.atomic():
+    # 이 공지의 이 유저 참여기록 + 이 유저의 러너 행만 잠근다
+    with sheets.locked(("particip", root_id or "", acct), ("runner", acct)):
         # 공지별 중복 방지도 같은 락에서!
         if root_id and sheets.has_participation("확인", root_id, acct):
             return "이미 해당 이벤트의 참여 확인이 되었습니다."
@@ -15,12 +18,12 @@ def handle(status, sheets, cfg, is_allowed: bool, root_id: str) -> str:
         row_idx, runner = sheets.get_runner_row(acct)
         hp = int(conf.get("확인_기숙사점수", 1))
 
-        sheets.update_runner_points(row_idx, runner.house_points + hp)
+        sheets.add_runner_points(row_idx, hp)
         sheets.update_runner_last_confirm(row_idx, today_ymd(cfg.TIMEZONE))
 
         coins = int(conf.get("확인_통화", 0))
         if coins:
-            sheets.add_currency(acct, coins)
+            sheets.add_currency(acct, coins, source="확인")
 
         # 참여기록 남기기까지 같은 락에서
         sheets.append_participation("확인", root_id or "", acct,
@@ -5,6 +5,8 @@ from ..sheets import Sheets
 from ..config import Config
 from ..utils import normalize_path, path_parent, path_last
 
+SHEETS = ("설정", "세션", "탐색", "가방")  # 처리 전에 한 번에 받아 둘 시트 (Sheets.prefetch)
+
 def _format_children_bullets(children):
     """자식 노드를 불릿 리스트로 예쁘게."""
     if not children:
@@ -51,14 +53,14 @@ def _apply_reward_uniform(cfg_node, sheets: Sheets, handle: str, currency_key: s
         hi = max(lo, cfg_node["gmax"])
         amt = random.randint(lo, hi) if hi > 0 else 0
         if amt > 0:
-            sheets.add_currency(handle, amt)
+            sheets.add_currency(handle, amt, source="탐색")
             return f"{base}\n획득: {currency_key} +{amt}", True
         return base, False
 
     if t == "item":
         item, qty = cfg_node["item"], cfg_node["qty"]
         if item and qty > 0:
-            sheets.add_item(handle, item, qty)
+            sheets.add_item(handle, item, qty, source="탐색")
             return f"{base}\n획득: {item} x{qty}", True
         return base, False
 
@@ -96,7 +98,9 @@ def handle(acct: str, raw_path: str, sheets: Sheets, cfg: Config) -> str:
     elif token == "..":
         new_path = path_parent(cur_path)
     elif "/" in token:
-        new_path = normalize_path(token)  # 절대경로 점프 허용
+        new_path = normalize_path(token)  # 절대경로 점프 허용 (루트부터 이어지는 경로만)
+        if not sheets.is_valid_path(new_path):
+            return f"해당 경로를 찾을 수 없습니다: {new_path}"
     else:
         parent = path_last(cur_path) if cur_path else ""
         if parent:
@@ -120,7 +124,8 @@ def handle(acct: str, raw_path: str, sheets: Sheets, cfg: Config) -> str:
         return f"해당 구역을 찾을 수 없습니다: {node}"
 
     # 여기서 제한 체크(보상 처리 직전). 제한 초과라도 선택지는 보여줌.
-    with sheets.atomic():
+    # 이 유저의 일일 제한만 잠근다 (확인~보상~증가가 한 덩어리)
+    with sheets.locked(("limit", acct)):
         used = sheets.get_today_limit(acct)
         limit = int(conf.get("탐색_일일제한", 3))
 
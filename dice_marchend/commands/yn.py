@@ -2,13 +2,17 @@
 import random
 from ..utils import build_user_label
 
-def handle(status, sheets, _cfg) -> str:
-    # 호출한 러너 식별
+SHEETS = ("설정", "러너")  # 처리 전에 한 번에 받아 둘 시트 (Sheets.prefetch)
+
+def handle(status, sheets, _cfg, runner=None, conf=None) -> str:
+    # 호출한 러너 식별 (빠른 레인에서는 캐시된 러너/설정을 넘겨받아 시트 I/O를 건너뜀)
     acct = status.get("account", {}).get("acct")
-    _, runner = sheets.get_runner_row(acct)
+    if runner is None:
+        _, runner = sheets.get_runner_row(acct)
 
     # 닉네임/아이디 표기 정책 반영
-    conf = sheets.get_config()
+    if conf is None:
+        conf = sheets.get_config()
     label = build_user_label(acct, runner.nickname, (conf.get("아이디_표기") or "hidden").lower())
 
     # 결과 (한국어 예/아니오)
@@ -8,7 +8,25 @@ class Config:
     SHEET_NAME: str = os.environ.get("DICE_SHEET_NAME", "다이스")
     SHOP_SHEET_NAME: str = os.environ.get("SHOP_SHEET_NAME", "상점")
     SHOP_BAG_WS: str = os.environ.get("SHOP_BAG_WS", "가방")
+    BAG_MODE: str = os.environ.get("BAG_MODE", "direct")  # direct | ledger
+    LEDGER_WS: str = os.environ.get("LEDGER_WS", "거래기록")  # 원장 워크시트(상점 시트 안)
+    LEDGER_PATH: str = os.environ.get("LEDGER_PATH", "")  # 지정하면 워크시트 대신 로컬 JSONL 원장
+    LEDGER_COMPACT_SEC: float = float(os.environ.get("LEDGER_COMPACT_SEC", "60"))
     USER_COLUMN_STYLE: str = os.environ.get("USER_COLUMN_STYLE", "without_at")  # with_at | without_at
     TIMEZONE: str = os.environ.get("TZ", "Asia/Seoul")
+    SEND_GAP_GLOBAL: float = float(os.environ.get("SEND_GAP_GLOBAL", "0"))  # 전역 최소 간격(초). 0이면 Mastodon 헤더 예산만 따름
+    SEND_GAP_PER_ACCT: float = float(os.environ.get("SEND_GAP_PER_ACCT", "8"))  # 같은 유저에게 연속 응답 시 최소 간격(초)
+    SEND_RATE_RESERVE: int = int(os.environ.get("SEND_RATE_RESERVE", "20"))  # 남은 요청이 이 이하면 리셋까지 고르게 감속
+    INTAKE_MODE: str = os.environ.get("INTAKE_MODE", "stream")  # stream | poll (알림 수신 방식)
+    POLL_MIN_SEC: float = float(os.environ.get("POLL_MIN_SEC", "3"))    # poll 모드: 멘션이 오가는 동안의 조회 간격(초)
+    POLL_MAX_SEC: float = float(os.environ.get("POLL_MAX_SEC", "30"))   # poll 모드: 한산할 때 늘어나는 최대 간격(초)
+    JOURNAL_PATH: str = os.environ.get("JOURNAL_PATH", "dice_journal.db")  # 멘션/응답 저널(SQLite)
+    JOURNAL_KEEP_SEC: float = float(os.environ.get("JOURNAL_KEEP_SEC", str(3 * 86400)))  # 끝난 항목 보관 기간(초)
+    INBOX_MEM_MAX: int = int(os.environ.get("INBOX_MEM_MAX", "2000"))    # 메모리에 올려둘 미처리 멘션 수. 넘치면 저널에만
+    OUTBOX_MEM_MAX: int = int(os.environ.get("OUTBOX_MEM_MAX", "500"))   # 메모리에 올려둘 미발송 응답 수. 넘치면 저널에만
+    WORKERS_MIN: int = int(os.environ.get("WORKERS_MIN", "2"))    # 시트 레인 최소 수
+    WORKERS_MAX: int = int(os.environ.get("WORKERS_MAX", "16"))   # 시트 레인 최대 수
+    AUTOSCALE_SEC: float = float(os.environ.get("AUTOSCALE_SEC", "5"))  # 레인 수 조정 주기(초). 0이면 고정
+    METRICS_LOG_SEC: float = float(os.environ.get("METRICS_LOG_SEC", "300"))  # 지표 로그 주기(초). 0이면 끔
     LOG_LEVEL: str = os.environ.get("LOG_LEVEL", "INFO")
     CREDS_PATH: str = os.environ.get("GOOGLE_APPLICATIONS_CREDENTIALS") or os.environ.get("GOOGLE_APPLICATION_CREDENTIALS", "march-credential.json")
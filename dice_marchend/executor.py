@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+from .metrics import metrics
+
+class _Lane:
+    __slots__ = ("idx", "q", "cv", "busy", "retired")
+
+    def __init__(self, idx: int, lock):
+        self.idx = idx
+        self.q = deque()                    # (key, item)
+        self.cv = threading.Condition(lock)
+        self.busy = False
+        self.retired = False                # True면 새 키를 받지 않고, 남은 작업만 비운 뒤 종료
+
+class KeyedExecutor:
+    """
+    키(보통 acct)별 순서를 지키는 실행기.
+    - 같은 키의 작업은 한 레인에서 도착 순서대로 하나씩 실행된다(락 없이도 유저별 직렬).
+    - 키 -> 레인 배정은 그 키의 작업이 남아 있는 동안만 유지하고, 새 키는 가장 한가한 레인에 붙인다.
+      고정 해시가 아니므로 도배하는 한 유저와 우연히 같은 레인에 묶여 밀리는 일이 없다.
+    - 한 키의 대기 작업이 max_pending_per_key를 넘거나 전체가 max_total을 넘으면 submit()이 False.
+    - resize()로 레인 수를 바꿀 수 있다. 줄일 때는 레인을 은퇴시켜 남은 작업을 다 끝낸 뒤 스레드가 빠진다
+      (배정된 키의 순서가 깨지지 않도록).
+    """
+
+    def __init__(self, fn, lanes: int, name: str = "lane",
+                 max_pending_per_key: int = 20, max_total: int = 10000):
+        self._fn = fn
+        self._name = name
+        self._max_per_key = max_pending_per_key
+        self._max_total = max_total
+        self._lock = threading.Lock()
+        self._lanes: List[_Lane] = []
+        self._assign: Dict[str, _Lane] = {}   # key -> 현재 배정된 레인
+        self._pending: Dict[str, int] = {}    # key -> 대기+실행 중 작업 수
+        self._total = 0
+        self._next_idx = 0
+        for _ in range(max(1, lanes)):
+            self._add_lane()
+
+    def _add_lane(self) -> _Lane:
+        lane = _Lane(self._next_idx, self._lock)
+        self._next_idx += 1
+        self._lanes.append(lane)
+        threading.Thread(target=self._run, args=(lane,), daemon=True,
+                         name=f"{self._name}-{lane.idx}").start()
+        return lane
+
+    def _load(self, lane: _Lane) -> int:
+        return len(lane.q) + (1 if lane.busy else 0)
+
+    def submit(self, key: str, item) -> bool:
+        with self._lock:
+            n = self._pending.get(key, 0)
+            if n >= self._max_per_key:
+                metrics.inc(f"{self._name}.rejected_hot_key")
+                return False
+            if self._total >= self._max_total:
+                metrics.inc(f"{self._name}.rejected_full")
+                return False
+            lane = self._assign.get(key)
+            if lane is None:
+                lane = min((l for l in self._lanes if not l.retired), key=self._load)
+                self._assign[key] = lane
+            self._pending[key] = n + 1
+            self._total += 1
+            lane.q.append((key, item))
+            lane.cv.notify()
+            return True
+
+    def has_room(self, key: str) -> bool:
+        """이 키에 작업을 하나 더 넣을 수 있나 (키별 한도만 본다)."""
+        with self._lock:
+            return self._pending.get(key, 0) < self._max_per_key
+
+    def _run(self, lane: _Lane):
+        while True:
+            with self._lock:
+                while not lane.q:
+                    if lane.retired:
+                        self._lanes.remove(lane)
+                        return
+                    lane.cv.wait()
+                key, item = lane.q.popleft()
+                lane.busy = True
+            try:
+                self._fn(item)
+            except Exception as e:
+                logging.exception("%s-%d task failed: %s", self._name, lane.idx, e)
+            finally:
+                with self._lock:
+                    lane.busy = False
+                    self._total -= 1
+                    n = self._pending.get(key, 1) - 1
+                    if n <= 0:
+                        self._pending.pop(key, None)
+                        self._assign.pop(key, None)
+                    else:
+                        self._pending[key] = n
+
+    def size(self) -> int:
+        """새 키를 받는(은퇴하지 않은) 레인 수."""
+        with self._lock:
+            return sum(1 for l in self._lanes if not l.retired)
+
+    def resize(self, n: int) -> int:
+        """레인 수를 n으로 맞춘다. 늘릴 땐 은퇴 대기 중인 레인부터 되살리고, 줄일 땐 가장 한가한 레인부터 은퇴."""
+        n = max(1, n)
+        with self._lock:
+            active = [l for l in self._lanes if not l.retired]
+            if n > len(active):
+                for l in self._lanes:
+                    if len(active) >= n:
+                        break
+                    if l.retired:
+                        l.retired = False
+                        active.append(l)
+                while len(active) < n:
+                    active.append(self._add_lane())
+            elif n < len(active):
+                for l in sorted(active, key=self._load)[:len(active) - n]:
+                    l.retired = True
+                    l.cv.notify()
+            size = n
+        metrics.set(f"{self._name}.size", size)
+        return size
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._total
+
+    def stats(self) -> dict:
+        with self._lock:
+            depths = [self._load(l) for l in self._lanes]
+            hot_key, hot_n = max(self._pending.items(), key=lambda kv: kv[1], default=("", 0))
+            keys = len(self._pending)
+        metrics.set(f"{self._name}.depth", sum(depths))
+        metrics.set(f"{self._name}.max_lane_depth", max(depths) if depths else 0)
+        return {"lanes": depths, "keys": keys, "hot_key": hot_key, "hot_key_pending": hot_n}
+
+class Autoscaler:
+    """
+    KeyedExecutor 레인 수를 [lo, hi] 사이에서 조절한다. interval초마다 한 번 판단.
+    - 구글이 429를 주기 시작하면 1/4 줄이고 cooldown 동안은 늘리지 않는다(동시 호출이 곧 쿼터 소모라서).
+    - 대기 작업이 레인 수보다 많고 시트 호출이 느리면(=네트워크 대기 위주) 늘린다.
+      호출이 빠른데 쌓이는 건 처리량 문제가 아니므로 한 칸씩만 늘린다.
+    - 두 번 연속 한가하면 한 칸 줄인다.
+    판단 근거는 지표(sheets.call_sec / sheets.throttled)의 구간 차이로 계산한다.
+    """
+
+    def __init__(self, executor: KeyedExecutor, lo: int, hi: int, interval: float = 5.0,
+                 slow_sec: float = 0.8, cooldown: float = 60.0, name: str = "lanes"):
+        self._ex = executor
+        self._lo = max(1, lo)
+        self._hi = max(self._lo, hi)
+        self._interval = interval
+        self._slow = slow_sec
+        self._cooldown = cooldown
+        self._name = name
+        self._prev_timing = metrics.timing("sheets.call_sec")
+        self._prev_throttled = metrics.get("sheets.throttled", 0)
+        self._hold_until = 0.0
+        self._idle_ticks = 0
+        self.last_decision = ""
+        self._ex.resize(min(self._hi, max(self._lo, self._ex.size())))
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name=f"{self._name}-autoscale").start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logging.exception("autoscale tick failed: %s", e)
+
+    def _window(self):
+        cnt, total, _ = metrics.timing("sheets.call_sec")
+        pc, pt, _ = self._prev_timing
+        self._prev_timing = (cnt, total, 0.0)
+        calls = cnt - pc
+        avg = (total - pt) / calls if calls > 0 else 0.0
+        throttled = metrics.get("sheets.throttled", 0)
+        d429 = throttled - self._prev_throttled
+        self._prev_throttled = throttled
+        return calls, avg, d429
+
+    def tick(self):
+        now = time.monotonic()
+        size = self._ex.size()
+        depth = self._ex.depth()
+        calls, avg, d429 = self._window()
+        metrics.set("sheets.call_sec_window", round(avg, 4))
+        metrics.set("sheets.throttled_window", d429)
+
+        target, why = size, ""
+        if d429 > 0:
+            target = max(self._lo, size - max(1, size // 4))
+            self._hold_until = now + self._cooldown
+            why = f"429 x{d429}"
+        elif depth > size and now >= self._hold_until:
+            step = max(1, size // 2) if avg >= self._slow else 1
+            target = min(self._hi, size + step)
+            why = f"depth={depth} avg={avg:.2f}s"
+        elif depth == 0:
+            self._idle_ticks += 1
+            if self._idle_ticks >= 2:
+                target = max(self._lo, size - 1)
+                why = "idle"
+        if depth > 0:
+            self._idle_ticks = 0
+
+        if target != size:
+            self._ex.resize(target)
+            metrics.inc(f"{self._name}.scale_up" if target > size else f"{self._name}.scale_down")
+            if why == "idle":
+                self._idle_ticks = 0
+            self.last_decision = f"{size}->{target} ({why}, calls={calls})"
+            logging.info("%s autoscale %s", self._name, self.last_decision)
+        metrics.set(f"{self._name}.size", target)
+        return target
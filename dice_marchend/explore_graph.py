@@ -0,0 +1,90 @@
+from typing import Dict, List, Optional, Tuple
+from .utils import to_int
+
+EXPLORE_HEADERS = ["구역", "부모구역", "장소스크립트", "갈레온_최소", "갈레온_최대", "아이템명", "아이템수량", "소문스크립트"]
+
+class ExploreGraph:
+    """
+    '탐색' 시트 스냅샷을 한 번에 컴파일한 읽기 전용 그래프.
+    - nodes:    구역 -> 설정 dict (같은 구역이 여러 행이면 첫 행)
+    - children: 부모구역 -> 정렬된 자식 구역 튜플 ("" = 루트)
+    - parents:  구역 -> 부모구역 집합 (경로 검증용)
+    만든 뒤에는 고치지 않으므로 Sheets 쪽에서 참조만 바꿔 끼우면 된다.
+    """
+    __slots__ = ("nodes", "children", "parents", "version", "config_error")
+
+    def __init__(self, nodes, children, parents, version, config_error=None):
+        self.nodes: Dict[str, Optional[dict]] = nodes
+        self.children: Dict[str, Tuple[str, ...]] = children
+        self.parents: Dict[str, frozenset] = parents
+        self.version = version  # 컴파일에 쓴 스냅샷 버전
+        self.config_error = config_error
+
+    @classmethod
+    def compile(cls, vals: List[List[str]], version=None) -> "ExploreGraph":
+        header = {k: i for i, k in enumerate(vals[0])} if vals else {}
+        ia = header.get("구역"); ipar = header.get("부모구역")
+        if None in (ia, ipar):
+            raise RuntimeError("탐색 헤더에 '구역' 또는 '부모구역'이 없습니다.")
+
+        missing = [k for k in EXPLORE_HEADERS if k not in header]
+        config_error = None
+        if missing:
+            config_error = "탐색 헤더를 확인하세요. (구역/부모구역/장소스크립트/갈레온_최소/갈레온_최대/아이템명/아이템수량/소문스크립트)"
+
+        nodes: Dict[str, Optional[dict]] = {}
+        children: Dict[str, set] = {}
+        parents: Dict[str, set] = {}
+        for row in vals[1:]:
+            area = (row[ia] or "").strip()
+            if not area:
+                continue
+            parent = (row[ipar] or "").strip()
+            children.setdefault(parent, set()).add(area)
+            parents.setdefault(area, set()).add(parent)
+            if area in nodes:
+                continue
+            if config_error:
+                nodes[area] = None
+                continue
+            ips, imin, imax, iitem, iqty, irum = (header[k] for k in EXPLORE_HEADERS[2:])
+            nodes[area] = {
+                "area": area,
+                "place": row[ips] or "",
+                "gmin": to_int(row[imin], 0),
+                "gmax": to_int(row[imax], 0),
+                "item": (row[iitem] or "").strip(),
+                "qty": max(0, to_int(row[iqty], 0)),
+                "rumor": (row[irum] or "").strip(),
+            }
+
+        return cls(
+            nodes=nodes,
+            children={p: tuple(sorted(cs)) for p, cs in children.items()},
+            parents={a: frozenset(ps) for a, ps in parents.items()},
+            version=version,
+            config_error=config_error,
+        )
+
+    def exists(self, area: str) -> bool:
+        return area in self.nodes
+
+    def node(self, area: str) -> Optional[dict]:
+        if area not in self.nodes:
+            return None
+        if self.config_error:
+            raise RuntimeError(self.config_error)
+        return self.nodes[area]
+
+    def children_of(self, parent: str) -> Tuple[str, ...]:
+        return self.children.get(parent or "", ())
+
+    def is_valid_path(self, path: str) -> bool:
+        """'a/b/c' 가 루트에서 시작해 부모-자식 관계로 이어지는지 O(깊이)로 확인."""
+        parts = [p for p in (path or "").split("/") if p]
+        prev = ""
+        for part in parts:
+            if prev not in self.parents.get(part, ()):
+                return False
+            prev = part
+        return True
@@ -0,0 +1,109 @@
+"""
+알림 수신 보조.
+- backfill: 스트림이 끊긴 동안 놓친 멘션 메우기
+- Poller: 스트리밍 대신 알림 API를 주기적으로 당겨 오는 수신 방식 (Config.INTAKE_MODE=poll)
+"""
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from .journal import id_key
+from .metrics import metrics
+
+PAGE_LIMIT = 40  # Mastodon 알림 API 한 페이지 최대치
+
+def notifications_after(api, min_id: Optional[str], limit: int = PAGE_LIMIT) -> Iterator[dict]:
+    """
+    min_id 바로 다음 멘션 알림부터 최신까지 오래된 순으로 내준다.
+    (since_id는 '최신 N개'를 주므로 N개보다 많이 밀렸으면 중간이 빈다. min_id는 바로 다음부터 준다)
+    """
+    cursor = min_id
+    while True:
+        page = api.notifications(min_id=cursor, types=["mention"], limit=limit)
+        metrics.inc("intake.pages")
+        if not page:
+            return
+        page = sorted(page, key=lambda n: id_key(n.get("id")))
+        yield from page
+        cursor = page[-1].get("id")
+        if len(page) < limit:
+            return
+
+def backfill(api, journal, feed, since: Optional[str] = None) -> int:
+    """
+    since(없으면 저널에 남은 알림 커서) 이후의 멘션을 feed(보통 DiceListener.on_notification)로 흘려 넣는다.
+    처음 시작(커서 없음)이면 지난 멘션에 답하지 않도록 현재 최신 알림을 기준점으로만 남긴다.
+    반환: 넣은 건수 (중복은 feed 쪽에서 걸러진다)
+    """
+    cursor = since if since is not None else journal.cursor()
+    if cursor is None:
+        latest = api.notifications(types=["mention"], limit=1)
+        # 알림이 하나도 없으면 이후 오는 것은 전부 새 멘션
+        journal.advance_cursor(latest[0].get("id") if latest else "0")
+        logging.info("backfill: no cursor yet, starting from %s", journal.cursor())
+        return 0
+    n = 0
+    for notif in notifications_after(api, cursor):
+        feed(notif)
+        n += 1
+    metrics.inc("intake.backfilled", n)
+    if n:
+        logging.info("backfill: %d mention(s) after %s", n, cursor)
+    return n
+
+def delivery_delay(notif: dict) -> Optional[float]:
+    """알림 생성 시각부터 지금까지(초). 스트림/폴링 수신 지연 비교용. 시각을 못 읽으면 None."""
+    ts = notif.get("created_at")
+    if isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(ts, datetime):
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return max(0.0, (datetime.now(timezone.utc) - ts).total_seconds())
+
+class Poller:
+    """
+    알림 커서 이후 멘션을 min_id 페이지로 당겨 와 feed에 넣는 수신 루프.
+    - 새 멘션이 있으면 다음 조회는 min_sec 뒤 (한 페이지가 꽉 차면 기다리지 않고 이어서 당긴다)
+    - 비어 있으면 간격을 1.5배씩 늘려 max_sec까지
+    폴링 요청도 발송과 같은 API 한도를 쓰므로(PostBudget이 헤더로 함께 본다) min_sec을 너무 줄이지 말 것.
+    """
+
+    def __init__(self, api, listener, min_sec: float = 3.0, max_sec: float = 30.0):
+        self.api = api
+        self.listener = listener
+        self.min_sec = min_sec
+        self.max_sec = max(min_sec, max_sec)
+        self.interval = min_sec
+
+    def poll_once(self) -> int:
+        cursor = self.listener.cursor()
+        if cursor is None:
+            return self.listener.backfill()  # 처음 시작: 기준점만 잡는다
+        metrics.inc("intake.polls")
+        n = 0
+        for notif in notifications_after(self.api, cursor):
+            self.listener.on_notification(notif)
+            n += 1
+        metrics.inc("intake.polled", n)
+        if n == 0:
+            metrics.inc("intake.polls_empty")
+        return n
+
+    def run(self):
+        logging.info("intake: polling every %.1f~%.1fs", self.min_sec, self.max_sec)
+        while True:
+            try:
+                n = self.poll_once()
+                self.interval = self.min_sec if n else min(self.max_sec, self.interval * 1.5)
+            except Exception as e:
+                logging.warning("poll failed: %s", e)
+                metrics.inc("intake.poll_errors")
+                self.interval = self.max_sec
+            metrics.set("intake.poll_interval", round(self.interval, 2))
+            time.sleep(self.interval)
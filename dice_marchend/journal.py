@@ -0,0 +1,183 @@
+"""
+받은 멘션(inbox)과 보낼 응답(outbox)을 남기는 로컬 SQLite 저널.
+- 멘션은 받자마자 기록하고, 처리가 끝나면(응답을 outbox에 넣으면서 같은 트랜잭션으로) 완료 표시.
+- 응답은 발송 후 sent/failed 표시.
+- 메모리 큐가 넘치면 저널에만 남겨 두었다가(spill) 큐가 비는 대로 rowid 순서로 다시 꺼낸다.
+  재시작 시 미완료 항목을 꺼내는 것도 같은 경로.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+# inbox.state
+IN_PENDING, IN_DONE, IN_DROPPED = 0, 1, 2
+# outbox.state
+OUT_PENDING, OUT_SENT, OUT_FAILED = 0, 1, 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inbox (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    status_id   TEXT UNIQUE NOT NULL,
+    notif_id    TEXT,
+    acct        TEXT,
+    notif       TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    state       INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS inbox_state ON inbox(state, id);
+CREATE TABLE IF NOT EXISTS outbox (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    inbox_id    INTEGER,
+    acct        TEXT,
+    reply_to    TEXT,
+    text        TEXT NOT NULL,
+    url         TEXT,
+    created_at  REAL NOT NULL,
+    state       INTEGER NOT NULL DEFAULT 0,
+    done_at     REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox(state, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+CURSOR_KEY = "last_notif_id"
+
+def id_key(i) -> tuple:
+    """Mastodon id 비교용 키. 숫자 id는 길이 우선(=수 크기)으로, 아니면 문자열 그대로."""
+    s = str(i or "")
+    return (0, len(s), s) if s.isdigit() else (1, 0, s)
+
+class Journal:
+    """스레드 공용 SQLite 연결 하나 + 락. 호출은 모두 짧은 단일 트랜잭션."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    # ---------- inbox ----------
+    def add_mention(self, notif: dict) -> Optional[int]:
+        """
+        멘션 기록. 같은 status_id가 이미 있으면 None (중복 전달).
+        같은 트랜잭션에서 알림 커서(마지막으로 받은 알림 id)도 앞으로 민다.
+        """
+        status = notif.get("status") or {}
+        sid = str(status.get("id") or "")
+        if not sid:
+            return None
+        nid = str(notif.get("id") or "")
+        acct = (status.get("account", {}) or {}).get("acct") or ""
+        raw = json.dumps(notif, ensure_ascii=False, default=str)
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                cur = self._db.execute(
+                    "INSERT OR IGNORE INTO inbox(status_id, notif_id, acct, notif, received_at) VALUES (?,?,?,?,?)",
+                    (sid, nid, acct, raw, time.time()))
+                rid = cur.lastrowid if cur.rowcount else None
+                if nid:
+                    self._advance_cursor_locked(nid)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            return rid
+
+    def pending_mentions(self, after: int, limit: int) -> List[Tuple[int, dict]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, notif FROM inbox WHERE state=? AND id>? ORDER BY id LIMIT ?",
+                (IN_PENDING, after, limit)).fetchall()
+        return [(rid, json.loads(raw)) for rid, raw in rows]
+
+    def mentions(self, ids: List[int]) -> List[Tuple[int, dict]]:
+        """id로 미완료 멘션을 다시 꺼낸다 (id 순서)."""
+        if not ids:
+            return []
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, notif FROM inbox WHERE state=? AND id IN ({marks}) ORDER BY id",
+                (IN_PENDING, *ids)).fetchall()
+        return [(rid, json.loads(raw)) for rid, raw in rows]
+
+    def finish_mention(self, inbox_id: int, state: int = IN_DONE):
+        with self._lock:
+            self._db.execute("UPDATE inbox SET state=? WHERE id=?", (state, inbox_id))
+
+    # ---------- 알림 커서 ----------
+    def _advance_cursor_locked(self, nid: str):
+        row = self._db.execute("SELECT value FROM meta WHERE key=?", (CURSOR_KEY,)).fetchone()
+        if row is None or id_key(nid) > id_key(row[0]):
+            self._db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?,?)", (CURSOR_KEY, nid))
+
+    def cursor(self) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key=?", (CURSOR_KEY,)).fetchone()
+        return row[0] if row else None
+
+    def advance_cursor(self, nid):
+        """멘션이 아닌 알림이나 처음 시작할 때의 기준점을 남길 때."""
+        if not nid:
+            return
+        with self._lock:
+            self._advance_cursor_locked(str(nid))
+
+    # ---------- outbox ----------
+    def add_reply(self, acct: str, reply_to, text: str, url: str = "", inbox_id: Optional[int] = None) -> int:
+        """응답 기록. inbox_id가 있으면 같은 트랜잭션에서 그 멘션을 완료 처리."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                cur = self._db.execute(
+                    "INSERT INTO outbox(inbox_id, acct, reply_to, text, url, created_at) VALUES (?,?,?,?,?,?)",
+                    (inbox_id, acct, str(reply_to or ""), text, url or "", time.time()))
+                if inbox_id is not None:
+                    self._db.execute("UPDATE inbox SET state=? WHERE id=?", (IN_DONE, inbox_id))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            return cur.lastrowid
+
+    def pending_replies(self, after: int, limit: int) -> List[Tuple[int, str, str, str, str]]:
+        """(id, acct, reply_to, text, url)"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, acct, reply_to, text, url FROM outbox WHERE state=? AND id>? ORDER BY id LIMIT ?",
+                (OUT_PENDING, after, limit)).fetchall()
+
+    def finish_replies(self, ids: List[int], state: int = OUT_SENT):
+        if not ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany("UPDATE outbox SET state=?, done_at=? WHERE id=?",
+                                 [(state, now, i) for i in ids])
+
+    # ---------- 관리 ----------
+    def prune(self, older_than_sec: float) -> int:
+        """끝난 항목 중 오래된 것 삭제. 미완료 항목은 남긴다."""
+        cut = time.time() - older_than_sec
+        with self._lock:
+            n = self._db.execute("DELETE FROM inbox WHERE state!=? AND received_at<?", (IN_PENDING, cut)).rowcount
+            n += self._db.execute("DELETE FROM outbox WHERE state!=? AND created_at<?", (OUT_PENDING, cut)).rowcount
+        return n
+
+    def counts(self) -> dict:
+        with self._lock:
+            inbox = self._db.execute("SELECT COUNT(*) FROM inbox WHERE state=?", (IN_PENDING,)).fetchone()[0]
+            outbox = self._db.execute("SELECT COUNT(*) FROM outbox WHERE state=?", (OUT_PENDING,)).fetchone()[0]
+        return {"inbox_pending": inbox, "outbox_pending": outbox}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,172 @@
+"""
+통화/아이템 지급 원장(ledger).
+지급 1건 = 원장 1행(유저명, 키, 증감, 시각, 출처). 가방 셀을 읽고-고쳐-쓰는 대신
+원장에 덧붙이기만 하고, 압축기(compactor)가 주기적으로 원장을 가방 행렬에 접어 넣는다.
+가방 잔액은 (기준 잔액 + 원장 합계)로 언제든 다시 계산할 수 있다.
+
+접기(fold)는 멱등이어야 한다. 같은 지급이 두 번 들어가거나(이중 지급) 반영 표시만 남고
+가방 셀이 빠지면(유실) 안 되므로, 가방 셀과 반영 표시를 한 번에 확정한다.
+  - SheetLedger: 가방 셀 + 원장 반영 열을 한 번의 values.batchUpdate로 (같은 상점 시트라 원자적)
+  - FileLedger: 접을 결과(가방 절대값 + 새 오프셋)를 '<path>.fold'에 먼저 남기고 가방을 쓴 뒤 오프셋 확정.
+    중간에 죽으면 다음 압축 때 recover()가 같은 절대값을 다시 써서 마무리한다.
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import List, Tuple
+from gspread.utils import rowcol_to_a1, absolute_range_name
+from .quota import is_retryable
+
+# 가방에 쓸 셀: (행, 열, 값). 값은 증감이 아니라 접은 뒤의 절대값이라 다시 써도 결과가 같다.
+Cell = Tuple[int, int, object]
+
+LEDGER_HEADER = ["유저명", "키", "증감", "시각", "출처", "반영"]
+
+class SheetLedger:
+    """'거래기록' 워크시트 원장. 추가는 write-behind 버퍼로 묶어서 append_rows, 반영 표시는 6열(반영)에 시각."""
+
+    def __init__(self, ws, writes, read_rows, key: str = "거래기록"):
+        self.ws = ws
+        self._writes = writes          # sheets.WriteBuffer
+        self._read_rows = read_rows    # () -> 최신 원장 스냅샷 (2차원 리스트)
+        self._key = key
+
+    def record(self, handle: str, key: str, delta: int, source: str = ""):
+        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._writes.append(self._key, self.ws, [handle, key, int(delta), ts, source, ""])
+
+    def unapplied(self) -> List[Tuple[int, str, str, int]]:
+        """아직 가방에 반영되지 않은 (행번호, 유저명, 키, 증감) 목록."""
+        rows = self._read_rows()
+        out = []
+        for r, row in enumerate(rows[1:], start=2):
+            if len(row) < 3 or (len(row) > 5 and (row[5] or "").strip()):
+                continue
+            handle, key = (row[0] or "").strip(), (row[1] or "").strip()
+            try:
+                delta = int((row[2] or "0").strip())
+            except ValueError:
+                logging.warning("ledger row %d: bad delta %r, skipped", r, row[2])
+                continue
+            if handle and key and delta:
+                out.append((r, handle, key, delta))
+        return out
+
+    def recover(self, bag_ws, call) -> bool:
+        """시트 원장은 접기가 한 요청이라 마무리할 중간 상태가 없다."""
+        return False
+
+    def fold(self, tokens: List[int], bag_ws, cells: List[Cell], call):
+        """
+        가방 셀과 반영 표시를 한 요청으로 쓴다. 둘 다 들어가거나 둘 다 안 들어가므로
+        실패하면 원장 행은 미반영 그대로 남고 다음 압축이 다시 접는다.
+        (버퍼를 거치지 않는다: 버퍼는 둘을 따로 보내거나 하나만 버릴 수 있다)
+        """
+        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        data = [{"range": absolute_range_name(bag_ws.title, rowcol_to_a1(r, c)), "values": [[v]]}
+                for r, c, v in cells]
+        data += [{"range": absolute_range_name(self.ws.title, rowcol_to_a1(r, 6)), "values": [[ts]]}
+                 for r in tokens]
+        call(self.ws.spreadsheet.values_batch_update,
+             body={"valueInputOption": "USER_ENTERED", "data": data})
+
+    def flush(self):
+        self._writes.flush()
+
+class FileLedger:
+    """
+    로컬 JSONL 원장. 한 줄 = 지급 1건. 반영 위치는 '<path>.offset' 파일에 바이트 오프셋으로 남긴다.
+    추가분은 메모리에 모았다가 flush()에서 한 번에 쓰고 fsync.
+    진행 중인 접기는 '<path>.fold'(가방 절대값 + 새 오프셋)에 남겨 두었다가 끝나면 지운다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offset_path = path + ".offset"
+        self._fold_path = path + ".fold"
+        self._lock = threading.Lock()
+        self._buf: List[str] = []
+        self._scan_end = 0  # 마지막 unapplied()가 읽은 끝 위치
+
+    def record(self, handle: str, key: str, delta: int, source: str = ""):
+        line = json.dumps({
+            "handle": handle, "key": key, "delta": int(delta),
+            "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "source": source,
+        }, ensure_ascii=False)
+        with self._lock:
+            self._buf.append(line)
+
+    def flush(self):
+        with self._lock:
+            lines, self._buf = self._buf, []
+            if not lines:
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read_offset(self) -> int:
+        try:
+            with open(self._offset_path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def unapplied(self) -> List[Tuple[int, str, str, int]]:
+        if not os.path.exists(self.path):
+            return []
+        out = []
+        with open(self.path, "rb") as f:
+            f.seek(self._read_offset())
+            while True:
+                raw = f.readline()
+                if not raw or not raw.endswith(b"\n"):
+                    break  # 쓰는 중인 마지막 줄은 다음 번에
+                end = f.tell()
+                try:
+                    e = json.loads(raw.decode("utf-8"))
+                    out.append((end, e["handle"], e["key"], int(e["delta"])))
+                except (ValueError, KeyError) as err:
+                    logging.warning("ledger line at %d unreadable (%s), skipped", end, err)
+                self._scan_end = end
+        return out
+
+    def _write_atomic(self, path: str, text: str):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _finish(self, bag_ws, cells: List[Cell], end: int, call):
+        try:
+            call(bag_ws.batch_update, [{"range": rowcol_to_a1(r, c), "values": [[v]]} for r, c, v in cells],
+                 value_input_option="USER_ENTERED")
+        except Exception as e:
+            if not is_retryable(e):
+                # 거절된 요청은 아무것도 쓰지 않았다: 기록을 버리고 원장 줄은 미반영으로 둔다
+                os.remove(self._fold_path)
+            # 재시도 가능한 실패는 들어갔는지 알 수 없으니 기록을 남겨 다음 recover()가 다시 쓴다
+            raise
+        self._write_atomic(self._offset_path, str(end))
+        os.remove(self._fold_path)
+
+    def recover(self, bag_ws, call) -> bool:
+        """지난 접기가 가방 쓰기/오프셋 확정 전에 끊겼으면 같은 절대값으로 마저 끝낸다."""
+        try:
+            with open(self._fold_path, encoding="utf-8") as f:
+                rec = json.load(f)
+        except FileNotFoundError:
+            return False
+        logging.warning("ledger: finishing interrupted fold up to offset %d", rec["end"])
+        self._finish(bag_ws, [tuple(c) for c in rec["cells"]], int(rec["end"]), call)
+        return True
+
+    def fold(self, tokens: List[int], bag_ws, cells: List[Cell], call):
+        end = max(max(tokens), self._scan_end)
+        self._write_atomic(self._fold_path, json.dumps({"end": end, "cells": cells}, ensure_ascii=False))
+        self._finish(bag_ws, cells, end, call)
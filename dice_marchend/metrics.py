@@ -0,0 +1,53 @@
+import threading
+from typing import Dict, Any
+
+class Metrics:
+    """카운터/게이지/소요시간을 모아두는 가벼운 지표 레지스트리 (로그 출력용)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, list] = {}  # name -> [count, total, max]
+
+    def inc(self, name: str, n: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def set(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, sec: float):
+        with self._lock:
+            t = self._timings.get(name)
+            if t is None:
+                self._timings[name] = [1, sec, sec]
+            else:
+                t[0] += 1
+                t[1] += sec
+                if sec > t[2]:
+                    t[2] = sec
+
+    def get(self, name: str, default: float = 0):
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name]
+            return self._gauges.get(name, default)
+
+    def timing(self, name: str):
+        """(count, total, max). 구간별 평균을 내려면 호출자가 이전 값과의 차이를 쓴다."""
+        with self._lock:
+            t = self._timings.get(name)
+            return tuple(t) if t else (0, 0.0, 0.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._counters)
+            out.update(self._gauges)
+            for name, (cnt, total, mx) in self._timings.items():
+                out[name] = {"count": cnt, "avg": round(total / cnt, 4) if cnt else 0.0, "max": round(mx, 4)}
+            return out
+
+# 프로세스 전역 레지스트리
+metrics = Metrics()
@@ -1,14 +1,24 @@
 from dataclasses import dataclass
 from typing import Optional
 
-@dataclass
 class Runner:
-    handle: str
-    nickname: str
-    dorm: str
-    house_points: int
-    last_attend_date: str
-    last_confirm_date: str
+    """러너 시트 한 행. 인덱스에 러너 수만큼 상주하므로 __slots__로 가볍게 유지."""
+    __slots__ = ("row", "handle", "nickname", "dorm", "house_points", "last_attend_date", "last_confirm_date")
+
+    def __init__(self, handle: str, nickname: str = "", dorm: str = "", house_points: int = 0,
+                 last_attend_date: str = "", last_confirm_date: str = "", row: int = 0):
+        self.row = row  # 시트상의 1-based 행 번호
+        self.handle = handle
+        self.nickname = nickname
+        self.dorm = dorm
+        self.house_points = house_points
+        self.last_attend_date = last_attend_date
+        self.last_confirm_date = last_confirm_date
+
+    def __repr__(self):
+        return (f"Runner(row={self.row}, handle={self.handle!r}, nickname={self.nickname!r}, "
+                f"dorm={self.dorm!r}, house_points={self.house_points}, "
+                f"last_attend_date={self.last_attend_date!r}, last_confirm_date={self.last_confirm_date!r})")
 
 @dataclass
 class ExploreRow:
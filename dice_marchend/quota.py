@@ -0,0 +1,243 @@
+"""
+Google Sheets API 호출 한도 관리 (프로세스 전역 공유).
+- 읽기/쓰기 분당 한도를 토큰 버킷 2개로 모델링해 보내기 전에 기다린다(429를 맞고 나서가 아니라).
+- 우선순위: 백그라운드 호출(쓰기 버퍼 flush, 미리 갱신 등)은 버킷에 여유분(reserve)이 남아 있을 때만
+  토큰을 가져가므로, 유저 명령 처리 중인 호출이 먼저 나간다.
+- 429/5xx/네트워크 오류: Retry-After를 따르고, 없으면 지터를 섞은 지수 백오프. 429면 버킷 자체를 멈춰
+  다른 스레드도 같이 쉰다.
+- 회로 차단기: 연속 실패가 쌓이면 한동안 호출을 바로 SheetsUnavailable로 돌려보낸다.
+  (Sheets 쪽 스냅샷 캐시는 이때 마지막 스냅샷을 그대로 내준다)
+한도는 프로세스마다 따로 잡히므로, 봇과 autoscript를 같은 서비스 계정으로 돌리면
+SHEETS_READ_PER_MIN / SHEETS_WRITE_PER_MIN으로 나눠 가질 것.
+"""
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import requests
+from gspread.exceptions import APIError
+
+from .metrics import metrics
+
+READ, WRITE = "read", "write"
+
+# 이름으로 읽기 호출을 가려낸다. 나머지는 모두 쓰기로 센다(보수적으로).
+_READ_CALLS = {
+    "get_all_values", "get_all_records", "get", "get_values", "batch_get", "values_get",
+    "values_batch_get", "row_values", "col_values", "acell", "cell", "find", "findall",
+    "fetch_sheet_metadata", "worksheet", "worksheets", "open", "open_by_key",
+}
+_RETRY_CODES = (429, 500, 502, 503, 504)
+
+class SheetsUnavailable(RuntimeError):
+    """회로 차단 중이라 호출하지 않았음."""
+
+def status_of(e: APIError) -> Optional[int]:
+    """APIError의 HTTP 상태코드. (requests.Response는 4xx/5xx에서 bool()이 False라 truthiness로 거르면 안 됨)"""
+    code = getattr(e, "code", None)  # gspread 6
+    if isinstance(code, int):
+        return code
+    resp = getattr(e, "response", None)
+    code = getattr(resp, "status_code", None) if resp is not None else None
+    return code if isinstance(code, int) else None
+
+def is_retryable(e: BaseException) -> bool:
+    """한참 뒤에 다시 보내면 될 수도 있는 실패인가 (차단 중, 429/5xx, 네트워크). 나머지 4xx 등은 다시 보내도 같다."""
+    if isinstance(e, (SheetsUnavailable, requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    return isinstance(e, APIError) and status_of(e) in _RETRY_CODES
+
+def _retry_after(e: APIError) -> Optional[float]:
+    resp = getattr(e, "response", None)
+    headers = getattr(resp, "headers", None) or {}
+    try:
+        v = headers.get("Retry-After")
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class _Bucket:
+    __slots__ = ("capacity", "rate", "tokens", "stamp", "paused_until", "waiting_high")
+
+    def __init__(self, per_min: float):
+        self.capacity = max(1.0, float(per_min))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting_high = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+class SheetsQuota:
+    def __init__(self, read_per_min: float = 60, write_per_min: float = 60, reserve: float = 0.2,
+                 fail_threshold: int = 5, open_sec: float = 30.0, attempts: int = 5,
+                 backoff_base: float = 1.0, backoff_cap: float = 32.0):
+        self._cv = threading.Condition()
+        self._buckets = {READ: _Bucket(read_per_min), WRITE: _Bucket(write_per_min)}
+        self._reserve = reserve
+        self._fail_threshold = fail_threshold
+        self._open_sec = open_sec
+        self._attempts = attempts
+        self._base = backoff_base
+        self._cap = backoff_cap
+        self._fails = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._local = threading.local()
+
+    # ---------- 우선순위 ----------
+    @contextmanager
+    def background(self):
+        """이 블록 안에서 이 스레드가 하는 호출은 낮은 우선순위."""
+        prev = getattr(self._local, "background", False)
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = prev
+
+    def _is_background(self) -> bool:
+        return getattr(self._local, "background", False)
+
+    # ---------- 토큰 ----------
+    def acquire(self, kind: str):
+        """토큰 1개를 얻을 때까지 기다린다. 회로 차단 중이면 SheetsUnavailable."""
+        low = self._is_background()
+        b = self._buckets[kind]
+        need = 1.0 + (self._reserve * b.capacity if low else 0.0)
+        t0 = time.monotonic()
+        with self._cv:
+            # 차단기는 기다리기 전에 한 번만 본다. 기다리는 중에 다시 보면 half-open 시험 호출을 맡은
+            # 스레드가 자기 _probing에 걸려 튕기고, 차단기가 영영 열린 채로 남는다.
+            probe = self._check_breaker()
+            if not low:
+                b.waiting_high += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    b.refill(now)
+                    blocked = now < b.paused_until or (low and b.waiting_high > 0)
+                    if not blocked and b.tokens >= need:
+                        b.tokens -= 1.0
+                        break
+                    wait = max(b.paused_until - now, (need - b.tokens) / b.rate, 0.05)
+                    self._cv.wait(timeout=wait)
+            except BaseException:
+                if probe:
+                    self._probing = False
+                raise
+            finally:
+                if not low:
+                    b.waiting_high -= 1
+                    self._cv.notify_all()
+        waited = time.monotonic() - t0
+        if waited > 0.01:
+            metrics.observe(f"sheets.quota_wait_sec.{kind}", waited)
+
+    def pause(self, kind: str, sec: float):
+        """429를 맞았으면 이 종류의 호출 전체를 sec초 멈춘다."""
+        with self._cv:
+            b = self._buckets[kind]
+            b.tokens = 0.0
+            b.paused_until = max(b.paused_until, time.monotonic() + sec)
+
+    # ---------- 회로 차단기 ----------
+    def _check_breaker(self) -> bool:
+        """(self._cv 안에서 호출) 이 호출이 half-open 시험 호출을 맡았으면 True."""
+        if self._open_until == 0.0:
+            return False
+        if time.monotonic() < self._open_until or self._probing:
+            metrics.inc("sheets.breaker_rejected")
+            raise SheetsUnavailable("Google Sheets 응답이 불안정해 잠시 호출을 멈췄습니다.")
+        self._probing = True  # half-open: 한 건만 시험 삼아 보낸다
+        return True
+
+    def _record(self, ok: bool):
+        with self._cv:
+            if ok:
+                if self._open_until:
+                    logging.info("sheets breaker closed")
+                self._fails = 0
+                self._open_until = 0.0
+                self._probing = False
+            else:
+                self._fails += 1
+                if self._probing or self._fails >= self._fail_threshold:
+                    self._open_until = time.monotonic() + self._open_sec
+                    self._probing = False
+                    metrics.inc("sheets.breaker_opened")
+                    logging.warning("sheets breaker open for %.0fs (%d consecutive failures)",
+                                    self._open_sec, self._fails)
+            metrics.set("sheets.breaker_open", 1 if self._open_until else 0)
+            self._cv.notify_all()
+
+    def is_open(self) -> bool:
+        with self._cv:
+            return self._open_until != 0.0
+
+    # ---------- 호출 ----------
+    def _backoff(self, attempt: int) -> float:
+        d = min(self._cap, self._base * (2 ** attempt))
+        return d / 2 + random.uniform(0, d / 2)
+
+    def call(self, func, *args, **kwargs):
+        """한도/재시도/회로 차단을 적용해 gspread 호출."""
+        kind = READ if getattr(func, "__name__", "") in _READ_CALLS else WRITE
+        for attempt in range(self._attempts):
+            self.acquire(kind)
+            t0 = time.monotonic()
+            try:
+                res = func(*args, **kwargs)
+            except APIError as e:
+                metrics.observe("sheets.call_sec", time.monotonic() - t0)
+                code = status_of(e)
+                if code not in _RETRY_CODES:
+                    self._record(True)  # 요청 자체의 문제. 서버는 살아 있다
+                    raise
+                self._record(False)
+                wait = max(_retry_after(e) or 0.0, self._backoff(attempt))
+                if code == 429:
+                    metrics.inc("sheets.throttled")
+                    self.pause(kind, wait)
+                if attempt == self._attempts - 1:
+                    raise
+                time.sleep(wait)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                metrics.observe("sheets.call_sec", time.monotonic() - t0)
+                metrics.inc("sheets.network_errors")
+                self._record(False)
+                if attempt == self._attempts - 1:
+                    raise
+                time.sleep(self._backoff(attempt))
+            except Exception:
+                with self._cv:
+                    self._probing = False  # 시험 호출이 예상 밖 오류로 끝나도 차단기가 멈춰 있지 않게
+                raise
+            else:
+                metrics.observe("sheets.call_sec", time.monotonic() - t0)
+                self._record(True)
+                return res
+
+_shared: Optional[SheetsQuota] = None
+_shared_lock = threading.Lock()
+
+def shared_quota() -> SheetsQuota:
+    """프로세스 전역 SheetsQuota (처음 부를 때 환경변수로 만든다)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SheetsQuota(
+                read_per_min=float(os.environ.get("SHEETS_READ_PER_MIN", "60")),
+                write_per_min=float(os.environ.get("SHEETS_WRITE_PER_MIN", "60")),
+                reserve=float(os.environ.get("SHEETS_BG_RESERVE", "0.2")),
+                fail_threshold=int(os.environ.get("SHEETS_BREAKER_FAILS", "5")),
+                open_sec=float(os.environ.get("SHEETS_BREAKER_OPEN_SEC", "30")),
+            )
+        return _shared
@@ -0,0 +1,97 @@
+import time
+import threading
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+POST_PATH = "/api/v1/statuses"
+
+def _epoch(value: str) -> float:
+    """X-RateLimit-Reset / Date 헤더를 epoch 초로. 숫자(epoch), ISO 8601, HTTP 날짜 모두 받는다."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return parsedate_to_datetime(value).timestamp()
+
+class PostBudget:
+    """
+    Mastodon 응답 헤더(X-RateLimit-Remaining/Reset)를 따라가는 발송 예산(토큰 버킷).
+    api.ratelimit_* 값은 Mastodon.py가 모든 호출(스트림 재연결, 백필, instance() 등)마다 덮어쓰므로
+    쓰지 않고, api.session에 응답 훅을 걸어 글 게시(POST /api/v1/statuses) 응답의 헤더만 받아 둔다.
+    - 남은 요청이 reserve보다 많으면 min_gap만 지키고 바로 보낸다.
+    - reserve 이하로 떨어지면 리셋까지 남은 시간을 남은 요청 수로 나눠 고르게 보낸다.
+    - 0이면 리셋 시각까지 기다린다.
+    """
+
+    def __init__(self, api, reserve: int = 20, min_gap: float = 0.0):
+        self.api = api
+        self.reserve = max(0, int(reserve))
+        self.min_gap = max(0.0, float(min_gap))
+        self._lock = threading.Lock()
+        self._last = 0.0  # 마지막 발송 (monotonic)
+        self._remaining = None
+        self._reset = None  # 로컬 시계 기준 epoch
+        self._limit = None
+        session = getattr(api, "session", None)
+        if session is not None:
+            session.hooks.setdefault("response", []).append(self.on_response)
+
+    def on_response(self, resp, *args, **kwargs):
+        """requests 응답 훅. 글 게시 응답이면 헤더로 예산을 갱신한다."""
+        req = getattr(resp, "request", None)
+        if req is None or req.method != "POST" or urlparse(req.url).path.rstrip("/") != POST_PATH:
+            return None
+        h = resp.headers
+        if "X-RateLimit-Remaining" not in h or "X-RateLimit-Reset" not in h:
+            return None
+        try:
+            remaining = int(h["X-RateLimit-Remaining"])
+            limit = int(h["X-RateLimit-Limit"]) if "X-RateLimit-Limit" in h else None
+            reset = _epoch(h["X-RateLimit-Reset"])
+            if "Date" in h:
+                reset += time.time() - _epoch(h["Date"])  # 서버 시계 차이 보정
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            self._remaining, self._reset, self._limit = remaining, reset, limit
+        return None
+
+    def _headers(self):
+        with self._lock:
+            return self._remaining, self._reset, self._limit
+
+    def delay(self) -> float:
+        """지금부터 다음 발송까지 기다려야 하는 시간(초). 0이면 바로 보내도 된다."""
+        remaining, reset, _ = self._headers()
+        now_m = time.monotonic()
+        with self._lock:
+            since_last = now_m - self._last
+        gap = self.min_gap
+
+        if remaining is not None and reset is not None:
+            window_left = float(reset) - time.time()
+            if window_left > 0:
+                if remaining <= 0:
+                    return window_left
+                if remaining <= self.reserve:
+                    gap = max(gap, window_left / float(remaining))
+
+        return max(0.0, gap - since_last)
+
+    def record(self):
+        """방금 한 건 보냈음을 기록."""
+        with self._lock:
+            self._last = time.monotonic()
+
+    def state(self) -> dict:
+        remaining, reset, limit = self._headers()
+        return {
+            "remaining": remaining,
+            "limit": limit,
+            "reset_in": round(float(reset) - time.time(), 1) if reset is not None else None,
+        }
@@ -1,8 +1,13 @@
-import logging
+import logging, time
 from mastodon import Mastodon
 from .config import Config
 from .sheets import Sheets
 from .bot import DiceListener
+from .intake import Poller
+
+RECONNECT_MIN_SEC = 2.0    # 스트림 재연결 대기(초). 연속으로 끊기면 두 배씩
+RECONNECT_MAX_SEC = 60.0
+STABLE_STREAM_SEC = 60.0   # 이만큼 붙어 있었으면 대기 시간을 처음으로 되돌린다
 
 def main():
     cfg = Config()
@@ -10,11 +15,38 @@ def main():
     api = Mastodon(
         api_base_url=cfg.BASE_URL,
         access_token=cfg.ACCESS_TOKEN,
-        ratelimit_method="pace",
+        ratelimit_method="wait",  # 발송 페이싱은 DiceListener의 헤더 기반 예산이 맡는다
     )
     sheets = Sheets(cfg)
     listener = DiceListener(api, sheets, cfg)
-    api.stream_user(listener)
+    try:
+        if cfg.INTAKE_MODE == "poll":
+            Poller(api, listener, cfg.POLL_MIN_SEC, cfg.POLL_MAX_SEC).run()
+        else:
+            _stream_forever(api, listener)
+    finally:
+        sheets.close()  # 버퍼에 남은 시트 쓰기를 내보내고 종료
+
+def _stream_forever(api, listener):
+    wait = RECONNECT_MIN_SEC
+    while True:
+        # 붙기 전에 놓친 멘션부터 메우고, 붙은 뒤에도 같은 지점부터 한 번 더 (이미 받은 건 저널/LRU에서 걸러짐)
+        since = listener.cursor()
+        try:
+            listener.backfill(since)
+        except Exception as e:
+            logging.exception("backfill failed: %s", e)
+        listener.resume_from(since if since is not None else listener.cursor())
+        started = time.monotonic()
+        try:
+            api.stream_user(listener)
+            logging.warning("stream closed")
+        except Exception as e:
+            logging.warning("stream disconnected: %s", e)
+        if time.monotonic() - started >= STABLE_STREAM_SEC:
+            wait = RECONNECT_MIN_SEC
+        time.sleep(wait)
+        wait = min(wait * 2, RECONNECT_MAX_SEC)
 
 if __name__ == "__main__":
     main()
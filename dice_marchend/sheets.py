@@ -2,14 +2,227 @@ from __future__ import annotations
 import os, gspread
 import time
 import random
+import atexit
+import logging
 import threading
+from collections import OrderedDict
 
 from oauth2client.service_account import ServiceAccountCredentials
 from typing import Dict, Tuple, List, Optional
 from .models import Runner, ExploreRow
 from .config import Config
-from .utils import today_ymd
-from gspread.exceptions import APIError
+from .utils import today_ymd, to_int
+from .metrics import metrics
+from .ledger import SheetLedger, FileLedger, LEDGER_HEADER
+from .explore_graph import ExploreGraph
+from .quota import shared_quota, SheetsUnavailable
+from .writebuffer import WriteBuffer, _appended_row, _set_cell, _bump_cell
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import absolute_range_name, fill_gaps
+
+class SnapshotCache:
+    """
+    워크시트 스냅샷 캐시.
+    - single-flight: 같은 시트를 여러 스레드가 동시에 받으러 가지 않는다(하나만 받고 나머지는 기다림).
+    - stale-while-revalidate: TTL의 REFRESH_AHEAD 비율을 넘기면 백그라운드로 새로 받고,
+      그동안(또는 만료 후에도) 다른 스레드는 이전 스냅샷을 그대로 쓴다.
+    - version: 내용이 실제로 바뀌었을 때만 1 증가. 내용이 같으면 이전 rows 객체를 그대로 유지해
+      그 위에 만든 인덱스와 제자리 패치가 살아남는다.
+    invalidate()만 다음 읽기를 블로킹 재적재로 만든다(행 추가 직후 등).
+    단, 시트 회로 차단 중(SheetsUnavailable)이면 무효화된 스냅샷이라도 마지막 것을 내준다.
+    overlay(key, rows, since)는 새 rows에 아직 안 나간 쓰기를 덧씌우는 함수. 덧씌우기와 바꿔 끼우기를
+    patch()와 같은 락 안에서 하므로, 그 사이에 들어온 쓰기가 옛 rows에만 남고 새 rows에서 빠지지 않는다.
+    """
+    REFRESH_AHEAD = 0.8
+
+    class _Entry:
+        __slots__ = ("rows", "loaded_at", "version", "gen", "valid", "loading", "error", "loader")
+
+        def __init__(self):
+            self.rows = None
+            self.loaded_at = 0.0
+            self.version = 0
+            self.gen = 0          # invalidate() 때 증가. 진행 중이던 이전 세대 적재 결과는 버린다
+            self.valid = False
+            self.loading = None   # 진행 중인 적재의 threading.Event
+            self.error = None
+            self.loader = None    # since -> rows
+
+    def __init__(self, overlay=None):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, "SnapshotCache._Entry"] = {}
+        self._overlay = overlay
+
+    def _entry(self, key: str) -> "SnapshotCache._Entry":
+        e = self._entries.get(key)
+        if e is None:
+            e = self._entries[key] = SnapshotCache._Entry()
+        return e
+
+    def get(self, key: str, loader, ttl: float):
+        """(rows, version)을 반환. loader(since)는 시트 전체를 읽어 rows를 돌려주는 함수."""
+        while True:
+            with self._lock:
+                e = self._entry(key)
+                e.loader = loader
+                if e.valid:
+                    if time.time() - e.loaded_at > ttl * self.REFRESH_AHEAD and e.loading is None:
+                        self._start(key, e, background=True)
+                        metrics.inc("sheets.cache_bg_refresh")
+                    return e.rows, e.version
+                ev = e.loading
+                owner = ev is None
+                if owner:
+                    ev = e.loading = threading.Event()
+                    gen = e.gen
+            if owner:
+                self._load(key, e, ev, gen, background=False)
+            else:
+                metrics.inc("sheets.cache_singleflight_waits")
+                ev.wait()
+            with self._lock:
+                if e.error is not None and not e.valid:
+                    if isinstance(e.error, SheetsUnavailable) and e.rows is not None:
+                        metrics.inc("sheets.served_stale")
+                        return e.rows, e.version
+                    raise e.error
+
+    def _start(self, key, e, background: bool):
+        """(self._lock 안에서 호출) 백그라운드 적재 시작."""
+        ev = e.loading = threading.Event()
+        threading.Thread(target=self._load, args=(key, e, ev, e.gen, background), daemon=True).start()
+
+    def _load(self, key, e, ev, gen, background: bool):
+        start = time.time()
+        try:
+            if background:
+                with shared_quota().background():
+                    rows = e.loader(start)
+            else:
+                rows = e.loader(start)
+            with self._lock:
+                if gen == e.gen:
+                    if self._overlay is not None:
+                        self._overlay(key, rows, start)
+                    if e.rows is None or rows != e.rows:
+                        e.rows = rows
+                        e.version += 1
+                    e.loaded_at = start
+                    e.valid = True
+                    e.error = None
+        except Exception as err:
+            with self._lock:
+                e.error = err
+            if background:
+                logging.warning("background refresh of %s failed: %s", key, err)
+        finally:
+            with self._lock:
+                if e.loading is ev:
+                    e.loading = None
+            ev.set()
+
+    def stale_gen(self, key: str, ttl: float) -> Optional[int]:
+        """비었거나 곧 만료될(=get()이 다시 받으러 갈) 스냅샷이면 현재 세대, 아니면 None."""
+        with self._lock:
+            e = self._entry(key)
+            if e.valid and time.time() - e.loaded_at <= ttl * self.REFRESH_AHEAD:
+                return None
+            return e.gen
+
+    def fill(self, key: str, rows, started: float, gen: int, loader) -> bool:
+        """
+        밖에서 받아 온 rows로 채운다(일괄 선적재용). 그사이 무효화됐거나(gen 변경)
+        더 최근에 적재된 스냅샷이 있으면 버린다.
+        """
+        with self._lock:
+            e = self._entry(key)
+            if gen != e.gen or (e.valid and e.loaded_at > started):
+                return False
+            e.loader = loader
+            if self._overlay is not None:
+                self._overlay(key, rows, started)
+            if e.rows is None or rows != e.rows:
+                e.rows = rows
+                e.version += 1
+            e.loaded_at = started
+            e.valid = True
+            e.error = None
+            return True
+
+    def refresh(self, key: str):
+        """이전 스냅샷은 계속 쓰게 두고 백그라운드로 새로 받는다."""
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None and e.loader is not None and e.loading is None:
+                self._start(key, e, background=True)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            e = self._entry(key)
+            e.valid = False
+            e.gen += 1
+            e.loading = None  # 이전 세대 적재는 결과를 버리므로 새로 시작하게 한다
+
+    def supersede(self, key: str):
+        """
+        진행 중인 적재/선적재 결과만 버린다(세대만 올림). 지금 스냅샷은 그대로 쓴다.
+        시트에 직접 쓴 직후, 그 전에 시작된 읽기가 쓴 내용을 덮어쓰지 않게 할 때.
+        """
+        with self._lock:
+            e = self._entry(key)
+            e.gen += 1
+            e.loading = None
+
+    def patch(self, key: str, fn):
+        """
+        fn(rows)를 캐시 락 안에서 부른다. rows는 현재 스냅샷(무효화된 것 포함, 없으면 None).
+        버퍼에 넣기와 스냅샷 제자리 수정을 fn 안에서 같이 하면 적재 중인 새 rows와 엇갈리지 않는다.
+        """
+        with self._lock:
+            e = self._entries.get(key)
+            fn(e.rows if e is not None else None)
+
+    def version(self, key: str) -> int:
+        with self._lock:
+            e = self._entries.get(key)
+            return e.version if e is not None else 0
+
+class _StripeGuard:
+    """여러 줄무늬 락을 정해진 순서(인덱스 오름차순)로 잡고 역순으로 푼다."""
+    __slots__ = ("_locks",)
+
+    def __init__(self, locks):
+        self._locks = locks
+
+    def __enter__(self):
+        for lk in self._locks:
+            if not lk.acquire(blocking=False):
+                t0 = time.monotonic()
+                lk.acquire()
+                metrics.inc("sheets.lock_contended")
+                metrics.observe("sheets.lock_wait_sec", time.monotonic() - t0)
+        metrics.inc("sheets.lock_acquired")
+        return self
+
+    def __exit__(self, *exc):
+        for lk in reversed(self._locks):
+            lk.release()
+        return False
+
+class StripedLocks:
+    """
+    리소스 키(예: ("runner", handle), ("limit", handle))를 고정 개수의 RLock에 해시로 나눠 건다.
+    서로 다른 유저/리소스는 대부분 다른 줄무늬에 걸려 병렬로 진행되고, 레지스트리가 없으니
+    락을 찾는 데 전역 락도 필요 없다. 대기 시간은 지표(sheets.lock_wait_sec)로 남긴다.
+    ⚠ guard()를 중첩해서 잡지 말 것 — 한 번에 필요한 키를 모두 넘겨야 순서가 보장된다.
+    """
+
+    def __init__(self, n: int = 64):
+        self._locks = [threading.RLock() for _ in range(max(1, n))]
+
+    def guard(self, *keys) -> _StripeGuard:
+        idx = sorted(set(hash(k) % len(self._locks) for k in keys))
+        return _StripeGuard([self._locks[i] for i in idx])
 
 class Sheets:
     def __init__(self, cfg: Config):
@@ -30,56 +243,200 @@ class Sheets:
         self.ws_config = self.doc.worksheet("설정")
 
         self.ws_bag = None
+        self.shop_doc = None
         if cfg.SHOP_SHEET_NAME:
             try:
-                shop_doc = self.client.open(cfg.SHOP_SHEET_NAME)
-                self.ws_bag = shop_doc.worksheet(cfg.SHOP_BAG_WS)
+                self.shop_doc = self.client.open(cfg.SHOP_SHEET_NAME)
+                self.ws_bag = self.shop_doc.worksheet(cfg.SHOP_BAG_WS)
             except Exception:
                 self.ws_bag = None
 
         self._config_map: Optional[Dict[str, str]] = None
-        self._config_loaded_at = 0.0
+        self._config_ver = 0  # _config_map을 만든 '설정' 스냅샷 버전
         self._config_ttl_sec = int(os.environ.get("CONFIG_TTL_SEC", "1800"))  # 기본 30분
 
+        self._quota = shared_quota()  # 읽기/쓰기 분당 한도 + 재시도 + 회로 차단 (autoscript와 같은 구현)
         self._config_lock = threading.Lock()  # 설정 캐시 보호용
-        self._locks_master = threading.Lock()  # per-user 락 딕셔너리 보호용
-        self._locks = {}  # handle(또는 key) -> threading.Lock()
-        self._sheet_cache = {}  # { key: (loaded_at, rows) }
+        self._stripes = StripedLocks(int(os.environ.get("LOCK_STRIPES", "64")))  # 리소스별 줄무늬 락
         self._sheet_cache_ttl = 3.0  # 초 단위(2~5초 권장). 짧은 ‘마이크로 캐시’.
+        # 시트별 TTL 재정의. 러너는 봇의 쓰기가 인덱스에 바로 반영되므로
+        # 사람이 시트를 직접 고친 것만 따라잡으면 된다.
+        self._sheet_cache_ttls = {
+            "러너": float(os.environ.get("RUNNER_TTL_SEC", "30")),
+            "가방": float(os.environ.get("BAG_TTL_SEC", "30")),
+            "설정": float(self._config_ttl_sec),
+        }
+
+        # prefetch()가 한 번에 받아 둘 수 있는 시트: key -> (문서, 워크시트)
+        # 제한/참여기록은 인덱스를 다시 만들 때만(하루 1번/내려간 공지) 쓰기를 내보내고 새로 읽으므로 뺀다
+        self._prefetch_sources = {
+            "러너": (self.doc, self.ws_runner),
+            "탐색": (self.doc, self.ws_explore),
+            "세션": (self.doc, self.ws_session),
+            "설정": (self.doc, self.ws_config),
+        }
+        if self.ws_bag:
+            self._prefetch_sources["가방"] = (self.shop_doc, self.ws_bag)
+
+        # 가방 행렬 인덱스 (아이템명 -> 행, 유저 열 이름 -> 열)
+        self._bag_lock = threading.Lock()
+        self._bag_ver = -1  # 인덱스를 만든 스냅샷 버전
+        self._bag_items: Dict[str, int] = {}
+        self._bag_users: Dict[str, int] = {}
+        self._bag_next_row = 2
+        self._bag_next_col = 2
+
+        # 탐색 그래프 (스냅샷 내용이 바뀔 때만 재컴파일)
+        self._explore_lock = threading.Lock()
+        self._explore_graph: Optional[ExploreGraph] = None
+
+        # 참여기록 인덱스: 공지ID -> {(유형, 유저명)} (오래 안 쓴 공지부터 메모리에서 내림)
+        self._particip_lock = threading.Lock()
+        self._particip: Optional[OrderedDict] = None
+        self._particip_evicted: set = set()
+        self._particip_stale = False  # 버퍼가 참여기록 추가를 버림 -> 다음 조회 때 다시 스캔
+        self._particip_max_notices = int(os.environ.get("PARTICIP_MAX_NOTICES", "200"))
+
+        # 오늘자 탐색 횟수 카운터: handle -> [행번호, 횟수]
+        self._limit_lock = threading.Lock()
+        self._limit_day: Optional[str] = None
+        self._limit_stale = False  # 같은 날 안에서 시트 기준으로 다시 색인할 것 (버퍼가 쓰기를 버림 등)
+        self._limit_counts: Dict[str, list] = {}
+        self._limit_cols = (0, 1, 2)
+        self._limit_row_lock = threading.Lock()  # 추가 중인 행의 [행번호, 횟수] (append 응답 콜백과 공유)
+
+        # 셀 쓰기는 write-behind 버퍼로 모아서 batch_update
+        self._writes = WriteBuffer(
+            self._with_retry,
+            interval=float(os.environ.get("WRITE_FLUSH_SEC", "1.0")),
+            max_cells=int(os.environ.get("WRITE_FLUSH_MAX_CELLS", "50")),
+            on_drop=self._on_write_dropped,
+        )
+        atexit.register(self.close)
+        # { key: 스냅샷 } single-flight + stale-while-revalidate. 새 스냅샷엔 버퍼의 쓰기를 덧씌운다
+        self._cache = SnapshotCache(overlay=self._writes.apply_to)
+
+        # 원장 모드: 지급은 원장에 덧붙이고, 압축기가 주기적으로 가방에 접어 넣는다
+        self._ledger = None
+        self._ledger_compact_lock = threading.Lock()
+        if (cfg.BAG_MODE or "").lower() == "ledger" and self.ws_bag:
+            self._ledger = self._open_ledger()
+            threading.Thread(target=self._compactor, daemon=True).start()
+
+        # 러너 인덱스: 스냅샷 1회당 1번 만들고, 봇의 쓰기는 제자리 갱신
+        self._runner_lock = threading.Lock()
+        self._runner_add_lock = threading.Lock()  # 새 러너 행 추가만 한 줄로 (조회는 막지 않는다)
+        self._runner_ver = -1  # 인덱스를 만든 스냅샷 버전
+        self._runner_by_handle: Dict[str, Runner] = {}
+        self._runner_by_row: Dict[int, Runner] = {}
 
     def lock_for(self, key: str):
         """key(보통 handle) 기준의 per-user 락을 돌려준다."""
-        if not key:
-            # 방어: 빈 키면 전역락처럼 동작
-            return self._locks_master
-
-        with self._locks_master:
-            lk = self._locks.get(key)
+        return self._stripes.guard(("user", key or ""))
 
-            if lk is None:
-                lk = threading.Lock()
-                self._locks[key] = lk
-
-            return lk
-
-    def atomic(self):
-        return self._locks_master
+    def locked(self, *resources):
+        """
+        리소스 단위 락. 예) sheets.locked(("runner", acct), ("limit", acct))
+        필요한 리소스를 한 번에 모두 넘길 것(중첩 금지).
+        """
+        return self._stripes.guard(*resources)
+
+    def flush(self):
+        """버퍼에 쌓인 셀 쓰기를 즉시 시트로 내보낸다."""
+        self._writes.flush()
+
+    def close(self):
+        """종료 훅: 남은 쓰기를 모두 내보낸다. 여러 번 불러도 안전."""
+        self._writes.close()
+
+    # ---------- 원장(거래기록) ----------
+    def _open_ledger(self):
+        if self.cfg.LEDGER_PATH:
+            ledger = FileLedger(self.cfg.LEDGER_PATH)
+            self._writes.add_flush_hook(ledger.flush)
+            return ledger
+        try:
+            ws = self.shop_doc.worksheet(self.cfg.LEDGER_WS)
+        except WorksheetNotFound:
+            ws = self.shop_doc.add_worksheet(title=self.cfg.LEDGER_WS, rows=1000, cols=len(LEDGER_HEADER))
+            self._with_retry(ws.append_row, LEDGER_HEADER, value_input_option="USER_ENTERED")
+        key = self.cfg.LEDGER_WS
+        return SheetLedger(ws, self._writes, lambda: self._read_all_cached(ws, key), key=key)
+
+    def _compactor(self):
+        while True:
+            time.sleep(self.cfg.LEDGER_COMPACT_SEC)
+            try:
+                with self._quota.background():
+                    n = self.compact_ledger()
+                if n:
+                    logging.info("ledger compacted: %d entries folded into bag", n)
+            except Exception as e:
+                logging.exception("ledger compaction failed: %s", e)
+
+    def compact_ledger(self) -> int:
+        """
+        원장에서 아직 반영 안 된 지급을 가방 행렬에 접어 넣는다. 반영한 건수를 반환.
+        가방 셀(절대값)과 반영 표시는 원장의 fold()가 함께 확정하므로, 어디서 끊겨도
+        다음 압축이 같은 지급을 두 번 더하거나 빠뜨리지 않는다.
+        """
+        if not self._ledger:
+            return 0
+        with self._ledger_compact_lock:
+            self._ledger.flush()  # 메모리에 쌓인 추가분부터 원장에 내보내고
+            if self._ledger.recover(self.ws_bag, self._with_retry):
+                self._invalidate_cache("가방")
+                self._bag_ver = -1
+            if isinstance(self._ledger, SheetLedger):
+                self._invalidate_cache(self.cfg.LEDGER_WS)
+            entries = self._ledger.unapplied()
+            if not entries:
+                return 0
+            staged: Dict[Tuple[int, int], object] = {}
+            try:
+                with self._bag_lock:
+                    # 기준 잔액은 시트에 확정된 값에서 (메모리에만 있던 값 위에 접지 않도록)
+                    self._invalidate_cache("가방")
+                    vals = self._bag_matrix()
+                    for _, handle, key, delta in entries:
+                        col = self._bag_user_col(handle)
+                        row = self._bag_row_of(key)
+                        cur = staged.get((row, col))
+                        if cur is None:
+                            cur = vals[row - 1][col - 1] if row <= len(vals) and col <= len(vals[row - 1]) else ""
+                        staged[(row, col)] = int(cur or 0) + delta
+                self._ledger.fold([tok for tok, *_ in entries], self.ws_bag,
+                                  [(r, c, v) for (r, c), v in staged.items()], self._with_retry)
+            finally:
+                # 성공/실패 어느 쪽이든 가방 인덱스(새 행/열 할당 포함)는 시트 기준으로 다시 만든다
+                self._invalidate_cache("가방")
+                self._bag_ver = -1
+            metrics.inc("ledger.compacted", len(entries))
+            return len(entries)
+
+    def write_stats(self) -> Dict[str, int]:
+        flushed = metrics.get("sheets.writes_flushed") + metrics.get("sheets.appends_flushed")
+        batches = metrics.get("sheets.write_batches") + metrics.get("sheets.append_batches")
+        return {
+            "queued": metrics.get("sheets.writes_queued"),
+            "coalesced": metrics.get("sheets.writes_coalesced"),
+            "flushed_cells": metrics.get("sheets.writes_flushed"),
+            "flushed_rows": metrics.get("sheets.appends_flushed"),
+            "batch_calls": batches,
+            "api_calls_saved": max(0, flushed - batches),
+            "pending": self._writes.pending_count(),
+        }
 
     def force_reload(self):
-        """다음 get_config() 호출 때 다시 불러오도록 캐시 무효화"""
-        with self._config_lock:
-            self._config_map = None
-            self._config_loaded_at = 0.0
+        """설정을 백그라운드로 다시 불러온다. 새로 받는 동안에도 이전 설정을 계속 쓴다."""
+        self._cache.refresh("설정")
 
     # ---------- 설정 ----------
     def get_config(self) -> Dict[str, str]:
-        now = time.time()
-
-        if (self._config_map is not None) and (now - self._config_loaded_at <= self._config_ttl_sec):
+        rows, ver = self._read_versioned(self.ws_config, "설정")
+        if self._config_map is not None and ver == self._config_ver:
             return self._config_map
 
-        rows = self._with_retry(self.ws_config.get_all_values)
-
         mp: Dict[str, str] = {}
         for r in rows[1:]:
             if len(r) >= 2 and r[0].strip():
@@ -87,15 +444,24 @@ class Sheets:
 
         with self._config_lock:
             self._config_map = mp
-            self._config_loaded_at = now
+            self._config_ver = ver
         return mp
 
-    # ---------- 러너 ----------
-    def get_runner_row(self, handle: str) -> Tuple[int, Runner]:
-
-        vals = self._read_all_cached(self.ws_runner, "러너")
+    def peek_config(self) -> Optional[Dict[str, str]]:
+        """I/O 없이 캐시된 설정만 돌려준다. 아직 없으면 None."""
+        return self._config_map
 
-        header = {k: i for i, k in enumerate(vals[0])}
+    # ---------- 러너 ----------
+    def _runner_index(self) -> Dict[str, Runner]:
+        """러너 스냅샷이 바뀌었을 때만 handle -> Runner 인덱스를 다시 만든다."""
+        vals, ver = self._read_versioned(self.ws_runner, "러너")
+        with self._runner_lock:
+            if ver != self._runner_ver:
+                self._build_runner_index(vals, ver)
+            return self._runner_by_handle
+
+    def _build_runner_index(self, vals, ver: int):
+        header = {k: i for i, k in enumerate(vals[0])} if vals else {}
         cu = header.get("유저명"); cn = header.get("닉네임")
         cd = header.get("기숙사"); cp = header.get("기숙사점수")
         ca = header.get("출석마지막일"); cc = header.get("이벤트확인마지막일")
@@ -103,149 +469,211 @@ class Sheets:
         if None in (cu, cn, cd, cp, ca, cc):
             raise RuntimeError("시트 리딩 오류.")
 
+        by_handle: Dict[str, Runner] = {}
+        by_row: Dict[int, Runner] = {}
         for r, row in enumerate(vals[1:], start=2):
-            if (row[cu] or "").strip() == handle:
-                return r, Runner(
-                    handle=handle,
-                    nickname=row[cn] or "",
-                    dorm=row[cd] or "",
-                    house_points=int(row[cp] or 0),
-                    last_attend_date=row[ca] or "",
-                    last_confirm_date=row[cc] or "",
-                )
-        # 없으면 추가: [유저명, 닉네임, 기숙사, 점수, 출석, 확인]
-        self.ws_runner.append_row([handle, "", "", "0", "", ""], value_input_option="USER_ENTERED")
+            handle = (row[cu] or "").strip()
+            if not handle or handle in by_handle:
+                continue  # 중복 행은 첫 행만 인정 (기존 선형 탐색과 동일)
+            rec = Runner(
+                handle=handle,
+                nickname=row[cn] or "",
+                dorm=row[cd] or "",
+                house_points=to_int(row[cp]),  # 칸 하나가 깨져도 인덱스 전체가 죽지 않게
+                last_attend_date=row[ca] or "",
+                last_confirm_date=row[cc] or "",
+                row=r,
+            )
+            by_handle[handle] = rec
+            by_row[r] = rec
+
+        self._runner_by_handle = by_handle
+        self._runner_by_row = by_row
+        self._runner_ver = ver
+
+    def get_runner_row(self, handle: str) -> Tuple[int, Runner]:
+        rec = self._runner_index().get(handle)
+        if rec is not None:
+            return rec.row, rec
+
+        with self._runner_add_lock:
+            # 락을 기다리는 사이 다른 스레드가 먼저 추가했을 수 있음
+            rec = self._runner_by_handle.get(handle)
+            if rec is not None:
+                return rec.row, rec
+
+            # 없으면 추가: [유저명, 닉네임, 기숙사, 점수, 출석, 확인]. 네트워크 호출은 _runner_lock 밖에서
+            resp = self._with_retry(self.ws_runner.append_row, [handle, "", "", "0", "", ""],
+                                    value_input_option="USER_ENTERED")
+            # 추가 전에 시작된 갱신/선적재가 새 행 없는 스냅샷으로 인덱스를 다시 만들지 않게
+            self._cache.supersede("러너")
+            row = _appended_row(resp)
+            if row:
+                rec = Runner(handle=handle, row=row)
+                with self._runner_lock:
+                    self._runner_by_handle[handle] = rec
+                    self._runner_by_row[row] = rec
+                return row, rec
+
+        # 응답에서 행 번호를 못 읽었으면 스냅샷을 새로 받아 인덱스 재구성
         self._invalidate_cache("러너")
         return self.get_runner_row(handle)
 
-    def update_runner_nickname(self, row_idx: int, nickname: str):
-        self._with_retry(self.ws_runner.update_cell, row_idx, 2, nickname)  # 2=닉네임
-        self._invalidate_cache("러너")
+    def peek_runner(self, handle: str) -> Optional[Runner]:
+        """I/O도 락도 없이 인덱스에 있는 러너만 돌려준다. (조금 오래됐을 수 있음 — 표기용)"""
+        return self._runner_by_handle.get(handle)
 
-    def update_runner_points(self, row_idx: int, new_points: int):
-        self._with_retry(self.ws_runner.update_cell, row_idx, 4, new_points)
-        self._invalidate_cache("러너")
+    def _runner_at(self, row_idx: int) -> Optional[Runner]:
+        with self._runner_lock:
+            return self._runner_by_row.get(row_idx)
+
+    def update_runner_nickname(self, row_idx: int, nickname: str):
+        self._write_cell("러너", self.ws_runner, row_idx, 2, nickname)  # 2=닉네임
+        rec = self._runner_at(row_idx)
+        if rec is not None:
+            rec.nickname = nickname
+
+    def add_runner_points(self, row_idx: int, delta: int):
+        """기숙사점수 += delta. 시트 값은 flush 때 새로 읽어 더하므로 사람이 고친 점수를 덮어쓰지 않는다."""
+        self._add_cell("러너", self.ws_runner, row_idx, 4, delta)  # 4=기숙사점수
+        rec = self._runner_at(row_idx)
+        if rec is not None:
+            rec.house_points += delta
 
     def update_runner_last_attend(self, row_idx: int, ymd: str):
-        self._with_retry(self.ws_runner.update_cell, row_idx, 5, ymd)
-        self._invalidate_cache("러너")
-        # 4 = 출석마지막일 (1-based index)
+        self._write_cell("러너", self.ws_runner, row_idx, 5, ymd)
+        rec = self._runner_at(row_idx)
+        if rec is not None:
+            rec.last_attend_date = ymd
+        # 5 = 출석마지막일 (1-based index)
 
     def update_runner_last_confirm(self, row_idx: int, ymd: str):
-        self._with_retry(self.ws_runner.update_cell, row_idx, 6, ymd)
-        self._invalidate_cache("러너")
-        # 5 = 이벤트확인마지막일 (1-based index)
+        self._write_cell("러너", self.ws_runner, row_idx, 6, ymd)
+        rec = self._runner_at(row_idx)
+        if rec is not None:
+            rec.last_confirm_date = ymd
+        # 6 = 이벤트확인마지막일 (1-based index)
 
     # ---------- 제한(탐색 하루 N회) ----------
-    def get_today_limit(self, handle: str) -> int:
+    # 오늘 날짜의 행만 handle -> [행번호, 횟수]로 들고 있다. 날짜가 바뀌면(현지 자정)
+    # 다음 조회 때 시트를 한 번 다시 읽어 그날 행만 남긴다. 증가분은 write-behind 버퍼로.
+    # 같은 날 다시 색인할 때는 메모리의 항목(아직 버퍼에 있는 행 포함)을 시트 내용에 합친다.
+    # 새 행은 append_rows로 붙이고(격자가 모자라도 늘어남), 행 번호는 응답을 받은 뒤에 채운다.
+    def _limits_today(self) -> Dict[str, list]:
+        """오늘자 카운터. (_limit_lock 안에서 호출)"""
         ymd = today_ymd(self.cfg.TIMEZONE)
+        if ymd == self._limit_day and not self._limit_stale:
+            return self._limit_counts
+
+        self._writes.flush(keys=["제한"])
+        self._invalidate_cache("제한")
         vals = self._read_all_cached(self.ws_limits, "제한")
-        header = {k: i for i, k in enumerate(vals[0])}
+        header = {k: i for i, k in enumerate(vals[0])} if vals else {}
         cu = header.get("유저명"); cd = header.get("날짜"); cc = header.get("탐색_사용횟수")
-
         if None in (cu, cd, cc):
-            raise RuntimeError("제한 확인")
+            raise RuntimeError("제한 시트 헤더(유저명/날짜/탐색_사용횟수)를 확인하세요.")
 
+        counts: Dict[str, list] = {}
         for r, row in enumerate(vals[1:], start=2):
-            if (row[cu] or "").strip() == handle and (row[cd] or "").strip() == ymd:
-                return int(row[cc] or 0)
+            if (row[cd] or "").strip() != ymd:
+                continue
+            handle = (row[cu] or "").strip()
+            if handle and handle not in counts:
+                counts[handle] = [r, to_int(row[cc])]
+
+        self._limit_cols = (cu, cd, cc)
+        if ymd == self._limit_day:
+            # flush가 실패했거나 차단 중이라 오래된 스냅샷을 받았으면 버퍼에 남은 행/증가분이 빠져 있다.
+            # 기존 항목을 그대로 살리고(append 콜백이 같은 객체를 채운다) 횟수는 큰 쪽을 따른다.
+            queued = {(row[cu] or "").strip() for row in self._writes.pending_rows("제한")
+                      if (row[cd] or "").strip() == ymd}
+            for handle, ent in self._limit_counts.items():
+                got = counts.get(handle)
+                with self._limit_row_lock:
+                    if got is not None:
+                        ent[0] = ent[0] or got[0]
+                        ent[1] = max(ent[1], got[1])
+                    elif ent[0] is None and handle not in queued:
+                        self._append_limit_row(handle, ent)  # 버퍼가 버린 행: 지금 횟수로 다시 붙인다
+                counts[handle] = ent
+
+        self._limit_counts = counts
+        self._limit_day = ymd
+        self._limit_stale = False
+        return counts
 
-        return 0
+    def get_today_limit(self, handle: str) -> int:
+        with self._limit_lock:
+            ent = self._limits_today().get(handle)
+            return ent[1] if ent else 0
 
     def inc_today_limit(self, handle: str):
-        ymd = today_ymd(self.cfg.TIMEZONE)
-
-        # 1) 읽기는 마이크로 캐시 사용
-        vals = self._read_all_cached(self.ws_limits, "제한")
-        header = {k: i for i, k in enumerate(vals[0])}
-        cu = header.get("유저명");
-        cd = header.get("날짜");
-        cc = header.get("탐색_사용횟수")
-        if None in (cu, cd, cc):
-            raise RuntimeError("제한 시트 헤더(유저명/날짜/탐색_사용횟수)를 확인하세요.")
-
-        # 2) 오늘 행이 있으면 +1 (⚠ gspread는 1-based 인덱스)
-        for r, row in enumerate(vals[1:], start=2):
-            if (row[cu] or "").strip() == handle and (row[cd] or "").strip() == ymd:
-                cur = int(row[cc] or 0) + 1
-                self._with_retry(self.ws_limits.update_cell, r, cc + 1, cur)
-                self._invalidate_cache("제한")  # ← 쓰기 후 캐시 무효화
+        with self._limit_lock:
+            counts = self._limits_today()
+            cu, cd, cc = self._limit_cols
+            ent = counts.get(handle)
+            if ent is not None:
+                with self._limit_row_lock:
+                    ent[1] += 1
+                    if ent[0] is not None:
+                        # 오늘 행이 있으면 +1 (⚠ gspread는 1-based 인덱스)
+                        self._write_cell("제한", self.ws_limits, ent[0], cc + 1, ent[1])
+                    # 행 번호를 아직 모르면 append 콜백이 늘어난 횟수를 써 준다
                 return
 
-        # 3) 없으면 새 행 추가
-        self._with_retry(self.ws_limits.append_row, [handle, ymd, 1], value_input_option="USER_ENTERED")
-        self._invalidate_cache("제한")
+            # 없으면 버퍼로 행을 추가한다
+            ent = counts[handle] = [None, 1]
+            self._append_limit_row(handle, ent)
+
+    def _append_limit_row(self, handle: str, ent: list):
+        cu, cd, cc = self._limit_cols
+        row = [""] * (max(cu, cd, cc) + 1)
+        row[cu], row[cd], row[cc] = handle, self._limit_day, ent[1]
+        self._writes.append("제한", self.ws_limits, row,
+                            on_row=lambda r, ent=ent: self._limit_row_placed(ent, r))
+
+    def _limit_row_placed(self, ent: list, row: Optional[int]):
+        """새 제한 행이 시트에 붙은 뒤 (flush 스레드). 그사이 늘어난 횟수가 있으면 그 칸을 쓴다."""
+        if row is None:
+            self._limit_stale = True  # 응답에서 행 번호를 못 읽었으면 다음 조회 때 다시 색인
+            return
+        with self._limit_row_lock:
+            ent[0] = row
+            if ent[1] != 1:
+                self._write_cell("제한", self.ws_limits, row, self._limit_cols[2] + 1, ent[1])
 
     # ---------- 탐색(부모구역/세션 방식) ----------
-    def node_exists(self, area: str) -> bool:
-        vals = self._read_all_cached(self.ws_explore, "탐색")
-        header = {k: i for i, k in enumerate(vals[0])}
-        ia = header.get("구역")
-
-        if ia is None:
-            raise RuntimeError("탐색 헤더에 '구역'이 없습니다.")
-        for row in vals[1:]:
-            if (row[ia] or "").strip() == area:
-                return True
+    def explore_graph(self) -> ExploreGraph:
+        """
+        탐색 시트를 컴파일한 그래프. 스냅샷 버전(내용이 실제로 바뀔 때만 증가)이 달라졌을 때만
+        다시 만들고, 다 만든 그래프를 참조 한 번으로 바꿔 끼우므로 읽는 쪽은 반쯤 만든 상태를 보지 않는다.
+        """
+        vals, ver = self._read_versioned(self.ws_explore, "탐색")
+        graph = self._explore_graph
+        if graph is not None and graph.version == ver:
+            return graph
+        with self._explore_lock:
+            if self._explore_graph is None or self._explore_graph.version != ver:
+                self._explore_graph = ExploreGraph.compile(vals, version=ver)
+            return self._explore_graph
 
-        return False
+    def node_exists(self, area: str) -> bool:
+        return self.explore_graph().exists(area)
 
     def get_node_config(self, area: str):
         """
         '탐색' 시트에서 구역==area 인 첫 행을 설정으로 읽어 dict로 반환.
         헤더: 구역 | 부모구역 | 장소스크립트 | 갈레온_최소 | 갈레온_최대 | 아이템명 | 아이템수량 | 소문스크립트
         """
-        vals = self._read_all_cached(self.ws_explore, "탐색")
-        header = {k: i for i, k in enumerate(vals[0])}
-
-        def idx(k):
-            v = header.get(k)
-            if v is None:
-                raise RuntimeError("탐색 헤더를 확인하세요. (구역/부모구역/장소스크립트/갈레온_최소/갈레온_최대/아이템명/아이템수량/소문스크립트)")
-            return v
-
-        ia, ipar, ips, imin, imax, iitem, iqty, irum = map(idx, [
-            "구역", "부모구역", "장소스크립트", "갈레온_최소", "갈레온_최대", "아이템명", "아이템수량", "소문스크립트"
-        ])
-
-        for row in vals[1:]:
-            if (row[ia] or "").strip() == area:
-                def to_int(s, default=0):
-                    s = (s or "").strip()
-                    try:
-                        return int(s)
-                    except:
-                        return default
-
-                return {
-                    "area": area,
-                    "place": row[ips] or "",
-                    "gmin": to_int(row[imin], 0),
-                    "gmax": to_int(row[imax], 0),
-                    "item": (row[iitem] or "").strip(),
-                    "qty": max(0, to_int(row[iqty], 0)),
-                    "rumor": (row[irum] or "").strip(),
-                }
-        return None
+        return self.explore_graph().node(area)
 
     def list_children(self, parent: str) -> List[str]:
         """부모구역 == parent 인 모든 행의 '구역' 이름을 유니크 집합으로 반환."""
-        vals = self._read_all_cached(self.ws_explore, "탐색")
-        header = {k: i for i, k in enumerate(vals[0])}
-        ia = header.get("구역"); ipar = header.get("부모구역")
+        return list(self.explore_graph().children_of(parent))
 
-        if None in (ia, ipar):
-            raise RuntimeError("탐색 헤더에 '구역' 또는 '부모구역'이 없습니다.")
-
-        children = set()
-
-        for row in vals[1:]:
-            if (row[ipar] or "").strip() == (parent or ""):
-                child = (row[ia] or "").strip()
-                if child:
-                    children.add(child)
-
-        return sorted(children)
+    def is_valid_path(self, path: str) -> bool:
+        """절대경로 'a/b/c'가 루트부터 부모-자식으로 이어지는지 확인."""
+        return self.explore_graph().is_valid_path(path)
 
     # ---------- 세션 ----------
     def get_session_row(self, handle: str):
@@ -265,100 +693,254 @@ class Sheets:
 
     def set_session_path(self, row_idx: int, path: str, updated_at: str):
         # 2=현재경로, 3=마지막업데이트 (1-based)
-        self._with_retry(self.ws_session.update_cell, row_idx, 2, path)
-        self._with_retry(self.ws_session.update_cell, row_idx, 3, updated_at)
-        self._invalidate_cache("세션")
+        self._write_cell("세션", self.ws_session, row_idx, 2, path)
+        self._write_cell("세션", self.ws_session, row_idx, 3, updated_at)
 
     # ---------- 가방(통화/아이템) ----------
-    def _bag_user_col(self, handle: str) -> Optional[int]:
-        if not self.ws_bag:
-            return None
-        header = self._with_retry(self.ws_bag.row_values, 1)
+    # 가방 시트는 (아이템 행 x 유저 열) 행렬. 스냅샷을 그대로 행렬로 쓰고
+    # 아이템명 -> 행, 유저 -> 열 해시 인덱스만 따로 둔다. 지급은 칸별 증감으로 write-behind 버퍼에
+    # 모으고, 버퍼가 flush 때 그 칸들만 새로 읽어 더한다(오래된 스냅샷 값 위에 더하지 않는다).
+    # 새 유저 열/아이템 행은 그 자리에 바로 끼워 넣어 격자를 늘린다(실패하면 지급 전에 호출자에게).
+    def _bag_matrix(self) -> List[List[str]]:
+        """가방 스냅샷. 바뀌었을 때만 인덱스를 다시 만든다. (_bag_lock 안에서 호출)"""
+        vals, ver = self._read_versioned(self.ws_bag, "가방")
+        if ver != self._bag_ver:
+            header = vals[0] if vals else []
+            users: Dict[str, int] = {}
+            last_col = 1
+            for c, name in enumerate(header, start=1):
+                name = (name or "").strip()
+                if name:
+                    last_col = c
+                    if c > 1:
+                        users.setdefault(name, c)
+            items: Dict[str, int] = {}
+            last_row = 1
+            for r, row in enumerate(vals[1:], start=2):
+                name = (row[0] if row else "").strip()
+                if name:
+                    last_row = r
+                    items.setdefault(name, r)
+            self._bag_users, self._bag_items = users, items
+            self._bag_next_col, self._bag_next_row = last_col + 1, last_row + 1
+            self._bag_ver = ver
+        return vals
+
+    def _bag_inserted(self, label: str, row: int = 0, col: int = 0):
+        """시트에 끼워 넣은 행/열을 캐시된 스냅샷에도 똑같이 끼워 넣고, 그 전에 시작된 적재는 버린다."""
+        def apply(rows):
+            if rows is None:
+                return
+            if row:
+                if row - 1 <= len(rows):
+                    rows.insert(row - 1, [label])
+                else:
+                    _set_cell(rows, row, 1, label)
+            else:
+                for r in rows:
+                    if len(r) >= col:
+                        r.insert(col - 1, "")
+                _set_cell(rows, 1, col, label)
+        self._cache.patch("가방", apply)
+        self._cache.supersede("가방")
+
+    def _bag_user_col(self, handle: str) -> int:
+        """(_bag_lock 안에서 호출)"""
         target = f"@{handle}" if self.cfg.USER_COLUMN_STYLE == "with_at" else handle
-        for idx, name in enumerate(header, start=1):
-            if name.strip() == target:
-                return idx
-        # 새 열
-        next_col = len(header) + 1
-        self._with_retry(self.ws_bag.update_cell, 1, next_col, target)
-        self._invalidate_cache("가방")
-        return next_col
-
-    def _bag_row_of(self, item_name: str) -> Optional[int]:
-        names = self._with_retry(self.ws_bag.col_values, 1)
-        for r, v in enumerate(names[1:], start=2):
-            if (v or "").strip() == item_name:
-                return r
-        # 새 행
-        new_r = len(names) + 1
-        self._with_retry(self.ws_bag.update_cell, new_r, 1, item_name)
-        self._invalidate_cache("가방")
-        return new_r
-
-    def add_currency(self, handle: str, amount: int):
+        col = self._bag_users.get(target)
+        if col is None:
+            # 새 열: 마지막 유저 열 뒤에 끼워 넣는다 (격자가 꽉 차 있어도 늘어남)
+            col = self._bag_next_col
+            self._with_retry(self.ws_bag.insert_cols, [[target]], col, value_input_option="USER_ENTERED")
+            self._bag_next_col += 1
+            self._bag_users[target] = col
+            self._bag_inserted(target, col=col)
+        return col
+
+    def _bag_row_of(self, item_name: str) -> int:
+        """(_bag_lock 안에서 호출)"""
+        row = self._bag_items.get(item_name)
+        if row is None:
+            row = self._bag_next_row
+            self._with_retry(self.ws_bag.insert_rows, [[item_name]], row, value_input_option="USER_ENTERED")
+            self._bag_next_row += 1
+            self._bag_items[item_name] = row
+            self._bag_inserted(item_name, row=row)
+        return row
+
+    def _bag_add(self, handle: str, item_name: str, delta: int):
+        with self._bag_lock:
+            self._bag_matrix()
+            col = self._bag_user_col(handle)
+            row = self._bag_row_of(item_name)
+            self._add_cell("가방", self.ws_bag, row, col, delta)
+
+    def add_currency(self, handle: str, amount: int, source: str = ""):
         if not self.ws_bag or amount == 0:
             return
         key = self.get_config().get("통화키", "갈레온")
-        col = self._bag_user_col(handle)
-        row = self._bag_row_of(key)
-        cur_val = self._with_retry(self.ws_bag.cell, row, col).value or 0
-        cur = int(cur_val)
-        self._with_retry(self.ws_bag.update_cell, row, col, cur + amount)
-        self._invalidate_cache("가방")
-
-    def add_item(self, handle: str, item: str, qty: int):
+        if self._ledger:
+            self._ledger.record(handle, key, amount, source)
+        else:
+            self._bag_add(handle, key, amount)
+
+    def add_item(self, handle: str, item: str, qty: int, source: str = ""):
         if not self.ws_bag or qty == 0:
             return
-        col = self._bag_user_col(handle)
-        row = self._bag_row_of(item)
-        cur_val = self._with_retry(self.ws_bag.cell, row, col).value or 0
-        cur = int(cur_val)
-        self._with_retry(self.ws_bag.update_cell, row, col, cur + qty)
-        self._invalidate_cache("가방")
-
-    def has_participation(self, typ: str, notice_id: str, handle: str) -> bool:
+        if self._ledger:
+            self._ledger.record(handle, item, qty, source)
+        else:
+            self._bag_add(handle, item, qty)
+
+    # ---------- 참여기록 ----------
+    # 공지ID별로 나눈 {(유형, 유저명)} 집합. 한 번 만들고 append_participation이 갱신한다.
+    # PARTICIP_MAX_NOTICES를 넘으면 오래 안 쓴 공지부터 메모리에서 내리고,
+    # 내려간 공지가 다시 조회되면 그 공지만 시트에서 다시 읽는다.
+    def _particip_scan(self, notice_id: Optional[str] = None) -> Dict[str, set]:
+        # 드문 경로(최초 구축/내려간 공지 재적재). 버퍼의 추가분을 먼저 내보내고 새로 읽은 뒤,
+        # 그래도 버퍼에 남은(flush 실패) 행과 방금 붙은 행(차단 중 오래된 스냅샷 대비)을 합친다.
+        self._writes.flush(keys=["참여기록"])
+        self._invalidate_cache("참여기록")
         vals = self._read_all_cached(self.ws_particip, "참여기록")
-        hdr = {k: i for i, k in enumerate(vals[0])}
+        hdr = {k: i for i, k in enumerate(vals[0])} if vals else {}
         it, iid, iu = hdr.get("유형"), hdr.get("공지ID"), hdr.get("유저명")
+        if None in (it, iid, iu):
+            raise RuntimeError("참여기록 헤더를 확인하세요. (유형/공지ID/유저명)")
+        parts: Dict[str, set] = {}
         for row in vals[1:]:
-            if row[it] == typ and row[iid] == str(notice_id) and row[iu] == handle:
-                return True
-        return False
+            nid = row[iid]
+            if notice_id is not None and nid != notice_id:
+                continue
+            parts.setdefault(nid, set()).add((row[it], row[iu]))
+        for typ, nid, handle, _ in self._writes.pending_rows("참여기록"):  # append_participation의 열 순서
+            if notice_id is None or nid == notice_id:
+                parts.setdefault(nid, set()).add((typ, handle))
+        return parts
+
+    def _particip_partition(self, notice_id: str) -> set:
+        """공지 하나의 참여 집합. (_particip_lock 안에서 호출)"""
+        if self._particip_stale:
+            # 버려진 추가가 있었음: 남은 추가분이 확실히 나간 뒤에만 시트 기준으로 다시 만든다
+            self._writes.flush(keys=["참여기록"])
+            if not self._writes.pending_count("참여기록"):
+                self._particip_stale = False
+                self._particip = None
+        if self._particip is None:
+            self._particip = OrderedDict(self._particip_scan())
+            self._particip_evicted = set()
+            self._particip_trim()
+        part = self._particip.get(notice_id)
+        if part is None:
+            if notice_id in self._particip_evicted:
+                part = self._particip_scan(notice_id).get(notice_id, set())
+                self._particip_evicted.discard(notice_id)
+                metrics.inc("sheets.particip_reloads")
+            else:
+                part = set()
+            self._particip[notice_id] = part
+            self._particip_trim()
+        self._particip.move_to_end(notice_id)
+        return part
+
+    def _particip_trim(self):
+        limit = self._particip_max_notices
+        while limit and len(self._particip) > limit:
+            nid, _ = self._particip.popitem(last=False)
+            self._particip_evicted.add(nid)
+
+    def has_participation(self, typ: str, notice_id: str, handle: str) -> bool:
+        with self._particip_lock:
+            return (typ, handle) in self._particip_partition(str(notice_id))
 
     def append_participation(self, typ: str, notice_id: str, handle: str, ts: str):
-        self._with_retry(self.ws_particip.append_row, [typ, str(notice_id), handle, ts],
-                         value_input_option="USER_ENTERED")
-        self._invalidate_cache("참여기록")
+        with self._particip_lock:
+            self._particip_partition(str(notice_id)).add((typ, handle))
+        self._writes.append("참여기록", self.ws_particip, [typ, str(notice_id), handle, ts])
 
     def _with_retry(self, func, *args, **kwargs):
-        """gspread 호출용 지수 백오프 래퍼 (429/500/503 재시도)"""
-        delay = 0.5
-        for attempt in range(4):  # 최대 4회
-            try:
-                return func(*args, **kwargs)
-            except APIError as e:
-                # 일부 gspread 버전은 e.response.status가 없을 수도 있어 안전하게 처리
-                resp = getattr(e, "response", None)
-                code = getattr(resp, "status", None) if resp else None
-                if code in (429, 500, 503):
-                    if attempt == 3:
-                        raise
-                    time.sleep(delay)
-                    delay *= 2
-                else:
-                    raise
+        """gspread 호출은 모두 여기로: 분당 한도 대기, 429/5xx 재시도(Retry-After/지터 백오프), 회로 차단."""
+        return self._quota.call(func, *args, **kwargs)
 
     def _read_all_cached(self, ws, key: str):
-        """ws.get_all_values()에 짧은 TTL 캐시를 적용."""
-        now = time.time()
-        hit = self._sheet_cache.get(key)
-        if hit and (now - hit[0] <= self._sheet_cache_ttl):
-            return hit[1]
-        rows = self._with_retry(ws.get_all_values)
-        self._sheet_cache[key] = (now, rows)
-        return rows
+        """ws.get_all_values()에 짧은 TTL 캐시를 적용. 아직 안 나간 쓰기는 스냅샷 위에 덧씌운다."""
+        return self._read_versioned(ws, key)[0]
 
-    def _invalidate_cache(self, key: str):
-        """해당 키 캐시 무효화 (쓰기 직후 호출)"""
-        self._sheet_cache.pop(key, None)
+    def _loader(self, ws, key: str):
+        def load(since):
+            return self._with_retry(ws.get_all_values)
+        return load
 
+    def _read_versioned(self, ws, key: str):
+        """(rows, version). version은 시트 내용이 바뀔 때만 증가하므로 인덱스 재구성 판단에 쓴다."""
+        ttl = self._sheet_cache_ttls.get(key, self._sheet_cache_ttl)
+        return self._cache.get(key, self._loader(ws, key), ttl)
+
+    def prefetch(self, keys) -> int:
+        """
+        명령 처리 전에 필요한 시트들 중 비었거나 곧 만료될 것만 골라, 문서별로
+        values_batch_get 한 번에 받아 캐시를 채운다. 핸들러 안의 읽기는 그러면 왕복 없이 캐시에서 끝난다.
+        실패해도 예외를 내지 않는다(핸들러가 평소대로 시트별로 읽는다). 반환: 채운 시트 수
+        """
+        groups: Dict[int, tuple] = {}
+        for key in keys:
+            src = self._prefetch_sources.get(key)
+            if src is None or (key == "가방" and self._ledger is not None):
+                continue  # 원장 모드에서는 가방을 압축기만 읽는다
+            gen = self._cache.stale_gen(key, self._sheet_cache_ttls.get(key, self._sheet_cache_ttl))
+            if gen is None:
+                continue
+            doc, ws = src
+            groups.setdefault(id(doc), (doc, []))[1].append((key, ws, gen))
+
+        filled = 0
+        for doc, items in groups.values():
+            started = time.time()
+            try:
+                resp = self._with_retry(doc.values_batch_get, [absolute_range_name(ws.title) for _, ws, _ in items])
+            except Exception as e:
+                logging.warning("prefetch %s failed: %s", [k for k, _, _ in items], e)
+                continue
+            metrics.inc("sheets.prefetch_calls")
+            for (key, ws, gen), vr in zip(items, resp.get("valueRanges", [])):
+                rows = fill_gaps(vr.get("values", []))  # get_all_values()와 같은 모양으로
+                if self._cache.fill(key, rows, started, gen, self._loader(ws, key)):
+                    filled += 1
+        if filled:
+            metrics.inc("sheets.prefetched", filled)
+        return filled
+
+    def _write_cell(self, key: str, ws, row: int, col: int, value):
+        """셀 쓰기를 버퍼에 넣고, 캐시된 스냅샷에도 바로 반영해 읽기가 곧바로 새 값을 보게 한다."""
+        def apply(rows):
+            self._writes.put(key, ws, row, col, value)
+            if rows is not None:
+                _set_cell(rows, row, col, value)
+        self._cache.patch(key, apply)
+
+    def _add_cell(self, key: str, ws, row: int, col: int, delta: int):
+        """칸에 delta를 더하는 쓰기를 버퍼에 넣는다. 시트 값은 flush 때 새로 읽어 더하고, 캐시는 바로 더해 둔다."""
+        def apply(rows):
+            self._writes.add(key, ws, row, col, delta)
+            if rows is not None:
+                _bump_cell(rows, row, col, delta)
+        self._cache.patch(key, apply)
+
+    def _on_write_dropped(self, key: str):
+        """
+        버퍼가 되돌릴 수 없는 오류로 쓰기를 버렸을 때 (flush 스레드). 그 값을 미리 반영해 둔 스냅샷/인덱스를
+        버려 다음 조회 때 시트 내용으로 다시 만든다. flush를 부르는 쪽이 락을 쥐고 있을 수 있으므로 락 없이 표시만.
+        """
+        self._invalidate_cache(key)
+        if key == "러너":
+            self._runner_ver = -1
+        elif key == "가방":
+            self._bag_ver = -1
+        elif key == "제한":
+            self._limit_stale = True
+        elif key == "참여기록":
+            self._particip_stale = True  # 다른 스레드가 인덱스를 쓰는 중일 수 있어 다음 조회 때 버린다
+        metrics.inc("sheets.drop_invalidations")
+
+    def _invalidate_cache(self, key: str):
+        """해당 키 캐시 무효화 (행 추가 직후처럼 다음 읽기가 반드시 새 내용을 봐야 할 때)"""
+        self._cache.invalidate(key)
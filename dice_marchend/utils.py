@@ -1,4 +1,7 @@
 import re, random
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 import pytz
 
@@ -16,6 +19,40 @@ def build_user_label(handle: str, nickname: str, mode: str = "hidden") -> str:
     # replace
     return nn or handle
 
+class LRUCache:
+    """크기 제한(+선택적 TTL)이 있는 스레드 안전 LRU 캐시."""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (stored_at, value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return default
+            if self.ttl is not None and time.monotonic() - hit[0] > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
 def html_to_text(html: str) -> str:
     return HTML_TAG_RE.sub(" ", html or "")
 
@@ -42,6 +79,14 @@ def roll_ndm(n: int, m: int, mod: int = 0):
     total = subtotal + mod
     return rolls, subtotal, mod, total
 
+def to_int(s, default=0):
+    """시트 칸 문자열을 정수로. 비었거나 숫자가 아니면 default."""
+    s = (s or "").strip()
+    try:
+        return int(s)
+    except ValueError:
+        return default
+
 def today_ymd(tz_name: str) -> str:
     tz = pytz.timezone(tz_name)
     return datetime.now(tz).strftime("%Y-%m-%d")
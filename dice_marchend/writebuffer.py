@@ -0,0 +1,386 @@
+"""
+Sheets 셀 쓰기/행 추가용 write-behind 버퍼. 봇(Sheets)과 autoscript가 같이 쓴다.
+"""
+from __future__ import annotations
+import re
+import time
+import logging
+import threading
+from typing import Dict, Tuple, List, Optional
+
+from gspread.utils import rowcol_to_a1
+
+from .metrics import metrics
+from .quota import shared_quota, is_retryable, SheetsUnavailable
+
+_UPDATED_ROW_RE = re.compile(r"![A-Z]+(\d+)")
+
+def _appended_row(resp) -> Optional[int]:
+    """append_row 응답의 updatedRange('시트'!A12:F12)에서 추가된 행 번호를 꺼낸다."""
+    try:
+        m = _UPDATED_ROW_RE.search(resp["updates"]["updatedRange"])
+        return int(m.group(1)) if m else None
+    except (KeyError, TypeError):
+        return None
+
+class WriteBuffer:
+    """
+    워크시트별 셀 쓰기를 모아 두었다가 batch_update 한 번으로 내보내는 write-behind 버퍼.
+    - 같은 셀에 여러 번 쓰면 마지막 값만 남는다(coalesce).
+    - add()는 절대값 대신 증감을 모은다. flush 때 그 칸들만 batch_get으로 새로 읽어 더한 값을 쓰므로,
+      오래된 스냅샷 값 위에 더해 그사이 다른 곳(상점 봇, 사람)이 고친 값을 덮어쓰지 않는다.
+    - 아직 시트에 반영되지 않은 값은 apply_to()로 새 스냅샷 위에 덧씌운다.
+    - 실패: 429/5xx/네트워크/차단 중이면 몇 번이든 다시 대기열로(장애가 길어도 버리지 않는다).
+      그 밖의 오류(범위 밖, 보호 범위 등)는 배치를 반씩 나눠 다시 보내 멀쩡한 칸은 내보내고,
+      문제 칸만 버린 뒤 on_drop(key)로 알린다(캐시/인덱스가 버려진 값을 계속 내주지 않게).
+    """
+
+    def __init__(self, retry, interval: float, max_cells: int, value_input_option: str = "USER_ENTERED",
+                 on_drop=None):
+        self._retry = retry            # Sheets._with_retry
+        self._interval = interval
+        self._max_cells = max_cells
+        self._value_input_option = value_input_option
+        self._on_drop = on_drop
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # flush는 한 번에 하나만
+        self._wake = threading.Event()
+        self._stopped = False
+        self._pending: Dict[str, Tuple[object, Dict[Tuple[int, int], object]]] = {}  # key -> (ws, {(r,c): v})
+        self._inflight: Dict[str, Dict[Tuple[int, int], object]] = {}
+        self._recent: Dict[str, Dict[Tuple[int, int], Tuple[object, float]]] = {}  # 방금 반영된 셀 (읽기 경합 보정)
+        self._appends: Dict[str, Tuple[object, List[list], list]] = {}  # key -> (ws, [행, ...], [on_row, ...])
+        self._inflight_appends: Dict[str, List[list]] = {}
+        self._recent_appends: Dict[str, List[Tuple[list, float]]] = {}  # 방금 붙인 행 (읽기 경합 보정)
+        self._deltas: Dict[str, Tuple[object, Dict[Tuple[int, int], int]]] = {}  # key -> (ws, {(r,c): 증감})
+        self._inflight_deltas: Dict[str, Dict[Tuple[int, int], int]] = {}  # 새로 읽는 중인 증감
+        self._inflight_sums: Dict[str, Dict[Tuple[int, int], object]] = {}  # 더한 절대값을 쓰는 중
+        self._hooks = []  # flush 때마다 같이 부를 함수들 (예: 로컬 원장 파일 쓰기)
+        self._recent_keep_sec = 60.0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, key: str, ws, row: int, col: int, value):
+        with self._lock:
+            ent = self._pending.get(key)
+            if ent is None:
+                ent = self._pending[key] = (ws, {})
+            cells = ent[1]
+            if (row, col) in cells:
+                metrics.inc("sheets.writes_coalesced")
+            cells[(row, col)] = value
+            size = sum(len(c) for _, c in self._pending.values())
+        metrics.inc("sheets.writes_queued")
+        if size >= self._max_cells:
+            self._wake.set()
+
+    def add(self, key: str, ws, row: int, col: int, delta: int):
+        """칸에 delta를 더하도록 버퍼에 넣는다. 같은 칸의 증감은 합쳐진다."""
+        with self._lock:
+            ent = self._deltas.get(key)
+            if ent is None:
+                ent = self._deltas[key] = (ws, {})
+            cells = ent[1]
+            if (row, col) in cells:
+                metrics.inc("sheets.writes_coalesced")
+            cells[(row, col)] = cells.get((row, col), 0) + delta
+            size = sum(len(c) for _, c in self._deltas.values())
+        metrics.inc("sheets.writes_queued")
+        if size >= self._max_cells:
+            self._wake.set()
+
+    def append(self, key: str, ws, values: list, on_row=None):
+        """
+        행 추가를 버퍼에 넣는다. 다음 flush 때 append_rows 한 번으로 나간다.
+        on_row가 있으면 추가된 뒤 그 행 번호로 부른다(응답에서 못 읽으면 None). 버퍼 락 밖, flush 스레드에서.
+        """
+        with self._lock:
+            ent = self._appends.get(key)
+            if ent is None:
+                ent = self._appends[key] = (ws, [], [])
+            ent[1].append(values)
+            ent[2].append(on_row)
+            size = sum(len(v) for _, v, _ in self._appends.values())
+        metrics.inc("sheets.appends_queued")
+        if size >= self._max_cells:
+            self._wake.set()
+
+    def add_flush_hook(self, fn):
+        self._hooks.append(fn)
+
+    def overlay(self, key: str, since: float) -> Dict[Tuple[int, int], object]:
+        """아직 반영 전이거나, 읽기 시작(since) 이후에 반영된 셀 쓰기 {(r, c): 값} (나중 값 우선)"""
+        with self._lock:
+            out: Dict[Tuple[int, int], object] = {}
+            recent = self._recent.get(key)
+            if recent:
+                out.update((rc, v) for rc, (v, at) in recent.items() if at >= since)
+            if key in self._inflight:
+                out.update(self._inflight[key])
+            if key in self._inflight_sums:
+                out.update(self._inflight_sums[key])
+            if key in self._pending:
+                out.update(self._pending[key][1])
+            return out
+
+    def pending_rows(self, key: str) -> List[list]:
+        """
+        아직 붙지 않았거나(대기/전송 중) 최근에 붙은 행들. 시트를 다시 읽어 만든 인덱스에 합칠 때 쓴다
+        (flush가 실패했거나 차단 중이라 오래된 스냅샷을 받았어도 버퍼에 있던 행을 잊지 않게).
+        최근 행은 스냅샷에도 있을 수 있으므로 합치는 쪽이 중복에 안전해야 한다.
+        """
+        with self._lock:
+            out = [v for v, _ in self._recent_appends.get(key, [])]
+            out += self._inflight_appends.get(key, [])
+            ent = self._appends.get(key)
+            if ent is not None:
+                out += ent[1]
+            return out
+
+    def apply_to(self, key: str, rows: List[List[str]], since: float):
+        """
+        막 받아온 스냅샷(rows)에 overlay()를 덧씌우고, 아직 안 나간 증감을 더한다.
+        rows는 호출자 소유의 새 리스트여야 한다(제자리 수정).
+        """
+        for (r, c), v in self.overlay(key, since).items():
+            _set_cell(rows, r, c, v)
+        with self._lock:
+            deltas = dict(self._inflight_deltas.get(key, {}))
+            ent = self._deltas.get(key)
+            if ent is not None:
+                for rc, d in ent[1].items():
+                    deltas[rc] = deltas.get(rc, 0) + d
+        for (r, c), d in deltas.items():
+            _bump_cell(rows, r, c, d)
+
+    def flush(self, keys=None):
+        """
+        모아 둔 쓰기를 내보낸다. keys를 주면 그 워크시트들 것만 내보내고 나머지는 다음 주기까지 둔다
+        (flush 훅도 keys 없이 부를 때만 돈다).
+        """
+        if keys is None:
+            for fn in self._hooks:
+                try:
+                    fn()
+                except Exception as e:
+                    logging.exception("flush hook failed: %s", e)
+        with self._flush_lock:
+            with self._lock:
+                if keys is None:
+                    batch, self._pending = self._pending, {}
+                    appends, self._appends = self._appends, {}
+                    deltas, self._deltas = self._deltas, {}
+                else:
+                    batch = {k: self._pending.pop(k) for k in keys if k in self._pending}
+                    appends = {k: self._appends.pop(k) for k in keys if k in self._appends}
+                    deltas = {k: self._deltas.pop(k) for k in keys if k in self._deltas}
+                for key, (_, cells) in batch.items():
+                    self._inflight[key] = cells
+                for key, (_, rows, _) in appends.items():
+                    self._inflight_appends[key] = rows
+                for key, (_, cells) in deltas.items():
+                    self._inflight_deltas[key] = cells
+
+            for key, (ws, rows, cbs) in appends.items():
+                try:
+                    resp = self._retry(ws.append_rows, rows, value_input_option="USER_ENTERED")
+                    metrics.inc("sheets.append_batches")
+                    metrics.inc("sheets.appends_flushed", len(rows))
+                except Exception as e:
+                    metrics.inc("sheets.write_flush_errors")
+                    if not is_retryable(e):
+                        logging.error("sheet append dropped (%s, %d rows): %s", key, len(rows), e)
+                        metrics.inc("sheets.appends_dropped", len(rows))
+                        with self._lock:
+                            self._inflight_appends.pop(key, None)
+                        self._dropped(key)
+                        continue
+                    self._log_retry(key, len(rows), e)
+                    with self._lock:
+                        # 순서를 지키도록 실패분을 앞에 다시 붙인다
+                        self._inflight_appends.pop(key, None)
+                        ent = self._appends.get(key)
+                        self._appends[key] = (ws, rows + (ent[1] if ent else []), cbs + (ent[2] if ent else []))
+                    continue
+                now = time.time()
+                with self._lock:
+                    self._inflight_appends.pop(key, None)
+                    recent = [(v, at) for v, at in self._recent_appends.get(key, [])
+                              if now - at <= self._recent_keep_sec]
+                    self._recent_appends[key] = recent + [(v, now) for v in rows]
+                first = _appended_row(resp)
+                for i, cb in enumerate(cbs):
+                    if cb is None:
+                        continue
+                    try:
+                        cb(first + i if first else None)
+                    except Exception as e:
+                        logging.exception("append callback failed (%s): %s", key, e)
+
+            for key, (ws, cells) in batch.items():
+                sent, retry, dropped = self._send_cells(key, ws, sorted(cells.items()))
+
+                now = time.time()
+                with self._lock:
+                    self._inflight.pop(key, None)
+                    recent = self._recent.setdefault(key, {})
+                    for rc, v in sent:
+                        recent[rc] = (v, now)
+                    for rc in [rc for rc, (_, at) in recent.items() if now - at > self._recent_keep_sec]:
+                        del recent[rc]
+                    # 다시 보낼 칸은 대기열로. 그사이 들어온 더 새로운 값은 덮어쓰지 않는다.
+                    for rc, v in retry:
+                        ent = self._pending.get(key)
+                        if ent is None:
+                            ent = self._pending[key] = (ws, {})
+                        ent[1].setdefault(rc, v)
+                if dropped:
+                    self._dropped(key)
+
+            for key, (ws, cells) in deltas.items():
+                self._flush_deltas(key, ws, sorted(cells.items()))
+
+    def _flush_deltas(self, key: str, ws, items: list):
+        """증감 칸들을 batch_get 한 번으로 새로 읽고, 더한 절대값을 batch_update 한 번으로 쓴다."""
+        try:
+            got = self._retry(ws.batch_get, [rowcol_to_a1(r, c) for (r, c), _ in items],
+                              value_render_option="UNFORMATTED_VALUE")
+        except Exception as e:
+            metrics.inc("sheets.write_flush_errors")
+            if is_retryable(e):
+                self._log_retry(key, len(items), e)
+                self._settle_deltas(key, ws, [], items)
+                return
+            logging.error("sheet delta read failed, dropped (%s, %d): %s", key, len(items), e)
+            metrics.inc("sheets.writes_dropped", len(items))
+            self._settle_deltas(key, ws, [], [])
+            self._dropped(key)
+            return
+
+        delta_of = dict(items)
+        cells, bad = [], False
+        for ((r, c), d), vr in zip(items, got):
+            cur = vr[0][0] if vr and vr[0] else ""
+            try:
+                cells.append(((r, c), _cell_int(cur) + d))
+            except ValueError:
+                bad = True
+                metrics.inc("sheets.writes_dropped")
+                logging.error("sheet delta dropped (%s %s): not a number %r", key, rowcol_to_a1(r, c), cur)
+        with self._lock:
+            # 쓰기가 나가기 전에 증감을 덧씌우기에서 빼고 절대값으로 바꿔 둔다. 그 사이 새로 받은
+            # 스냅샷이 이미 이 쓰기를 담고 있어도 증감을 한 번 더 더하지 않는다
+            self._inflight_deltas.pop(key, None)
+            self._inflight_sums[key] = dict(cells)
+        sent, retry, dropped = self._send_cells(key, ws, cells) if cells else ([], [], [])
+        # 다시 보낼 칸은 절대값이 아니라 증감으로 되돌린다(다음 flush에서 다시 읽고 더함)
+        self._settle_deltas(key, ws, sent, [(rc, delta_of[rc]) for rc, _ in retry])
+        if bad or dropped:
+            self._dropped(key)
+
+    def _settle_deltas(self, key: str, ws, sent: list, retry: list):
+        now = time.time()
+        with self._lock:
+            self._inflight_deltas.pop(key, None)
+            self._inflight_sums.pop(key, None)
+            recent = self._recent.setdefault(key, {})
+            for rc, v in sent:
+                recent[rc] = (v, now)
+            if retry:
+                ent = self._deltas.get(key)
+                if ent is None:
+                    ent = self._deltas[key] = (ws, {})
+                for rc, d in retry:
+                    ent[1][rc] = ent[1].get(rc, 0) + d
+
+    def _send_cells(self, key: str, ws, items: list) -> Tuple[list, list, list]:
+        """
+        칸들을 batch_update 한 번으로 보낸다. 반환: (보낸 칸, 다시 보낼 칸, 버린 칸).
+        다시 보내도 소용없는 오류면 반씩 나눠 보내고, 끝까지 실패하는 칸 하나하나는 버린다.
+        """
+        data = [{"range": rowcol_to_a1(r, c), "values": [[v]]} for (r, c), v in items]
+        try:
+            self._retry(ws.batch_update, data, value_input_option=self._value_input_option)
+        except Exception as e:
+            metrics.inc("sheets.write_flush_errors")
+            if is_retryable(e):
+                self._log_retry(key, len(items), e)
+                return [], items, []
+            if len(items) == 1:
+                metrics.inc("sheets.writes_dropped")
+                logging.error("sheet write dropped (%s %s): %s", key, rowcol_to_a1(*items[0][0]), e)
+                return [], [], items
+            mid = len(items) // 2
+            s1, r1, d1 = self._send_cells(key, ws, items[:mid])
+            s2, r2, d2 = self._send_cells(key, ws, items[mid:])
+            return s1 + s2, r1 + r2, d1 + d2
+        metrics.inc("sheets.write_batches")
+        metrics.inc("sheets.writes_flushed", len(items))
+        return items, [], []
+
+    def _log_retry(self, key: str, n: int, e: Exception):
+        if isinstance(e, SheetsUnavailable):
+            # 차단기가 닫힐 때까지 매 주기 이렇게 튕기므로 시도로 치지도, 크게 남기지도 않는다
+            logging.debug("sheet flush deferred while breaker is open (%s, %d)", key, n)
+        else:
+            logging.warning("sheet flush failed, will retry (%s, %d): %s", key, n, e)
+
+    def _dropped(self, key: str):
+        if self._on_drop is None:
+            return
+        try:
+            self._on_drop(key)
+        except Exception as e:
+            logging.exception("write drop hook failed (%s): %s", key, e)
+
+    def pending_count(self, key: Optional[str] = None) -> int:
+        """아직 안 나간 칸/행 수 (key를 주면 그 워크시트 것만)"""
+        with self._lock:
+            if key is not None:
+                return (len(self._pending[key][1]) if key in self._pending else 0) \
+                    + (len(self._appends[key][1]) if key in self._appends else 0) \
+                    + (len(self._deltas[key][1]) if key in self._deltas else 0)
+            return (sum(len(c) for _, c in self._pending.values())
+                    + sum(len(v) for _, v, _ in self._appends.values())
+                    + sum(len(c) for _, c in self._deltas.values()))
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            try:
+                with shared_quota().background():
+                    self.flush()
+            except Exception as e:
+                logging.exception("write buffer loop error: %s", e)
+
+def _set_cell(rows: List[List[str]], r: int, c: int, value):
+    """스냅샷(2차원 리스트)의 1-based (r, c)에 값을 넣는다. 모자란 행/열은 빈 문자열로 채움."""
+    while len(rows) < r:
+        rows.append([""] * (len(rows[0]) if rows else 0))
+    row = rows[r - 1]
+    if len(row) < c:
+        row.extend([""] * (c - len(row)))
+    row[c - 1] = "" if value is None else str(value)
+
+def _cell_int(v) -> int:
+    """셀 값을 정수로 (빈칸은 0). 숫자가 아니면 ValueError."""
+    if v is None or v == "":
+        return 0
+    if isinstance(v, (int, float)):
+        return int(v)
+    return int(str(v).strip().replace(",", "") or 0)
+
+def _bump_cell(rows: List[List[str]], r: int, c: int, delta: int):
+    """스냅샷의 (r, c) 칸에 delta를 더한다. 숫자가 아닌 칸은 그대로 둔다(flush 때 버려질 증감)."""
+    cur = rows[r - 1][c - 1] if r <= len(rows) and c <= len(rows[r - 1]) else ""
+    try:
+        _set_cell(rows, r, c, _cell_int(cur) + delta)
+    except ValueError:
+        pass
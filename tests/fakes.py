@@ -0,0 +1,48 @@
+"""테스트용 가짜 워크시트/호출자."""
+from gspread.utils import a1_to_rowcol
+
+
+def direct(func, *args, **kwargs):
+    """Sheets._with_retry 대신: 한도/재시도 없이 바로 부른다."""
+    return func(*args, **kwargs)
+
+
+class FakeWorksheet:
+    """셀 dict 하나로 batch_get / batch_update / append_rows만 흉내 낸다."""
+
+    def __init__(self, cells=None, title="시트"):
+        self.title = title
+        self.cells = dict(cells or {})
+        self.calls = []
+        self.fail_next = []       # 다음 호출들에서 낼 예외 (앞에서부터)
+        self.on_update = None     # batch_update가 셀을 쓰기 직전에 부를 함수 (경합 재현용)
+        self.appended = []
+
+    def _maybe_fail(self):
+        if self.fail_next:
+            raise self.fail_next.pop(0)
+
+    def batch_get(self, ranges, value_render_option=None):
+        self.calls.append("batch_get")
+        self._maybe_fail()
+        out = []
+        for a1 in ranges:
+            v = self.cells.get(a1_to_rowcol(a1))
+            out.append([[v]] if v not in (None, "") else [])
+        return out
+
+    def batch_update(self, data, value_input_option=None):
+        self.calls.append("batch_update")
+        self._maybe_fail()
+        if self.on_update is not None:
+            self.on_update()
+        for d in data:
+            self.cells[a1_to_rowcol(d["range"])] = d["values"][0][0]
+
+    def append_rows(self, rows, value_input_option=None):
+        self.calls.append("append_rows")
+        self._maybe_fail()
+        first = 2 + len(self.appended)
+        self.appended.extend(rows)
+        last = first + len(rows) - 1
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:D{last}"}}
@@ -0,0 +1,46 @@
+import threading
+import time
+
+from dice_marchend.executor import KeyedExecutor
+
+
+def test_keeps_order_per_key_and_runs_keys_in_parallel():
+    seen = {"a": [], "b": []}
+    lock = threading.Lock()
+
+    def work(item):
+        key, i = item
+        time.sleep(0.01)
+        with lock:
+            seen[key].append(i)
+
+    ex = KeyedExecutor(work, lanes=2, max_pending_per_key=100)
+    for i in range(10):
+        ex.submit("a", ("a", i))
+        ex.submit("b", ("b", i))
+    deadline = time.monotonic() + 5
+    while ex.depth() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert seen["a"] == list(range(10))
+    assert seen["b"] == list(range(10))
+
+
+def test_rejects_hot_key_but_not_others():
+    gate = threading.Event()
+    ex = KeyedExecutor(lambda item: gate.wait(2), lanes=2, max_pending_per_key=3)
+    assert all(ex.submit("hot", i) for i in range(3))
+    assert not ex.has_room("hot")
+    assert not ex.submit("hot", 3)
+    assert ex.has_room("cold")
+    assert ex.submit("cold", 0)
+    gate.set()
+    deadline = time.monotonic() + 5
+    while ex.depth() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ex.has_room("hot")
+
+
+def test_resize_shrinks_after_lanes_drain():
+    ex = KeyedExecutor(lambda item: None, lanes=4)
+    assert ex.resize(2) == 2
+    assert ex.size() == 2
@@ -0,0 +1,42 @@
+from dice_marchend.journal import Journal, id_key
+
+
+def mention(sid, acct="alice", nid=None):
+    return {"id": nid or sid, "type": "mention",
+            "status": {"id": sid, "account": {"acct": acct}, "content": "[출석]"}}
+
+
+def test_duplicate_status_is_ignored(tmp_path):
+    j = Journal(str(tmp_path / "j.db"))
+    assert j.add_mention(mention("10")) is not None
+    assert j.add_mention(mention("10")) is None
+
+
+def test_pending_until_reply_is_recorded(tmp_path):
+    j = Journal(str(tmp_path / "j.db"))
+    a = j.add_mention(mention("1"))
+    b = j.add_mention(mention("2"))
+    assert [rid for rid, _ in j.pending_mentions(0, 10)] == [a, b]
+    oid = j.add_reply("alice", "1", "ok", inbox_id=a)
+    assert [rid for rid, _ in j.pending_mentions(0, 10)] == [b]
+    assert [r[0] for r in j.pending_replies(0, 10)] == [oid]
+    j.finish_replies([oid])
+    assert j.pending_replies(0, 10) == []
+
+
+def test_mentions_by_id_returns_only_pending(tmp_path):
+    j = Journal(str(tmp_path / "j.db"))
+    a = j.add_mention(mention("1"))
+    b = j.add_mention(mention("2"))
+    j.finish_mention(a)
+    got = j.mentions([b, a])
+    assert [rid for rid, _ in got] == [b]
+    assert got[0][1]["status"]["id"] == "2"
+
+
+def test_cursor_only_moves_forward(tmp_path):
+    j = Journal(str(tmp_path / "j.db"))
+    j.add_mention(mention("9", nid="100"))
+    j.add_mention(mention("8", nid="99"))
+    assert j.cursor() == "100"
+    assert id_key("100") > id_key("99")
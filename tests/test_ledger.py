@@ -0,0 +1,55 @@
+import pytest
+
+from dice_marchend.ledger import FileLedger
+from dice_marchend.quota import SheetsUnavailable
+
+from fakes import FakeWorksheet, direct
+
+
+def test_fold_marks_entries_applied(tmp_path):
+    led = FileLedger(str(tmp_path / "ledger.jsonl"))
+    led.record("alice", "갈레온", 5)
+    led.record("bob", "갈레온", 2)
+    led.flush()
+    entries = led.unapplied()
+    assert [(h, k, d) for _, h, k, d in entries] == [("alice", "갈레온", 5), ("bob", "갈레온", 2)]
+    bag = FakeWorksheet()
+    led.fold([tok for tok, *_ in entries], bag, [(2, 2, 5), (2, 3, 2)], direct)
+    assert bag.cells == {(2, 2): 5, (2, 3): 2}
+    assert led.unapplied() == []
+    assert not led.recover(bag, direct)
+
+
+def test_interrupted_fold_is_finished_once_by_recover(tmp_path):
+    led = FileLedger(str(tmp_path / "ledger.jsonl"))
+    led.record("alice", "갈레온", 5)
+    led.flush()
+    entries = led.unapplied()
+    bag = FakeWorksheet({(2, 2): 10})
+    bag.fail_next = [SheetsUnavailable("open")]
+    with pytest.raises(SheetsUnavailable):
+        led.fold([tok for tok, *_ in entries], bag, [(2, 2, 15)], direct)
+    # 들어갔는지 모르는 접기: 같은 절대값을 다시 써서 끝내므로 두 번 더해지지 않는다
+    assert led.recover(bag, direct)
+    assert bag.cells[(2, 2)] == 15
+    assert led.unapplied() == []
+    assert not led.recover(bag, direct)
+
+
+def test_rejected_fold_leaves_entries_unapplied(tmp_path):
+    import requests
+    from gspread.exceptions import APIError
+
+    resp = requests.Response()
+    resp.status_code = 400
+    resp._content = b'{"error": {"code": 400, "message": "x", "status": "X"}}'
+    led = FileLedger(str(tmp_path / "ledger.jsonl"))
+    led.record("alice", "갈레온", 5)
+    led.flush()
+    entries = led.unapplied()
+    bag = FakeWorksheet()
+    bag.fail_next = [APIError(resp)]
+    with pytest.raises(APIError):
+        led.fold([tok for tok, *_ in entries], bag, [(2, 2, 5)], direct)
+    assert not led.recover(bag, direct)
+    assert len(led.unapplied()) == 1
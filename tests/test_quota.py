@@ -0,0 +1,90 @@
+import time
+
+import pytest
+import requests
+from gspread.exceptions import APIError
+
+from dice_marchend.quota import SheetsQuota, SheetsUnavailable, is_retryable
+
+
+def api_error(code):
+    resp = requests.Response()
+    resp.status_code = code
+    resp._content = b'{"error": {"code": %d, "message": "x", "status": "X"}}' % code
+    return APIError(resp)
+
+
+def test_is_retryable():
+    assert is_retryable(api_error(429))
+    assert is_retryable(api_error(503))
+    assert is_retryable(SheetsUnavailable("x"))
+    assert is_retryable(requests.exceptions.ConnectionError())
+    assert not is_retryable(api_error(400))
+
+
+def test_retries_5xx_then_succeeds():
+    q = SheetsQuota(read_per_min=600, write_per_min=600, backoff_base=0.001, backoff_cap=0.001)
+    n = {"calls": 0}
+
+    def flaky():
+        n["calls"] += 1
+        if n["calls"] < 3:
+            raise api_error(503)
+        return "ok"
+
+    assert q.call(flaky) == "ok"
+    assert n["calls"] == 3
+
+
+def test_client_errors_are_not_retried():
+    q = SheetsQuota(read_per_min=600, write_per_min=600)
+    n = {"calls": 0}
+
+    def bad():
+        n["calls"] += 1
+        raise api_error(400)
+
+    with pytest.raises(APIError):
+        q.call(bad)
+    assert n["calls"] == 1
+    assert not q.is_open()
+
+
+def test_breaker_opens_then_half_open_probe_closes_it():
+    q = SheetsQuota(read_per_min=600, write_per_min=600, fail_threshold=2, open_sec=0.1,
+                    attempts=1, backoff_base=0.001, backoff_cap=0.001)
+
+    def down():
+        raise api_error(503)
+
+    for _ in range(2):
+        with pytest.raises(APIError):
+            q.call(down)
+    assert q.is_open()
+    with pytest.raises(SheetsUnavailable):
+        q.call(lambda: "never")
+    time.sleep(0.15)
+    assert q.call(lambda: "probe") == "probe"
+    assert not q.is_open()
+
+
+def test_bucket_waits_for_tokens():
+    q = SheetsQuota(read_per_min=60, write_per_min=60)  # 1/s, 버킷 60개
+    for _ in range(60):
+        q.acquire("write")
+    t0 = time.monotonic()
+    q.acquire("write")
+    assert time.monotonic() - t0 >= 0.5
+
+
+def test_background_calls_keep_a_reserve():
+    q = SheetsQuota(read_per_min=60, write_per_min=60, reserve=0.5)
+    for _ in range(40):
+        q.acquire("read")  # 남은 토큰 20개 < 1 + 0.5*60
+    t0 = time.monotonic()
+    q.acquire("read")      # 사용자 호출은 바로
+    assert time.monotonic() - t0 < 0.1
+    b = q._buckets["read"]
+    with q.background():
+        need = 1.0 + q._reserve * b.capacity
+        assert b.tokens < need  # 백그라운드는 여유분이 찰 때까지 기다려야 하는 상태
@@ -0,0 +1,36 @@
+import requests
+
+from dice_marchend.ratelimit import PostBudget
+
+
+class FakeApi:
+    def __init__(self):
+        self.session = requests.Session()
+
+
+def response(method, url, remaining, reset="2999-01-01T00:00:00.000Z"):
+    r = requests.Response()
+    r.headers.update({"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Limit": "300",
+                      "X-RateLimit-Reset": reset})
+    r.request = requests.Request(method, url).prepare()
+    return r
+
+
+def test_only_post_responses_update_the_budget():
+    api = FakeApi()
+    b = PostBudget(api, reserve=20)
+    assert b.on_response in api.session.hooks["response"]
+    b.on_response(response("GET", "https://x/api/v1/notifications", 1))
+    assert b.state()["remaining"] is None
+    b.on_response(response("POST", "https://x/api/v1/statuses", 250))
+    assert b.state()["remaining"] == 250
+    b.on_response(response("POST", "https://x/api/v1/statuses/1/favourite", 3))
+    assert b.state()["remaining"] == 250
+
+
+def test_low_budget_spreads_posts_until_reset():
+    api = FakeApi()
+    b = PostBudget(api, reserve=20)
+    assert b.delay() == 0
+    b.on_response(response("POST", "https://x/api/v1/statuses", 0))
+    assert b.delay() > 60
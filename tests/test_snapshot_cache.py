@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from dice_marchend.quota import SheetsUnavailable
+from dice_marchend.sheets import SnapshotCache
+
+
+def test_single_flight_loads_once_for_concurrent_readers():
+    calls = []
+    gate = threading.Event()
+
+    def loader(since):
+        calls.append(since)
+        gate.wait(2)
+        return [["a"]]
+
+    cache = SnapshotCache()
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(cache.get("k", loader, ttl=60)))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join(2)
+    assert len(calls) == 1
+    assert out == [([["a"]], 1)] * 5
+
+
+def test_version_changes_only_when_content_changes():
+    data = {"rows": [["a"]]}
+    cache = SnapshotCache()
+    loader = lambda since: [list(r) for r in data["rows"]]
+    rows1, v1 = cache.get("k", loader, ttl=60)
+    cache.invalidate("k")
+    rows2, v2 = cache.get("k", loader, ttl=60)
+    assert v2 == v1 and rows2 is rows1  # 같은 내용이면 이전 객체를 유지
+    data["rows"] = [["b"]]
+    cache.invalidate("k")
+    rows3, v3 = cache.get("k", loader, ttl=60)
+    assert v3 == v1 + 1 and rows3 == [["b"]]
+
+
+def test_overlay_is_applied_to_new_rows():
+    def overlay(key, rows, since):
+        rows[0][0] = "pending"
+
+    cache = SnapshotCache(overlay=overlay)
+    rows, _ = cache.get("k", lambda since: [["sheet"]], ttl=60)
+    assert rows == [["pending"]]
+
+
+def test_patch_and_load_do_not_interleave():
+    """적재 중 덧씌우기~바꿔 끼우기 사이에 들어온 patch가 새 rows에 반영된다."""
+    cache = SnapshotCache()
+    cache.get("k", lambda since: [["old"]], ttl=60)
+    cache.invalidate("k")
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_loader(since):
+        started.set()
+        release.wait(2)
+        return [["sheet"]]
+
+    t = threading.Thread(target=lambda: cache.get("k", slow_loader, ttl=60))
+    t.start()
+    started.wait(2)
+    cache.patch("k", lambda rows: rows is not None and rows[0].__setitem__(0, "patched-old"))
+    release.set()
+    t.join(2)
+    # 적재가 끝난 뒤의 patch는 새 rows를 고친다
+    cache.patch("k", lambda rows: rows[0].__setitem__(0, "patched-new"))
+    assert cache.get("k", slow_loader, ttl=60)[0] == [["patched-new"]]
+
+
+def test_serves_stale_rows_while_breaker_is_open():
+    cache = SnapshotCache()
+    cache.get("k", lambda since: [["last"]], ttl=60)
+    cache.invalidate("k")
+
+    def broken(since):
+        raise SheetsUnavailable("open")
+
+    assert cache.get("k", broken, ttl=60)[0] == [["last"]]
+
+
+def test_other_errors_propagate_without_stale_rows():
+    cache = SnapshotCache()
+
+    def broken(since):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get("k", broken, ttl=60)
+
+
+def test_fill_is_discarded_after_supersede():
+    cache = SnapshotCache()
+    gen = cache.stale_gen("k", ttl=60)
+    cache.supersede("k")
+    assert not cache.fill("k", [["x"]], time.time(), gen, lambda since: [["y"]])
@@ -0,0 +1,144 @@
+import requests
+
+from dice_marchend.quota import SheetsUnavailable
+from dice_marchend.writebuffer import WriteBuffer, _appended_row
+from gspread.exceptions import APIError
+
+from fakes import FakeWorksheet, direct
+
+
+def make_buffer(**kw):
+    return WriteBuffer(direct, interval=3600, max_cells=10_000, **kw)
+
+
+def api_error(code):
+    resp = requests.Response()
+    resp.status_code = code
+    resp._content = b'{"error": {"code": %d, "message": "x", "status": "X"}}' % code
+    return APIError(resp)
+
+
+def test_put_coalesces_same_cell_into_one_batch():
+    ws = FakeWorksheet()
+    wb = make_buffer()
+    wb.put("k", ws, 2, 3, "a")
+    wb.put("k", ws, 2, 3, "b")
+    wb.put("k", ws, 2, 4, "c")
+    wb.flush()
+    assert ws.calls == ["batch_update"]
+    assert ws.cells == {(2, 3): "b", (2, 4): "c"}
+    assert wb.pending_count() == 0
+
+
+def test_apply_to_overlays_pending_cells():
+    ws = FakeWorksheet()
+    wb = make_buffer()
+    wb.put("k", ws, 2, 2, "new")
+    rows = [["h1", "h2"], ["x", "old"]]
+    wb.apply_to("k", rows, since=0)
+    assert rows[1][1] == "new"
+
+
+def test_retryable_failure_stays_queued_and_newer_value_wins():
+    ws = FakeWorksheet()
+    wb = make_buffer()
+    wb.put("k", ws, 1, 1, "first")
+    ws.fail_next = [SheetsUnavailable("open")]
+    wb.flush()
+    assert wb.pending_count() == 1
+    wb.put("k", ws, 1, 1, "second")
+    wb.flush()
+    assert ws.cells == {(1, 1): "second"}
+
+
+def test_non_retryable_cell_is_dropped_alone_and_reported():
+    dropped = []
+    ws = FakeWorksheet()
+    wb = make_buffer(on_drop=dropped.append)
+    wb.put("k", ws, 1, 1, "bad")
+    wb.put("k", ws, 1, 2, "good")
+    # 첫 배치와 반으로 나눈 첫 칸은 거절, 둘째 칸은 통과
+    ws.fail_next = [api_error(400), api_error(400)]
+    wb.flush()
+    assert ws.cells == {(1, 2): "good"}
+    assert dropped == ["k"]
+    assert wb.pending_count() == 0
+
+
+def test_keyed_flush_leaves_other_keys_buffered():
+    a, b = FakeWorksheet(), FakeWorksheet()
+    wb = make_buffer()
+    wb.put("a", a, 1, 1, "x")
+    wb.put("b", b, 1, 1, "y")
+    wb.flush(keys=["a"])
+    assert a.cells == {(1, 1): "x"}
+    assert b.calls == []
+    assert wb.pending_count("b") == 1
+
+
+def test_delta_is_added_to_a_fresh_read():
+    ws = FakeWorksheet({(2, 2): 15})
+    wb = make_buffer()
+    wb.add("가방", ws, 2, 2, 1)
+    wb.add("가방", ws, 2, 2, 2)
+    ws.cells[(2, 2)] = 3  # 다른 곳(상점 봇)이 그사이 값을 바꿈
+    wb.flush()
+    assert ws.calls == ["batch_get", "batch_update"]
+    assert ws.cells[(2, 2)] == 6
+
+
+def test_delta_retry_goes_back_as_delta():
+    ws = FakeWorksheet({(2, 2): 10})
+    wb = make_buffer()
+    wb.add("가방", ws, 2, 2, 5)
+    ws.fail_next = [SheetsUnavailable("open")]
+    wb.flush()
+    ws.cells[(2, 2)] = 1
+    wb.flush()
+    assert ws.cells[(2, 2)] == 6
+
+
+def test_in_flight_delta_is_not_counted_twice():
+    ws = FakeWorksheet({(2, 2): 10})
+    wb = make_buffer()
+    wb.add("가방", ws, 2, 2, 5)
+    seen = {}
+
+    def refresh_during_write():
+        # 쓰기가 이미 반영된 스냅샷을 같은 순간에 받았다고 치고 덧씌워 본다
+        rows = [["", ""], ["갈레온", "15"]]
+        wb.apply_to("가방", rows, since=0)
+        seen["value"] = rows[1][1]
+
+    ws.on_update = refresh_during_write
+    wb.flush()
+    assert seen["value"] == "15"
+
+
+def test_pending_rows_keep_failed_appends():
+    ws = FakeWorksheet()
+    wb = make_buffer()
+    wb.append("참여기록", ws, ["확인", "1", "alice", "t"])
+    ws.fail_next = [SheetsUnavailable("open")]
+    wb.flush()
+    assert wb.pending_rows("참여기록") == [["확인", "1", "alice", "t"]]
+    wb.flush()
+    # 붙은 뒤에도 잠시 동안은 최근 행으로 남는다 (오래된 스냅샷 보정)
+    assert wb.pending_rows("참여기록") == [["확인", "1", "alice", "t"]]
+    assert wb.pending_count("참여기록") == 0
+
+
+def test_append_callback_gets_row_number():
+    ws = FakeWorksheet()
+    wb = make_buffer()
+    got = []
+    wb.append("제한", ws, ["a"], on_row=got.append)
+    wb.append("제한", ws, ["b"], on_row=got.append)
+    wb.flush()
+    assert got == [2, 3]
+    assert ws.calls == ["append_rows"]
+
+
+def test_appended_row_parses_updated_range():
+    assert _appended_row({"updates": {"updatedRange": "'제한'!A12:F12"}}) == 12
+    assert _appended_row({}) is None